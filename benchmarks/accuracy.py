@@ -0,0 +1,339 @@
+"""Compares the accuracy and speed of the processor and annotator backends.
+
+Each backend runs over a synthetic pdf corpus with known ground truth tokens.
+Processor configurations are scored by matching their tokens to the ground
+truth on text and bbox overlap (precision, recall, mean IoU of the matches).
+Annotators are scored on where their renderer puts the text ink relative to the
+ground truth bboxes. Throughput (pages/s) and peak python heap are measured for
+all of them, the fastest processor meeting the accuracy bar is reported and
+results are compared against a stored baseline.
+
+    python -m benchmarks.accuracy [--quick] [--min_precision 0.99]
+    python -m benchmarks.accuracy [--quick] --update_baseline
+"""
+
+import json
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from collections.abc import Callable
+from dataclasses import replace
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import click
+import fitz
+import numpy as np
+from loguru import logger as log
+
+from benchmarks.run import compare
+from texttokenizer.annotator import Annotator, FitzAnnotator, PDFiumAnnotator
+from texttokenizer.document import Document
+from texttokenizer.layout import LayoutEngine
+from texttokenizer.merge import get_merger
+from texttokenizer.processor import FitzProcessor, Processor
+from texttokenizer.synthetic import FONTS, CorpusSpec, generate_corpus
+from texttokenizer.token import Token
+
+BASELINE = Path(__file__).with_name("accuracy.json")
+
+# Image only pages are left out, their ground truth needs OCR.
+SPECS = {
+    "plain": CorpusSpec(pages=8, spans_per_page=60),
+    "dense": CorpusSpec(pages=4, spans_per_page=200, seed=1),
+    "rotated": CorpusSpec(
+        pages=8, spans_per_page=60, fonts=tuple(FONTS), rotated_ratio=0.2, seed=2
+    ),
+}
+
+# Processor, merge_bboxes.
+PROCESSORS: dict[str, Callable[[], tuple[Processor, bool]]] = {
+    "fitz": lambda: (FitzProcessor(), False),
+    "fitz_merge_heuristic": lambda: (FitzProcessor(), True),
+    "fitz_merge_lines": lambda: (FitzProcessor(merger=get_merger("lines")), True),
+    "fitz_layout": lambda: (FitzProcessor(layout=LayoutEngine()), False),
+    "fitz_layout_merge": lambda: (FitzProcessor(layout=LayoutEngine()), True),
+}
+
+ANNOTATORS: dict[str, type[Annotator]] = {
+    "annotate_fitz": FitzAnnotator,
+    "annotate_pdfium": PDFiumAnnotator,
+}
+
+ACCURACY = ("precision", "recall", "mean_iou")
+
+IOU_THRESHOLD = 0.5
+# Rendered pixels darker than this are text ink.
+INK_LEVEL = 128
+
+
+def iou(a: tuple, b: tuple) -> float:
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    overlap = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - overlap
+    return overlap / union if union > 0 else 0.0
+
+
+def match_tokens(
+    tokens: list[Token], truth: list[Token], threshold: float = IOU_THRESHOLD
+) -> dict:
+    """Matches tokens to ground truth tokens with the same text and page.
+
+    Each ground truth token matches at most one token, the unmatched one with
+    the highest bbox IoU if it is at least the threshold. Returns the counts of
+    tokens, ground truth tokens and matches and the sum of the matched IoUs.
+    """
+    candidates = defaultdict(list)
+    for token in truth:
+        candidates[token.page, token.text].append(token)
+    matched, iou_sum = 0, 0.0
+    for token in tokens:
+        options = candidates.get((token.page, token.text.strip()))
+        if not options:
+            continue
+        best = max(range(len(options)), key=lambda i: iou(token.bbox, options[i].bbox))
+        score = iou(token.bbox, options[best].bbox)
+        if score >= threshold:
+            options.pop(best)
+            matched += 1
+            iou_sum += score
+    return {
+        "tokens": len(tokens),
+        "truth": len(truth),
+        "matched": matched,
+        "iou_sum": iou_sum,
+    }
+
+
+def ink_scores(img: np.ndarray, boxes: list[tuple], scale: float) -> dict:
+    """Scores the text ink of a rendered page against ground truth bboxes.
+
+    Returns the number of bboxes with ink, the ink pixels inside any bbox, all
+    ink pixels and the sum of the IoUs of the ink bbox within each bbox.
+    """
+    ink = img < INK_LEVEL
+    covered = np.zeros_like(ink)
+    found, iou_sum = 0, 0.0
+    height, width = ink.shape
+    for box in boxes:
+        x0, y0, x1, y1 = (round(v * scale) for v in box)
+        # A pixel of slack for antialiasing at the bbox edges.
+        x0, y0 = max(x0 - 1, 0), max(y0 - 1, 0)
+        x1, y1 = min(x1 + 1, width), min(y1 + 1, height)
+        covered[y0:y1, x0:x1] = True
+        ys, xs = np.nonzero(ink[y0:y1, x0:x1])
+        if not len(xs):
+            continue
+        found += 1
+        ink_box = (x0 + xs.min(), y0 + ys.min(), x0 + xs.max() + 1, y0 + ys.max() + 1)
+        iou_sum += iou(ink_box, tuple(v * scale for v in box))
+    return {
+        "truth": len(boxes),
+        "found": found,
+        "ink_inside": int(np.count_nonzero(ink & covered)),
+        "ink": int(np.count_nonzero(ink)),
+        "iou_sum": iou_sum,
+    }
+
+
+def timed(fn: Callable, repeat: int) -> tuple[float, int]:
+    """Returns the best time of repeat runs and the peak heap of a traced run."""
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        seconds = min(seconds, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def run_processor(name: str, corpus: dict, repeat: int) -> dict:
+    counts = defaultdict(float)
+    seconds, peak, pages = 0.0, 0, 0
+    for filename, truth in corpus.values():
+        processor, merge = PROCESSORS[name]()
+
+        def tokenize():
+            document = Document(filename=filename, pages=None, pdf_doc=None)
+            processor.tokenize(document, merge_bboxes=merge)
+            return document
+
+        run_seconds, run_peak = timed(tokenize, repeat)
+        seconds, peak = seconds + run_seconds, max(peak, run_peak)
+        document = tokenize()
+        pages += len(document.page_indices)
+        for key, value in match_tokens(document.tokens, truth).items():
+            counts[key] += value
+    return {
+        "precision": counts["matched"] / max(counts["tokens"], 1),
+        "recall": counts["matched"] / max(counts["truth"], 1),
+        "mean_iou": counts["iou_sum"] / max(counts["matched"], 1),
+        "pages_per_second": pages / seconds,
+        "peak_bytes": peak,
+    }
+
+
+def run_annotator(name: str, corpus: dict, directory: Path, repeat: int) -> dict:
+    font = directory.joinpath("font.cff")
+    font.write_bytes(fitz.Font("helv").buffer)
+    counts = defaultdict(float)
+    seconds, peak, pages = 0.0, 0, 0
+    for doc_name, (filename, truth) in corpus.items():
+        fonts_dir = directory.joinpath(f"{name}-{doc_name}-fonts")
+        document = Document(filename=filename, pages=None, pdf_doc=None)
+        FitzProcessor().tokenize(document, fonts_dir=fonts_dir)
+        annotator = ANNOTATORS[name](
+            annotate_bbox=True,
+            annotate_text=True,
+            annotate_token=True,
+            annotator_font=font,
+            fonts_dir=fonts_dir,
+            default_font=None,
+            annotate_profile="review",
+        )
+        run_seconds, run_peak = timed(lambda: annotator.annotate(document), repeat)
+        seconds, peak = seconds + run_seconds, max(peak, run_peak)
+        pages += len(document.page_indices)
+
+        boxes = defaultdict(list)
+        for token in truth:
+            boxes[token.page].append(token.bbox)
+        for idx, img in annotator.render_pages(filename, document.page_indices):
+            gray = np.asarray(img.convert("L"))
+            for key, value in ink_scores(gray, boxes[idx], annotator.scale).items():
+                counts[key] += value
+    return {
+        "precision": counts["ink_inside"] / max(counts["ink"], 1),
+        "recall": counts["found"] / max(counts["truth"], 1),
+        "mean_iou": counts["iou_sum"] / max(counts["found"], 1),
+        "pages_per_second": pages / seconds,
+        "peak_bytes": peak,
+    }
+
+
+def accuracy_regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    """Returns a description of each accuracy metric down by more than tolerance."""
+    regressions = []
+    for case, metrics in results.items():
+        for metric in ACCURACY:
+            expected = baseline.get(case, {}).get(metric)
+            if expected is not None and metrics[metric] < expected - tolerance:
+                regressions.append(
+                    f"{case} {metric}: {metrics[metric]:.4f} vs baseline "
+                    f"{expected:.4f}"
+                )
+    return regressions
+
+
+def fastest(results: dict, min_precision: float, min_recall: float) -> str | None:
+    """Returns the fastest processor meeting the accuracy bar, if any."""
+    passing = [
+        name
+        for name in PROCESSORS
+        if name in results
+        and results[name]["precision"] >= min_precision
+        and results[name]["recall"] >= min_recall
+    ]
+    return max(passing, key=lambda n: results[n]["pages_per_second"], default=None)
+
+
+def run_backends(backends: list[str], quick: bool, repeat: int) -> dict:
+    specs = SPECS
+    if quick:
+        specs = {k: replace(s, pages=max(1, s.pages // 4)) for k, s in specs.items()}
+    results = {}
+    with TemporaryDirectory() as tempdir:
+        directory = Path(tempdir)
+        corpus = generate_corpus(directory.joinpath("corpus"), specs)
+        for name in backends:
+            if name in PROCESSORS:
+                metrics = run_processor(name, corpus, repeat)
+            else:
+                metrics = run_annotator(name, corpus, directory, repeat)
+            results[name] = metrics
+            click.echo(
+                f"{name:22} precision {metrics['precision']:.4f} "
+                f"recall {metrics['recall']:.4f} iou {metrics['mean_iou']:.3f} "
+                f"{metrics['pages_per_second']:9.1f} pages/s "
+                f"{metrics['peak_bytes'] / 2**20:7.1f} MiB peak"
+            )
+    return results
+
+
+@click.command()
+@click.option(
+    "--backend",
+    "backends",
+    multiple=True,
+    type=click.Choice([*PROCESSORS, *ANNOTATORS]),
+    help="backends to run (default all).",
+)
+@click.option("--quick", is_flag=True, help="use a smaller corpus.")
+@click.option("--repeat", default=3, help="timed runs per backend, the best is kept.")
+@click.option("--min_precision", default=0.99, help="accuracy bar for processors.")
+@click.option("--min_recall", default=0.99, help="accuracy bar for processors.")
+@click.option("--baseline", default=str(BASELINE), help="baseline results file.")
+@click.option("--tolerance", default=0.25, help="allowed relative speed regression.")
+@click.option(
+    "--accuracy_tolerance", default=0.005, help="allowed absolute accuracy drop."
+)
+@click.option("--update_baseline", is_flag=True, help="store results as baseline.")
+@click.option("--output", help="write results as json to this file.")
+def main(
+    backends,
+    quick,
+    repeat,
+    min_precision,
+    min_recall,
+    baseline,
+    tolerance,
+    accuracy_tolerance,
+    update_baseline,
+    output,
+):
+    log.disable("texttokenizer")
+    results = run_backends(list(backends or [*PROCESSORS, *ANNOTATORS]), quick, repeat)
+    best = fastest(results, min_precision, min_recall)
+    click.echo(
+        f"fastest processor with precision >= {min_precision} and recall >= "
+        f"{min_recall}: {best or 'none'}"
+    )
+    if output:
+        Path(output).write_text(json.dumps(results, indent=2))
+    # Quick and full runs use different corpus sizes and are stored separately.
+    mode = "quick" if quick else "full"
+    baseline = Path(baseline)
+    stored = json.loads(baseline.read_text()) if baseline.exists() else {}
+    if update_baseline:
+        stored[mode] = stored.get(mode, {}) | results
+        baseline.write_text(json.dumps(stored, indent=2) + "\n")
+        click.echo(f"updated {mode} baseline {baseline}")
+        return
+    if mode not in stored:
+        click.echo(f"no {mode} baseline in {baseline} to compare against")
+        return
+    # Accuracy metrics are compared separately, higher is better.
+    speed = {
+        case: {k: v for k, v in metrics.items() if k not in ACCURACY}
+        for case, metrics in results.items()
+    }
+    regressions = compare(speed, stored[mode], tolerance) + accuracy_regressions(
+        results, stored[mode], accuracy_tolerance
+    )
+    for regression in regressions:
+        click.echo(f"REGRESSION {regression}", err=True)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Load tests the texttokenizer server with concurrent clients.
+
+Sends a synthetic pdf from a number of concurrent clients and reports the
+throughput, latency percentiles and rejected requests. A server is started in
+process unless --url or --socket points to a running one.
+
+    python -m benchmarks.load --concurrency 8 --requests 64
+    python -m benchmarks.load --url http://127.0.0.1:8765
+"""
+
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import click
+from loguru import logger as log
+
+from texttokenizer.client import Client, ServerBusy
+from texttokenizer.server import ServerOptions, make_server
+from texttokenizer.synthetic import CorpusSpec, generate_pdf
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run_load(client: Client, data: bytes, concurrency: int, requests: int) -> dict:
+    latencies, rejected, failed = [], 0, 0
+
+    def send(_):
+        start = time.perf_counter()
+        try:
+            pages = list(client.tokenize(data, preprocess="none"))
+        except ServerBusy:
+            return "rejected", 0.0
+        except Exception as e:
+            log.warning(f"request failed: {e}")
+            return "failed", 0.0
+        return len(pages), time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, range(requests)))
+    seconds = time.perf_counter() - start
+    for outcome, latency in results:
+        if outcome == "rejected":
+            rejected += 1
+        elif outcome == "failed":
+            failed += 1
+        else:
+            latencies.append(latency)
+    return {
+        "requests": requests,
+        "ok": len(latencies),
+        "rejected": rejected,
+        "failed": failed,
+        "seconds": seconds,
+        "requests_per_second": len(latencies) / seconds,
+        "latency_p50": statistics.median(latencies) if latencies else 0.0,
+        "latency_p95": percentile(latencies, 0.95) if latencies else 0.0,
+    }
+
+
+@click.command()
+@click.option("--url", help="url of a running server.")
+@click.option("--socket", help="unix socket of a running server.")
+@click.option("--workers", default=2, help="workers of the in process server.")
+@click.option("--max_queue", default=8, help="queue of the in process server.")
+@click.option("--concurrency", default=8, help="number of concurrent clients.")
+@click.option("--requests", default=32, help="total number of requests.")
+@click.option("--pages", default=5, help="pages of the synthetic document.")
+@click.option("--retries", default=3, help="client retries when the queue is full.")
+def main(url, socket, workers, max_queue, concurrency, requests, pages, retries):
+    log.disable("texttokenizer")
+    with TemporaryDirectory() as tempdir:
+        directory = Path(tempdir)
+        filename = directory.joinpath("load.pdf")
+        generate_pdf(filename, CorpusSpec(pages=pages))
+        data = filename.read_bytes()
+
+        server = None
+        if url is None and socket is None:
+            options = ServerOptions(
+                socket=directory.joinpath("server.sock"),
+                workers=workers,
+                max_queue=max_queue,
+            )
+            server = make_server(options)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            socket = options.socket
+        client = Client(
+            url=url or "http://127.0.0.1:8765", socket=socket, retries=retries
+        )
+        try:
+            results = run_load(client, data, concurrency, requests)
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+                server.service.shutdown()
+
+    click.echo(
+        f"{results['ok']}/{results['requests']} ok, {results['rejected']} rejected, "
+        f"{results['failed']} failed in {results['seconds']:.2f}s"
+    )
+    click.echo(
+        f"{results['requests_per_second']:.1f} requests/s, "
+        f"p50 {results['latency_p50'] * 1000:.0f}ms, "
+        f"p95 {results['latency_p95'] * 1000:.0f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""Benchmarks the tokenizer phases over a generated synthetic pdf corpus.
+
+Measures throughput (pages/s, tokens/s) and peak python heap memory for
+FitzProcessor.tokenize, the bbox merge strategies, the token writers and the
+annotator backends. Results are compared against a stored baseline and any
+regression beyond the tolerance fails the run.
+
+    python -m benchmarks.run [--quick]
+    python -m benchmarks.run [--quick] --update_baseline
+"""
+
+import json
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import click
+import fitz
+from loguru import logger as log
+
+from texttokenizer.annotator import FitzAnnotator, PDFiumAnnotator
+from texttokenizer.document import Document
+from texttokenizer.layout import LayoutEngine
+from texttokenizer.merge import get_merger
+from texttokenizer.processor import FitzProcessor
+from texttokenizer.sink import open_sink
+from texttokenizer.synthetic import FONTS, CorpusSpec, generate_corpus
+
+BASELINE = Path(__file__).with_name("baseline.json")
+
+SPECS = {
+    "dense": CorpusSpec(pages=20, spans_per_page=200),
+    "mixed": CorpusSpec(
+        pages=20,
+        spans_per_page=80,
+        fonts=tuple(FONTS),
+        rotated_ratio=0.1,
+        image_pages_ratio=0.2,
+        seed=1,
+    ),
+    "annotate": CorpusSpec(pages=3, spans_per_page=80, seed=2),
+}
+
+# Metrics where higher is better, anything else is lower is better.
+THROUGHPUT = ("pages_per_second", "tokens_per_second")
+
+
+@dataclass(kw_only=True)
+class Context:
+    directory: Path
+    corpus: dict
+    font: Path
+    token_lists: dict = field(default_factory=dict)
+
+    def document(self, name: str, **kwargs) -> Document:
+        filename, _ = self.corpus[name]
+        return Document(filename=filename, pages=None, pdf_doc=None, **kwargs)
+
+    def tokens(self, name: str) -> list:
+        """Returns the tokens of a corpus document, tokenized once up front."""
+        if name not in self.token_lists:
+            document = self.document(name)
+            FitzProcessor().tokenize(document)
+            self.token_lists[name] = document.tokens
+        return self.token_lists[name]
+
+
+def bench_tokenize(name: str, merge: bool = False, layout: bool = False) -> Callable:
+    def run(ctx: Context):
+        document = ctx.document(name)
+        processor = FitzProcessor(layout=LayoutEngine() if layout else None)
+        processor.tokenize(document, merge_bboxes=merge)
+        return len(document.page_indices), len(document.tokens)
+
+    return run
+
+
+def bench_merge(strategy: str) -> Callable:
+    def run(ctx: Context):
+        tokens = ctx.tokens("dense")
+        merger = get_merger(strategy)
+        pages = sorted({t.page for t in tokens})
+        # Merging runs per page in the processor.
+        for page in pages:
+            merger([t for t in tokens if t.page == page])
+        return len(pages), len(tokens)
+
+    return run
+
+
+def bench_write(token_format: str) -> Callable:
+    def run(ctx: Context):
+        tokens = ctx.tokens("dense")
+        pages = sorted({t.page for t in tokens})
+        with open_sink(token_format, ctx.directory.joinpath("tokens.out")) as sink:
+            sink.write(tokens)
+        return len(pages), len(tokens)
+
+    return run
+
+
+def bench_annotate(annotatorCls: type) -> Callable:
+    def run(ctx: Context):
+        fonts_dir = ctx.directory.joinpath("fonts")
+        document = ctx.document("annotate")
+        FitzProcessor().tokenize(document, fonts_dir=fonts_dir)
+        annotator = annotatorCls(
+            annotate_bbox=True,
+            annotate_text=True,
+            annotate_token=True,
+            annotator_font=ctx.font,
+            fonts_dir=fonts_dir,
+            default_font=None,
+        )
+        annotator.annotate(document)
+        return len(document.page_indices), len(document.tokens)
+
+    return run
+
+
+CASES: dict[str, Callable] = {
+    "tokenize_dense": bench_tokenize("dense"),
+    "tokenize_mixed": bench_tokenize("mixed"),
+    # Reading order tokens, flattened spans re-merged vs the fitz line structure.
+    "tokenize_merge_dense": bench_tokenize("dense", merge=True),
+    "tokenize_layout_dense": bench_tokenize("dense", layout=True),
+    "tokenize_layout_merge_dense": bench_tokenize("dense", merge=True, layout=True),
+    "merge_heuristic": bench_merge("heuristic"),
+    "merge_lines": bench_merge("lines"),
+    "write_templatizer": bench_write("templatizer"),
+    "write_csv": bench_write("csv"),
+    "annotate_fitz": bench_annotate(FitzAnnotator),
+    "annotate_pdfium": bench_annotate(PDFiumAnnotator),
+}
+
+
+def measure(fn: Callable, ctx: Context, repeat: int) -> dict:
+    """Returns the best of repeat runs and the peak heap of a separate traced run."""
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pages, tokens = fn(ctx)
+        seconds = min(seconds, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn(ctx)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "seconds": seconds,
+        "pages_per_second": pages / seconds,
+        "tokens_per_second": tokens / seconds,
+        "peak_bytes": peak,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Returns a description of each metric regressed beyond the tolerance."""
+    regressions = []
+    for case, metrics in results.items():
+        for metric, expected in baseline.get(case, {}).items():
+            actual = metrics.get(metric)
+            if actual is None or metric == "seconds" or not expected:
+                continue
+            if metric in THROUGHPUT:
+                regressed = actual < expected * (1 - tolerance)
+            else:
+                regressed = actual > expected * (1 + tolerance)
+            if regressed:
+                change = (actual - expected) / expected
+                regressions.append(
+                    f"{case} {metric}: {actual:.4g} vs baseline {expected:.4g} "
+                    f"({change:+.1%})"
+                )
+    return regressions
+
+
+def run_cases(cases: list[str], quick: bool, repeat: int) -> dict:
+    specs = SPECS
+    if quick:
+        specs = {k: replace(s, pages=max(1, s.pages // 4)) for k, s in specs.items()}
+    results = {}
+    with TemporaryDirectory() as tempdir:
+        directory = Path(tempdir)
+        font = directory.joinpath("font.cff")
+        font.write_bytes(fitz.Font("helv").buffer)
+        ctx = Context(
+            directory=directory,
+            corpus=generate_corpus(directory.joinpath("corpus"), specs),
+            font=font,
+        )
+        ctx.tokens("dense")
+        for case in cases:
+            results[case] = measure(CASES[case], ctx, repeat)
+            metrics = results[case]
+            click.echo(
+                f"{case:20} {metrics['pages_per_second']:10.1f} pages/s "
+                f"{metrics['tokens_per_second']:12.1f} tokens/s "
+                f"{metrics['peak_bytes'] / 2**20:8.1f} MiB peak"
+            )
+    return results
+
+
+@click.command()
+@click.option("--case", "cases", multiple=True, help="cases to run (default all).")
+@click.option("--quick", is_flag=True, help="use a smaller corpus.")
+@click.option("--repeat", default=3, help="timed runs per case, the best is kept.")
+@click.option("--baseline", default=str(BASELINE), help="baseline results file.")
+@click.option("--tolerance", default=0.25, help="allowed relative regression.")
+@click.option("--update_baseline", is_flag=True, help="store results as baseline.")
+@click.option("--output", help="write results as json to this file.")
+def main(cases, quick, repeat, baseline, tolerance, update_baseline, output):
+    log.disable("texttokenizer")
+    results = run_cases(list(cases or CASES), quick, repeat)
+    if output:
+        Path(output).write_text(json.dumps(results, indent=2))
+    # Quick and full runs use different corpus sizes and are stored separately.
+    mode = "quick" if quick else "full"
+    baseline = Path(baseline)
+    stored = json.loads(baseline.read_text()) if baseline.exists() else {}
+    if update_baseline:
+        stored[mode] = stored.get(mode, {}) | results
+        baseline.write_text(json.dumps(stored, indent=2) + "\n")
+        click.echo(f"updated {mode} baseline {baseline}")
+        return
+    if mode not in stored:
+        click.echo(f"no {mode} baseline in {baseline} to compare against")
+        return
+    regressions = compare(results, stored[mode], tolerance)
+    for regression in regressions:
+        click.echo(f"REGRESSION {regression}", err=True)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
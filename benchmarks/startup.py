@@ -0,0 +1,78 @@
+"""Benchmarks the startup time of the package and the cli.
+
+Each command runs in a fresh interpreter, the best of --repeat runs is compared
+against its budget and any command over budget fails the run. Also checks that
+the heavy backends are not imported on startup.
+
+    python -m benchmarks.startup [--import_budget 0.25] [--help_budget 0.35]
+"""
+
+import subprocess
+import sys
+import time
+
+import click
+
+# Backends that must only be imported when their phase runs.
+HEAVY_MODULES = ("fitz", "ocrmypdf", "pypdfium2", "PIL", "numpy")
+
+COMMANDS = {
+    "import": "import texttokenizer",
+    "help": (
+        "import sys\n"
+        "from texttokenizer import cli\n"
+        "sys.argv = ['texttokenizer', '--help']\n"
+        "try:\n"
+        "    cli()\n"
+        "except SystemExit:\n"
+        "    pass"
+    ),
+}
+
+
+def startup_seconds(code: str, repeat: int) -> float:
+    """Returns the best wall time of running code in a new interpreter."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", code], check=True, stdout=subprocess.DEVNULL
+        )
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def imported_modules(code: str) -> set[str]:
+    """Returns the heavy modules imported by running code."""
+    check = f"{code}\nimport sys\nprint(' '.join(sys.modules))"
+    output = subprocess.run(
+        [sys.executable, "-c", check], check=True, capture_output=True, text=True
+    ).stdout
+    return set(output.split()) & set(HEAVY_MODULES)
+
+
+@click.command()
+@click.option("--repeat", default=5, help="runs per command, the best is kept.")
+@click.option("--import_budget", default=0.25, help="seconds allowed for import.")
+@click.option("--help_budget", default=0.35, help="seconds allowed for --help.")
+def main(repeat, import_budget, help_budget):
+    budgets = {"import": import_budget, "help": help_budget}
+    failed = False
+    for name, code in COMMANDS.items():
+        seconds = startup_seconds(code, repeat)
+        over = seconds > budgets[name]
+        click.echo(
+            f"{name:8} {seconds * 1000:8.1f} ms (budget {budgets[name] * 1000:.0f} ms)"
+        )
+        if over:
+            click.echo(f"OVER BUDGET {name}", err=True)
+        heavy = imported_modules(code)
+        if heavy:
+            click.echo(f"{name} imports {', '.join(sorted(heavy))}", err=True)
+        failed = failed or over or bool(heavy)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import shutil
+
+import fitz
+import pytest
+
+from texttokenizer.pipeline import Options
+from texttokenizer.preprocessor import Preprocessor
+
+
+@pytest.fixture
+def make_pdf(tmp_path):
+    """Returns a function writing `{name}.pdf` with a line of text per page."""
+
+    def make(name: str, pages: int = 3):
+        path = tmp_path.joinpath(f"{name}.pdf")
+        doc = fitz.open()
+        for i in range(pages):
+            doc.new_page().insert_text((72, 72), f"{name} page {i}")
+        doc.save(path)
+        doc.close()
+        return path
+
+    return make
+
+
+@pytest.fixture
+def make_options(tmp_path):
+    """Returns a function building pipeline options with outputs under tmp_path."""
+
+    def make(filename, **kwargs):
+        args = {
+            "annotate": False,
+            "annotate_bbox": True,
+            "annotate_text": False,
+            "annotate_token": True,
+            "annotator": "fitz",
+            "annotator_font": tmp_path.joinpath("font.ttf"),
+            "preprocessor_use_pdfa": False,
+            "filename": filename,
+            "pages": None,
+            "merge_bboxes": False,
+            "token_format": "templatizer",
+            "tmproot": tmp_path.joinpath("tmp"),
+            "cache_dir": tmp_path.joinpath("cache"),
+        }
+        return Options(**(args | kwargs))
+
+    return make
+
+
+@pytest.fixture
+def optimize_calls(monkeypatch):
+    """Replaces ocrmypdf optimization with a copy, recording the sources."""
+    calls = []
+
+    def optimize(self, src, dest, format="pdfa"):
+        calls.append(src)
+        shutil.copyfile(src, dest)
+
+    monkeypatch.setattr(Preprocessor, "optimize", optimize)
+    return calls
@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+import pytest
+
+from texttokenizer.aio import AsyncPipeline
+from texttokenizer.document import Document
+from texttokenizer.processor import FitzProcessor
+
+
+async def collect(aiter):
+    return [item async for item in aiter]
+
+
+def test_tokenize_matches_processor(make_pdf, make_options):
+    path = make_pdf("a")
+    options = make_options(path, preprocessor_fast_path=True)
+
+    async def main():
+        async with AsyncPipeline(options, queue_size=1) as pipeline:
+            return await collect(pipeline.tokenize(path))
+
+    document = Document(filename=path, pages=None, pdf_doc=None)
+    FitzProcessor().tokenize(document)
+    assert asyncio.run(main()) == document.tokens
+
+
+def test_tokenize_stops_early(make_pdf, make_options):
+    path = make_pdf("a", pages=10)
+    options = make_options(path, preprocessor_fast_path=True)
+
+    async def main():
+        async with AsyncPipeline(options, queue_size=1) as pipeline:
+            async for token in pipeline.tokenize((path, path.read_bytes())):
+                return token
+
+    assert asyncio.run(main()).text == "a page 0"
+
+
+def test_run(tmp_path, make_pdf, make_options):
+    paths = [make_pdf(name) for name in "abcd"]
+    paths.append(tmp_path.joinpath("missing.pdf"))
+    options = make_options(None, preprocessor_fast_path=True)
+    concurrency = {"preprocess": 2, "tokenize": 2}
+
+    async def main():
+        async with AsyncPipeline(options, concurrency=concurrency) as pipeline:
+            return await collect(pipeline.run(paths))
+
+    results = {r.filename.name: r for r in asyncio.run(main())}
+    assert len(results) == 5
+    assert not results["missing.pdf"].ok
+    assert "FileNotFoundError" in results["missing.pdf"].error
+    for name in "abcd":
+        assert results[f"{name}.pdf"].ok
+        assert results[f"{name}.pdf"].pages == 3
+        tokens = json.loads(tmp_path.joinpath(f"{name}-tokens.json").read_text())
+        assert tokens["token_0"][0]["text"] == f"{name} page 0"
+
+
+def test_unknown_stage(make_options):
+    with pytest.raises(ValueError):
+        AsyncPipeline(make_options(None), concurrency={"ocr": 2})
@@ -0,0 +1,177 @@
+import json
+
+import fitz
+import pytest
+from PIL import Image, ImageChops
+
+from texttokenizer.annotator import (
+    FitzAnnotator,
+    FontCache,
+    PDFiumAnnotator,
+    font_cache,
+    tile_boxes,
+    tokens_by_page,
+)
+from texttokenizer.document import Document
+from texttokenizer.pipeline import make_annotator
+from texttokenizer.processor import FitzProcessor
+from texttokenizer.synthetic import CorpusSpec, generate_pdf
+from texttokenizer.token import Token
+
+
+@pytest.fixture
+def font_path(tmp_path):
+    path = tmp_path.joinpath("font.cff")
+    path.write_bytes(fitz.Font("helv").buffer)
+    return path
+
+
+def test_font_cache(font_path):
+    cache = FontCache(maxsize=2)
+    font = cache.get(font_path, 10)
+    assert cache.get(str(font_path), 10) is font
+    assert cache.get(font_path, 12) is not font
+    assert cache.stats() == {"hits": 1, "misses": 2, "size": 2, "hit_rate": 1 / 3}
+
+
+def test_font_cache_evicts_least_recently_used(font_path):
+    cache = FontCache(maxsize=2)
+    font = cache.get(font_path, 10)
+    cache.get(font_path, 12)
+    cache.get(font_path, 10)
+    cache.get(font_path, 14)
+    assert list(cache.fonts) == [(str(font_path), 10), (str(font_path), 14)]
+    assert cache.get(font_path, 10) is font
+    cache.clear()
+    assert cache.stats()["size"] == 0
+
+
+def test_tokens_by_page():
+    tokens = [
+        Token(page=p, text=t, font=("", 0), origin=(0, 0), bbox=(0, 0, 1, 1))
+        for p, t in [(0, "a"), (2, "b"), (0, "c")]
+    ]
+    pages = tokens_by_page(tokens)
+    assert {idx: [t.text for t in ts] for idx, ts in pages.items()} == {
+        0: ["a", "c"],
+        2: ["b"],
+    }
+
+
+@pytest.mark.parametrize("annotatorCls", [FitzAnnotator, PDFiumAnnotator])
+def test_annotate_parallel_matches_serial(annotatorCls, font_path, tmp_path):
+    images, lookups = {}, {}
+    for workers in (1, 2):
+        directory = tmp_path.joinpath(str(workers))
+        directory.mkdir()
+        filename = directory.joinpath("doc.pdf")
+        generate_pdf(filename, CorpusSpec(pages=3, spans_per_page=20))
+        document = Document(filename=filename, pages=None, pdf_doc=None)
+        fonts_dir = directory.joinpath("fonts")
+        FitzProcessor().tokenize(document, fonts_dir=fonts_dir)
+        annotator = annotatorCls(
+            annotate_bbox=True,
+            annotate_text=True,
+            annotate_token=True,
+            annotator_font=font_path,
+            fonts_dir=fonts_dir,
+            default_font=None,
+            annotate_workers=workers,
+        )
+        font_cache.clear()
+        annotator.annotate(document)
+        # Font lookups of the workers are counted in the parent.
+        lookups[workers] = font_cache.hits + font_cache.misses
+        images[workers] = [
+            Image.open(directory.joinpath(f"doc-annotated-{i}.png")) for i in range(3)
+        ]
+    for serial, parallel in zip(images[1], images[2]):
+        assert ImageChops.difference(serial, parallel).getbbox() is None
+    assert lookups[1] == lookups[2] > 0
+
+
+@pytest.mark.parametrize("annotatorCls", [FitzAnnotator, PDFiumAnnotator])
+def test_annotate_buffer_matches_file(annotatorCls, font_path, tmp_path):
+    filename = tmp_path.joinpath("doc.pdf")
+    generate_pdf(filename, CorpusSpec(pages=2, spans_per_page=20))
+    annotator = annotatorCls(
+        annotate_bbox=True,
+        annotate_text=False,
+        annotate_token=True,
+        annotator_font=font_path,
+        fonts_dir=tmp_path.joinpath("fonts"),
+        default_font=None,
+    )
+    images = []
+    for document in (
+        Document(filename=filename, pages=None, pdf_doc=None),
+        Document.from_buffer(filename.read_bytes(), filename=filename),
+    ):
+        FitzProcessor().tokenize(document)
+        annotator.annotate(document)
+        images.append(Image.open(tmp_path.joinpath("doc-annotated-1.png")).copy())
+    assert ImageChops.difference(*images).getbbox() is None
+
+
+def test_profiles(font_path, tmp_path):
+    args = {
+        "annotate_bbox": True,
+        "annotate_text": False,
+        "annotate_token": True,
+        "annotator_font": font_path,
+        "fonts_dir": tmp_path,
+        "default_font": None,
+    }
+    assert FitzAnnotator(**args).dpi == 300
+    annotator = FitzAnnotator(annotate_profile="thumbnail", **args)
+    assert annotator.scale == 0.5
+    assert annotator.default_font.size == 6
+    assert FitzAnnotator(annotate_profile="review", annotate_dpi=96, **args).dpi == 96
+    with pytest.raises(ValueError):
+        FitzAnnotator(annotate_profile="poster", **args)
+
+
+def test_make_annotator_profile(font_path, tmp_path, make_pdf, make_options):
+    filename = make_pdf("doc", pages=1)
+    options = make_options(
+        filename, annotator_font=font_path, annotate_profile="thumbnail"
+    )
+    annotator = make_annotator(options, tmp_path.joinpath("fonts"))
+    assert annotator.dpi == 36 and annotator.scale == 0.5
+    document = Document(filename=filename, pages=None, pdf_doc=None)
+    FitzProcessor().tokenize(document)
+    annotator.annotate(document)
+    rect = document.pdf_doc[0].rect
+    with Image.open(tmp_path.joinpath("doc-annotated-0.png")) as img:
+        assert img.size == (round(rect.width / 2), round(rect.height / 2))
+
+
+def test_annotate_tiled_matches_full_page(font_path, tmp_path):
+    filename = tmp_path.joinpath("doc.pdf")
+    generate_pdf(filename, CorpusSpec(pages=1, spans_per_page=20))
+    document = Document(filename=filename, pages=None, pdf_doc=None)
+    FitzProcessor().tokenize(document)
+    args = {
+        "annotate_bbox": True,
+        "annotate_text": False,
+        "annotate_token": True,
+        "annotator_font": font_path,
+        "fonts_dir": tmp_path.joinpath("fonts"),
+        "default_font": None,
+        "annotate_profile": "review",
+    }
+    FitzAnnotator(**args).annotate(document)
+    FitzAnnotator(annotate_tile_size=400, **args).annotate(document)
+
+    full = Image.open(tmp_path.joinpath("doc-annotated-0.png"))
+    directory = tmp_path.joinpath("doc-annotated-0")
+    manifest = json.loads(directory.joinpath("tiles.json").read_text())
+    assert (manifest["width"], manifest["height"]) == full.size
+    assert manifest["levels"] == 4
+    assert Image.open(directory.joinpath("3", "0_0.png")).size == (155, 220)
+    tiled = Image.new("RGB", full.size, "white")
+    for row, col, box in tile_boxes(*full.size, 400):
+        with Image.open(directory.joinpath("0", f"{row}_{col}.png")) as tile:
+            assert tile.size == (box[2] - box[0], box[3] - box[1])
+            tiled.paste(tile, box[:2])
+    assert ImageChops.difference(tiled, full.convert("RGB")).getbbox() is None
@@ -0,0 +1,139 @@
+import os
+import shutil
+import signal
+import time
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from texttokenizer import cli
+from texttokenizer.batch import (
+    BatchOptions,
+    DocumentResult,
+    expand_inputs,
+    is_generated,
+    run_batch,
+    summarize,
+)
+from texttokenizer.preprocessor import Preprocessor
+from texttokenizer.scheduler import OcrScheduler
+
+
+def test_is_generated():
+    assert is_generated(Path("/root/test-preprocessed.pdf"))
+    assert not is_generated(Path("/root/test.pdf"))
+
+
+def test_expand_inputs(tmp_path):
+    for name in ["a.pdf", "b.pdf", "b-preprocessed.pdf", "sub/c.pdf", "d.txt"]:
+        path = tmp_path.joinpath(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+    a, b, c = (tmp_path / "a.pdf", tmp_path / "b.pdf", tmp_path / "sub/c.pdf")
+    assert expand_inputs([str(tmp_path)]) == [a, b, c]
+    assert expand_inputs([str(tmp_path / "*.pdf")]) == [a, b]
+    assert expand_inputs([str(c), str(tmp_path / "*.pdf")]) == [c, a, b]
+
+    manifest = tmp_path.joinpath("manifest.txt")
+    manifest.write_text("# corpus\nsub/c.pdf\n\na.pdf\n")
+    assert expand_inputs([], manifest) == [c, a]
+    assert expand_inputs([str(a)], manifest) == [a, c]
+
+
+def test_summarize():
+    results = [
+        DocumentResult(filename=Path("a.pdf"), ok=True, pages=4, tokens=100),
+        DocumentResult(filename=Path("b.pdf"), ok=True, attempts=2, pages=6),
+        DocumentResult(filename=Path("c.pdf"), ok=False, attempts=2, error="boom"),
+    ]
+    summary = summarize(results, 2.0)
+    assert summary["documents"] == 3
+    assert summary["succeeded"] == 2
+    assert summary["failed"] == 1
+    assert summary["retried"] == 2
+    assert summary["pages"] == 10
+    assert summary["tokens"] == 100
+    assert summary["pages_per_second"] == 5.0
+    assert summary["failures"] == {"c.pdf": "boom"}
+
+
+def test_workers_required(tmp_path):
+    with pytest.raises(ValueError):
+        BatchOptions(workers=0, timeout=None, retries=0)
+    result = CliRunner().invoke(cli, ["--workers", "0", str(tmp_path / "a.pdf")])
+    assert result.exit_code == 2
+    assert "--workers" in result.output
+
+
+def test_run_batch_small_first(make_pdf, make_options, optimize_calls):
+    paths = [
+        make_pdf(name, pages)
+        for name, pages in [("large", 4), ("small", 1), ("medium", 2)]
+    ]
+    options = [make_options(path, no_cache=True) for path in paths]
+    batch = BatchOptions(workers=1, timeout=None, retries=0)
+    scheduler = OcrScheduler(2)
+    results = run_batch(options, batch, scheduler)
+    assert [r.filename.name for r in results] == [
+        "small.pdf",
+        "medium.pdf",
+        "large.pdf",
+    ]
+    assert [r.pages for r in results] == [1, 2, 4]
+    assert summarize(results, 1.0, scheduler.metrics())["ocr"]["budget"] == 2
+
+
+@pytest.fixture
+def faulty_optimize(monkeypatch, tmp_path):
+    """Makes optimization crash, hang or fail once depending on the filename."""
+
+    def optimize(self, src, dest, format="pdfa"):
+        name = Path(src).stem
+        if name.startswith("crash"):
+            os._exit(1)
+        if name.startswith("hang"):
+            # Sleeps through any signal based timeout, like native code would.
+            signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGALRM])
+            time.sleep(60)
+        marker = tmp_path.joinpath(f"{name}.failed")
+        if name.startswith("flaky") and not marker.exists():
+            marker.touch()
+            raise RuntimeError("flaky")
+        shutil.copyfile(src, dest)
+
+    monkeypatch.setattr(Preprocessor, "optimize", optimize)
+
+
+def run(make_pdf, make_options, names, **kwargs):
+    options = [make_options(make_pdf(name, 1), no_cache=True) for name in names]
+    batch = BatchOptions(**({"workers": 1, "timeout": None, "retries": 0} | kwargs))
+    return {r.filename.stem: r for r in run_batch(options, batch)}
+
+
+def test_run_batch_crash_isolation(make_pdf, make_options, faulty_optimize):
+    results = run(make_pdf, make_options, ["ok1", "crash", "ok2"], workers=3)
+    assert not results["crash"].ok
+    assert results["crash"].error == "worker crashed"
+    for name in ("ok1", "ok2"):
+        assert results[name].ok and results[name].attempts == 1
+
+
+def test_run_batch_timeout(make_pdf, make_options, faulty_optimize):
+    start = time.perf_counter()
+    results = run(
+        make_pdf, make_options, ["hang", "ok1", "ok2"], workers=2, timeout=2.0
+    )
+    assert time.perf_counter() - start < 30
+    assert not results["hang"].ok
+    assert "TimeoutError" in results["hang"].error
+    for name in ("ok1", "ok2"):
+        assert results[name].ok and results[name].attempts == 1
+
+
+def test_run_batch_retries(make_pdf, make_options, faulty_optimize):
+    results = run(make_pdf, make_options, ["flaky1"], retries=1)
+    assert results["flaky1"].ok and results["flaky1"].attempts == 2
+    results = run(make_pdf, make_options, ["flaky2"])
+    assert not results["flaky2"].ok
+    assert results["flaky2"].error == "RuntimeError: flaky"
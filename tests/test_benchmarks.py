@@ -0,0 +1,73 @@
+import numpy as np
+
+import texttokenizer
+from benchmarks.accuracy import fastest, ink_scores, match_tokens
+from benchmarks.run import compare
+from benchmarks.startup import COMMANDS, imported_modules
+from texttokenizer.token import Token
+
+
+def test_compare():
+    baseline = {"merge": {"seconds": 1.0, "tokens_per_second": 100, "peak_bytes": 100}}
+    ok = {"merge": {"seconds": 2.0, "tokens_per_second": 90, "peak_bytes": 110}}
+    assert compare(ok, baseline, 0.2) == []
+    slow = {"merge": {"seconds": 2.0, "tokens_per_second": 70, "peak_bytes": 100}}
+    assert compare(slow, baseline, 0.2) == [
+        "merge tokens_per_second: 70 vs baseline 100 (-30.0%)"
+    ]
+    large = {"merge": {"seconds": 1.0, "tokens_per_second": 100, "peak_bytes": 150}}
+    assert len(compare(large, baseline, 0.2)) == 1
+    assert compare({"other": {"peak_bytes": 1}}, baseline, 0.2) == []
+
+
+def test_startup_imports_no_backends():
+    for code in COMMANDS.values():
+        assert imported_modules(code) == set()
+
+
+def test_lazy_attrs():
+    from texttokenizer import FitzProcessor, suffix_path
+    from texttokenizer.processor import FitzProcessor as processor_cls
+
+    assert FitzProcessor is processor_cls
+    assert callable(suffix_path)
+    for name in texttokenizer.LAZY_ATTRS:
+        assert getattr(texttokenizer, name) is not None
+
+
+def test_match_tokens():
+    def token(text, x0, page=0):
+        return Token(
+            page=page,
+            text=text,
+            font=("f", 10),
+            origin=(x0, 10),
+            bbox=(x0, 0, x0 + 10, 10),
+        )
+
+    truth = [token("a", 0), token("a", 20), token("b", 40)]
+    tokens = [token("a ", 21), token("a", 0), token("b", 60), token("c", 0)]
+    counts = match_tokens(tokens, truth)
+    assert counts["tokens"] == 4 and counts["truth"] == 3 and counts["matched"] == 2
+    assert abs(counts["iou_sum"] - (1 + 9 / 11)) < 1e-9
+    assert match_tokens([token("a", 0, page=1)], truth)["matched"] == 0
+
+
+def test_ink_scores():
+    img = np.full((20, 40), 255, dtype=np.uint8)
+    img[2:8, 2:8] = 0
+    img[15:18, 35:38] = 0
+    scores = ink_scores(img, [(1, 1, 4, 4), (10, 1, 15, 4)], scale=2)
+    assert scores["truth"] == 2 and scores["found"] == 1
+    assert scores["ink_inside"] == 36 and scores["ink"] == 45
+    assert scores["iou_sum"] == 1
+
+
+def test_fastest():
+    results = {
+        "fitz": {"precision": 1.0, "recall": 1.0, "pages_per_second": 10},
+        "fitz_layout": {"precision": 1.0, "recall": 0.9, "pages_per_second": 20},
+    }
+    assert fastest(results, 0.99, 0.99) == "fitz"
+    assert fastest(results, 0.99, 0.8) == "fitz_layout"
+    assert fastest(results, 1.1, 0.8) is None
@@ -0,0 +1,72 @@
+import hashlib
+import os
+
+from texttokenizer import cache as cache_module
+from texttokenizer.cache import Cache, file_digest, open_cache
+
+
+def test_cache_key(tmp_path):
+    src = tmp_path.joinpath("a.pdf")
+    src.write_bytes(b"foo")
+    digest = file_digest(src)
+    assert Cache.key(digest, format="pdf") == Cache.key(digest, format="pdf")
+    assert Cache.key(digest, format="pdf") != Cache.key(digest, format="pdfa")
+    src.write_bytes(b"bar")
+    assert file_digest(src) != digest
+
+
+def test_cache_fetch_put(tmp_path):
+    cache = Cache(tmp_path.joinpath("cache"), 2**20)
+    src, dest = tmp_path.joinpath("src"), tmp_path.joinpath("dest")
+    src.write_bytes(b"data")
+    assert not cache.fetch("key", "file", dest)
+    cache.put("key", "file", src, {"count": 1})
+    assert cache.fetch("key", "file", dest)
+    assert dest.read_bytes() == b"data"
+    assert cache.fetch_meta("key") == {"count": 1}
+    assert cache.fetch_meta("missing") == {}
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = Cache(tmp_path.joinpath("cache"), 250)
+    src = tmp_path.joinpath("src")
+    src.write_bytes(b"x" * 100)
+    cache.put("a", "file", src)
+    cache.put("b", "file", src)
+    os.utime(cache.entry("a"), (1, 1))
+    os.utime(cache.entry("b"), (2, 2))
+    assert cache.fetch("a", "file", tmp_path.joinpath("dest"))
+    cache.put("c", "file", src)
+    assert not cache.entry("b").exists()
+    assert cache.entry("a").exists()
+    assert cache.entry("c").exists()
+    assert cache.size() <= 250
+
+
+def test_cache_scans_only_when_needed(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, "EVICT_PUTS", 4)
+    cache = open_cache(tmp_path.joinpath("cache"), 1000)
+    assert open_cache(tmp_path.joinpath("cache"), 1000) is cache
+    scans = []
+    evict = Cache.evict
+    monkeypatch.setattr(Cache, "evict", lambda self: scans.append(1) or evict(self))
+    src = tmp_path.joinpath("src")
+    src.write_bytes(b"x" * 100)
+    for key in range(5):
+        cache.put(str(key), "file", src)
+    # The first put scans the cache, then every EVICT_PUTS puts.
+    assert len(scans) == 2
+    assert cache.estimated_bytes == cache.size() == 500
+    for key in range(5, 11):
+        cache.put(str(key), "file", src)
+    # Exceeding max_bytes scans and evicts down to EVICT_TARGET.
+    assert len(scans) == 4
+    assert cache.size() <= 900
+
+
+def test_file_digest(tmp_path):
+    src = tmp_path.joinpath("a.pdf")
+    src.write_bytes(b"")
+    assert file_digest(src) == hashlib.sha256(b"").hexdigest()
+    src.write_bytes(b"foo" * 1000)
+    assert file_digest(src) == hashlib.sha256(b"foo" * 1000).hexdigest()
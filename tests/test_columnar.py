@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from texttokenizer.columnar import ColumnarTokenReader
+from texttokenizer.sink import open_sink
+from texttokenizer.token import Token
+
+TOKENS = [
+    Token(page=0, text="foo", font=("Arial-0", 10.0), origin=(1, 2), bbox=(1, 0, 3, 2)),
+    Token(page=0, text="bär", font=("Times-1", 8.5), origin=(4, 2), bbox=(4, 0, 6, 2)),
+    Token(page=2, text="foo", font=("Arial-0", 12.0), origin=(4, 5), bbox=(4, 3, 6, 5)),
+]
+
+
+def write(tmp_path, tokens):
+    filename = tmp_path.joinpath("tokens.ttok")
+    with open_sink("columnar", filename) as sink:
+        sink.write(tokens)
+    return filename
+
+
+def test_columnar_roundtrip(tmp_path):
+    reader = ColumnarTokenReader(write(tmp_path, TOKENS))
+    assert len(reader) == 3
+    assert reader.tokens() == TOKENS
+    assert reader.tokens(page=2) == TOKENS[2:]
+    assert reader.tokens(page=1) == []
+    assert reader.fonts == ["Arial-0", "Times-1"]
+
+
+def test_columnar_page_columns(tmp_path):
+    reader = ColumnarTokenReader(write(tmp_path, TOKENS))
+    columns = reader.page_columns(0)
+    assert columns["font_id"].tolist() == [0, 1]
+    assert columns["bbox"].dtype == np.float64
+    assert columns["bbox"].tolist() == [[1, 0, 3, 2], [4, 0, 6, 2]]
+    assert [reader.text(i) for i in columns["text_id"]] == ["foo", "bär"]
+    # Columns are views of the mapped file, not copies.
+    assert not columns["bbox"].flags.owndata
+
+
+def test_columnar_empty(tmp_path):
+    reader = ColumnarTokenReader(write(tmp_path, []))
+    assert len(reader) == 0
+    assert reader.tokens() == []
+
+
+def test_columnar_invalid(tmp_path):
+    filename = tmp_path.joinpath("tokens.ttok")
+    filename.write_bytes(b"not a token file at all")
+    with pytest.raises(ValueError):
+        ColumnarTokenReader(filename)
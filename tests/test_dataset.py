@@ -0,0 +1,64 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from texttokenizer.dataset import DatasetReader, DatasetWriter, dataset_writer
+from texttokenizer.token import Token
+
+
+def make_tokens(doc, pages=3, per_page=4):
+    return [
+        Token(
+            page=page,
+            text=f"{doc} {page} {i}",
+            font=("Helvetica", 10.5),
+            origin=(10.0 * i, 20.25 * page),
+            bbox=(10.0 * i, 20.25 * page - 8, 10.0 * i + 9, 20.25 * page + 2),
+        )
+        for page in range(pages)
+        for i in range(per_page)
+    ]
+
+
+def add_documents(directory, docs):
+    writer = dataset_writer(directory, 2**20)
+    for doc in docs:
+        writer.add(doc, make_tokens(doc))
+
+
+def test_round_trip(tmp_path):
+    with DatasetWriter(tmp_path, shard_bytes=4096) as writer:
+        entries = [writer.add(f"doc{i}", make_tokens(f"doc{i}")) for i in range(10)]
+        writer.add("empty", [])
+    assert len({e.shard for e in entries}) > 1
+    assert all(e.offset % 64 == 0 for e in entries)
+    assert entries[0].pages == [0, 2]
+
+    reader = DatasetReader(tmp_path)
+    assert len(reader) == 11
+    assert "doc7" in reader
+    assert reader.tokens("doc7") == make_tokens("doc7")
+    assert reader.tokens("doc3", page=1) == make_tokens("doc3")[4:8]
+    assert reader.document("doc9").pages == {0: (0, 4), 1: (4, 8), 2: (8, 12)}
+    assert reader.tokens("empty") == []
+
+
+def test_truncated_shard(tmp_path):
+    with DatasetWriter(tmp_path) as writer:
+        writer.add("a", make_tokens("a"))
+        entry = writer.add("b", make_tokens("b"))
+    shard = tmp_path.joinpath(entry.shard)
+    shard.write_bytes(shard.read_bytes()[: entry.offset + 10])
+    with open(next(tmp_path.glob("*.index.jsonl")), "a") as f:
+        f.write('{"id": "c", "sha')
+    reader = DatasetReader(tmp_path)
+    assert list(reader) == ["a"]
+    assert reader.tokens("a") == make_tokens("a")
+
+
+def test_concurrent_writers(tmp_path):
+    batches = [[f"w{w}-{i}" for i in range(5)] for w in range(4)]
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        list(executor.map(add_documents, [tmp_path] * 4, batches))
+    reader = DatasetReader(tmp_path)
+    assert sorted(reader) == sorted(doc for batch in batches for doc in batch)
+    for doc in reader:
+        assert reader.tokens(doc) == make_tokens(doc)
@@ -0,0 +1,56 @@
+import fitz
+import pytest
+
+from texttokenizer.document import Document
+from texttokenizer.fontstore import FontStore, read_font_index
+from texttokenizer.processor import FitzProcessor
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    path = tmp_path.joinpath("fonts.pdf")
+    buffer = fitz.Font("tiro").buffer
+    doc = fitz.open()
+    for i in range(4):
+        page = doc.new_page()
+        page.insert_font(fontname="F0", fontbuffer=buffer)
+        page.insert_text((72, 72), f"page {i}", fontname="F0")
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def test_font_store_dedupes(tmp_path):
+    store = FontStore(tmp_path.joinpath("store"))
+    first = store.add(b"font", "ttf")
+    assert first.read_bytes() == b"font"
+    assert store.add(b"font", "ttf") == first
+    assert store.add(b"other", "ttf") != first
+    assert len(list(store.root.iterdir())) == 2
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_extract_fonts_once(pdf_path, tmp_path, workers):
+    store = FontStore(tmp_path.joinpath("store"))
+    for name in ("a", "b"):
+        fonts_dir = tmp_path.joinpath(name)
+        document = Document(filename=pdf_path, pages=None, pdf_doc=None)
+        FitzProcessor(font_store=store).tokenize(
+            document, fonts_dir=fonts_dir, workers=workers
+        )
+        assert sorted(read_font_index(fonts_dir)) == [0, 1, 2, 3]
+    assert len(list(store.root.iterdir())) == 1
+
+
+def test_extract_page_fonts(pdf_path, tmp_path):
+    store = FontStore(tmp_path.joinpath("store"))
+    processor = FitzProcessor()
+    extracted = {}
+    with fitz.open(pdf_path) as doc:
+        xref = doc.get_page_fonts(0)[0][0]
+        assert processor.extract_page_fonts(doc, 0, set(), store, extracted) == {}
+        name, filename = extracted[xref]
+        for idx in range(1, 4):
+            fonts = processor.extract_page_fonts(doc, idx, {name}, store, extracted)
+            assert fonts == {name: filename}
+    assert list(store.root.iterdir()) == [filename]
@@ -0,0 +1,105 @@
+import fitz
+import pytest
+
+from texttokenizer.document import Document
+from texttokenizer.incremental import (
+    iter_tokens_incremental,
+    options_digest,
+    page_digest,
+    read_manifest,
+)
+from texttokenizer.processor import FitzProcessor
+
+
+def write_pdf(path, texts):
+    with fitz.open() as doc:
+        for text in texts:
+            page = doc.new_page()
+            page.insert_text((72, 72), text)
+            page.insert_text((72, 144), f"{text} again", fontname="cour")
+        doc.save(path)
+
+
+class CountingProcessor(FitzProcessor):
+    def __init__(self):
+        super().__init__()
+        self.pages = []
+
+    def tokenize_page(self, idx, page, merge):
+        self.pages.append(idx)
+        return super().tokenize_page(idx, page, merge)
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return tmp_path.joinpath("doc.pdf"), {
+        "store": tmp_path.joinpath("tokens.ttok"),
+        "manifest_file": tmp_path.joinpath("manifest.json"),
+    }
+
+
+def run(filename, paths, pages=None, options=options_digest()):
+    processor = CountingProcessor()
+    document = Document(filename=filename, pages=pages, pdf_doc=None)
+    tokens = [
+        t
+        for _, page in iter_tokens_incremental(
+            processor, document, options=options, **paths
+        )
+        for t in page
+    ]
+    return processor.pages, tokens, document
+
+
+def test_page_digest(tmp_path):
+    filename = tmp_path.joinpath("doc.pdf")
+    write_pdf(filename, ["one", "two", "one"])
+    with fitz.open(filename) as doc:
+        digests = [page_digest(doc, idx, {}) for idx in range(3)]
+    assert digests[0] == digests[2] != digests[1]
+
+
+def test_incremental_reuses_unchanged_pages(paths):
+    filename, store = paths
+    write_pdf(filename, ["one", "two", "three"])
+    tokenized, first, _ = run(filename, store)
+    assert tokenized == [0, 1, 2]
+
+    tokenized, again, document = run(filename, store)
+    assert tokenized == []
+    assert again == first
+    assert document.token_count == len(first)
+
+    write_pdf(filename, ["one", "changed", "three"])
+    tokenized, changed, _ = run(filename, store)
+    assert tokenized == [1]
+    fresh = FitzProcessor()
+    document = Document(filename=filename, pages=None, pdf_doc=None)
+    fresh.tokenize(document)
+    assert changed == document.tokens
+
+
+def test_incremental_options_and_pages(paths):
+    filename, store = paths
+    write_pdf(filename, ["one", "two", "three"])
+    run(filename, store, pages="0,1")
+    tokenized, tokens, _ = run(filename, store, pages="1,2")
+    assert tokenized == [2]
+    assert {t.page for t in tokens} == {1, 2}
+    # Pages not requested are kept for later runs.
+    assert sorted(read_manifest(store["manifest_file"]).pages) == [0, 1, 2]
+
+    tokenized, _, _ = run(filename, store, options=options_digest(merge_bboxes=True))
+    assert tokenized == [0, 1, 2]
+
+
+def test_incremental_shrunk_document(paths):
+    filename, store = paths
+    write_pdf(filename, ["one", "two", "three"])
+    run(filename, store)
+    write_pdf(filename, ["one"])
+    tokenized, tokens, _ = run(filename, store, pages="0")
+    assert tokenized == []
+    assert {t.page for t in tokens} == {0}
+    # Pages the document no longer has are dropped from the manifest.
+    assert sorted(read_manifest(store["manifest_file"]).pages) == [0]
@@ -0,0 +1,73 @@
+import json
+
+from texttokenizer.instrument import Profiler
+
+
+def test_disabled_profiler():
+    profiler = Profiler()
+    with profiler.stage("get_text"):
+        pass
+    assert profiler.stats == {}
+
+
+def test_stage_stats():
+    profiler = Profiler()
+    profiler.enable(tracemalloc=True)
+    for _ in range(2):
+        with profiler.stage("convert"):
+            data = [0] * 100000
+    del data
+    stats = profiler.stats["convert"]
+    assert stats.calls == 2
+    assert stats.wall_seconds > 0
+    assert stats.process_peak_rss_bytes > 0
+    assert stats.peak_traced_bytes >= 800000
+
+
+def test_nested_stage_peaks():
+    profiler = Profiler()
+    profiler.enable(tracemalloc=True)
+    with profiler.stage("render"):
+        data = [0] * 1000000
+        del data
+        with profiler.stage("draw"):
+            small = [0] * 10000
+            del small
+    stats = profiler.stats
+    # The peak before the nested stage is kept for the outer stage.
+    assert stats["render"].peak_traced_bytes >= 8000000
+    assert stats["draw"].peak_traced_bytes < 8000000
+
+
+def test_collect_merge():
+    worker, parent = Profiler(), Profiler()
+    worker.enable()
+    parent.enable()
+    with worker.stage("merge"):
+        pass
+    with parent.stage("merge"):
+        pass
+    parent.merge(worker.collect())
+    assert worker.stats == {}
+    assert parent.stats["merge"].calls == 2
+
+
+def test_write(tmp_path):
+    profiler = Profiler()
+    profiler.enable(cprofile=True)
+    with profiler.stage("render"):
+        sum(range(1000))
+    report = tmp_path.joinpath("profile.json")
+    profiler.write(report)
+    data = json.loads(report.read_text())
+    assert data["stages"]["render"]["calls"] == 1
+    assert tmp_path.joinpath("profile-render.prof").exists()
+
+    report = tmp_path.joinpath("profile.prom")
+    profiler.write(report, format="prometheus")
+    lines = report.read_text().splitlines()
+    assert "# TYPE texttokenizer_stage_calls_total counter" in lines
+    assert any(
+        line.startswith('texttokenizer_stage_calls_total{stage="render"')
+        for line in lines
+    )
@@ -0,0 +1,129 @@
+import os
+
+import pytest
+
+from texttokenizer import journal as journal_module
+from texttokenizer.batch import BatchOptions, run_batch
+from texttokenizer.journal import PREPROCESS, TOKENIZE, Journal, JournalState
+from texttokenizer.pipeline import process_document
+from texttokenizer.util import suffix_path
+
+
+@pytest.fixture
+def pdf_paths(make_pdf):
+    return [make_pdf("a", pages=1), make_pdf("b", pages=1)]
+
+
+def test_batched_sync(tmp_path):
+    filename = tmp_path.joinpath("run.journal")
+    journal = Journal(filename, sync_records=3, sync_seconds=60)
+    journal.failed(tmp_path.joinpath("a.pdf"), "boom")
+    journal.failed(tmp_path.joinpath("b.pdf"), "boom")
+    assert filename.read_text() == ""
+    journal.failed(tmp_path.joinpath("c.pdf"), "boom")
+    assert len(filename.read_text().splitlines()) == 3
+    journal.failed(tmp_path.joinpath("d.pdf"), "boom")
+    journal.close()
+    # A record cut short by a crash is skipped.
+    with open(filename, "a") as f:
+        f.write('{"event": "fail')
+    state = JournalState.load(filename)
+    assert len(state.documents) == 4
+    assert state.documents[str(tmp_path.joinpath("d.pdf"))].error == "boom"
+
+
+def test_is_done(tmp_path, pdf_paths):
+    path = pdf_paths[0]
+    journal = Journal(tmp_path.joinpath("run.journal"))
+    journal.begin(path, "digest")
+    assert not journal.state.is_done(path)
+    journal.done(path, pages=1, tokens=1, seconds=1.0)
+    assert journal.state.is_done(path)
+    # A touched input is hashed again.
+    os.utime(path, ns=(0, 0))
+    assert not journal.state.is_done(path)
+    journal.begin(path, journal_module.file_digest(path))
+    journal.done(path, pages=1, tokens=1, seconds=1.0)
+    os.utime(path, ns=(10**9, 10**9))
+    assert journal.state.is_done(path)
+    path.write_bytes(b"changed")
+    assert not journal.state.is_done(path)
+
+
+def test_resume(tmp_path, pdf_paths, make_options, optimize_calls, monkeypatch):
+    filename = tmp_path.joinpath("run.journal")
+    done, interrupted = pdf_paths
+    options = make_options(done, no_cache=True, journal=filename)
+    process_document(options)
+    journal = journal_module.open_journal(filename)
+    journal.done(done, pages=1, tokens=1, seconds=1.0)
+    # The second document is interrupted after preprocessing.
+    digest = journal_module.file_digest(interrupted)
+    preprocessed = suffix_path(interrupted, "preprocessed")
+    preprocessed.write_bytes(interrupted.read_bytes())
+    tempdir = tmp_path.joinpath("tmp", "b-1234")
+    tempdir.joinpath("fonts").mkdir(parents=True)
+    journal.begin(interrupted, digest)
+    journal.temp(interrupted, tempdir)
+    journal.temp(interrupted, preprocessed)
+    journal.stage(interrupted, digest, PREPROCESS, preprocessed)
+    journal.temp(interrupted, suffix_path(preprocessed, "tokens", ext=".json"))
+    journal.close()
+
+    journal = Journal(filename)
+    monkeypatch.setitem(journal_module._journals, filename, journal)
+    assert journal.resume(pdf_paths) == [interrupted]
+    assert not tempdir.exists()
+    assert preprocessed.exists()
+    optimize_calls.clear()
+    process_document(make_options(interrupted, no_cache=True, journal=filename))
+    assert optimize_calls == []
+    assert journal.state.progress()["done"] == 1
+
+
+def test_remove_temps(tmp_path, pdf_paths):
+    path = pdf_paths[0]
+    journal = Journal(tmp_path.joinpath("run.journal"))
+    tempdir = tmp_path.joinpath("tmp", "a-1234")
+    tempdir.joinpath("fonts").mkdir(parents=True)
+    preprocessed = suffix_path(path, "preprocessed")
+    preprocessed.write_bytes(path.read_bytes())
+    tokens = suffix_path(preprocessed, "tokens", ext=".json")
+    tokens.write_text("{}")
+    journal.begin(path, "digest")
+    journal.temp(path, tempdir)
+    journal.temp(path, preprocessed)
+    journal.stage(path, "digest", PREPROCESS, preprocessed)
+    journal.temp(path, tokens)
+    journal.stage(path, "digest", TOKENIZE, tokens)
+    journal.remove_temps(path)
+    assert not tempdir.exists()
+    assert not preprocessed.exists()
+    assert tokens.exists()
+
+
+def test_run_batch_resume(tmp_path, pdf_paths, make_options, optimize_calls):
+    filename = tmp_path.joinpath("run.journal")
+    options = [
+        make_options(path, no_cache=True, journal=filename) for path in pdf_paths
+    ]
+    batch = BatchOptions(workers=2, timeout=None, retries=0)
+    journal = journal_module.open_journal(filename)
+    assert journal.resume(pdf_paths) == pdf_paths
+    assert len(run_batch(options, batch, journal=journal)) == 2
+    progress = journal.state.progress()
+    assert progress["done"] == progress["documents"] == 2
+    assert progress["eta_seconds"] == 0
+
+    state = JournalState.load(filename)
+    assert all(state.is_done(path) for path in pdf_paths)
+    assert all(
+        doc.stages.keys() == {"preprocess", "tokenize"}
+        for doc in state.documents.values()
+    )
+    assert Journal(filename).resume(pdf_paths) == []
+    # Only the token outputs of finished documents are kept.
+    for path in pdf_paths:
+        preprocessed = suffix_path(path, "preprocessed")
+        assert not preprocessed.exists()
+        assert suffix_path(preprocessed, "tokens", ext=".json").exists()
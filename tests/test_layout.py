@@ -0,0 +1,71 @@
+import fitz
+import pytest
+
+from texttokenizer.layout import LayoutEngine
+from texttokenizer.processor import FitzProcessor
+from texttokenizer.token import Token
+
+WORDS = "alpha beta gamma delta epsilon zeta eta theta iota kappa".split()
+
+
+@pytest.fixture
+def doc():
+    doc = fitz.open()
+    # A title, two columns of two paragraphs each and a footer.
+    page = doc.new_page()
+    page.insert_text((72, 60), "Title", fontsize=16)
+    for col, x in enumerate((72, 320)):
+        for para, y in enumerate((100, 250)):
+            lines = [f"c{col}p{para}l{line} {WORDS[line]}" for line in range(4)]
+            page.insert_textbox(fitz.Rect(x, y, x + 200, y + 120), "\n".join(lines))
+    page.insert_text((72, 800), "Footer", fontsize=8)
+    # A table of separately drawn cells.
+    page = doc.new_page()
+    for row in range(5):
+        for col, x in enumerate((72, 200, 330)):
+            page.insert_text((x, 100 + row * 20), f"r{row}c{col}")
+    yield doc
+    doc.close()
+
+
+def texts(tokens):
+    return [token.text.split()[0] for token in tokens]
+
+
+def test_columns_reading_order(doc):
+    tokens, _ = FitzProcessor(layout=LayoutEngine()).tokenize_page(0, doc[0], False)
+    expected = [
+        f"c{col}p{para}l{line}"
+        for para in range(2)
+        for col in range(2)
+        for line in range(4)
+    ]
+    assert texts(tokens) == ["Title", *expected, "Footer"]
+
+
+def test_table_rows(doc):
+    tokens, _ = FitzProcessor(layout=LayoutEngine()).tokenize_page(1, doc[1], True)
+    assert texts(tokens) == [f"r{row}c{col}" for row in range(5) for col in range(3)]
+
+
+def test_same_tokens_as_default(doc):
+    for idx in range(2):
+        default, _ = FitzProcessor().tokenize_page(idx, doc[idx], False)
+        layout, _ = FitzProcessor(layout=LayoutEngine()).tokenize_page(
+            idx, doc[idx], False
+        )
+        assert sorted(layout, key=repr) == sorted(default, key=repr)
+
+
+def test_merge_line():
+    def token(text, x0, font="f"):
+        return Token(
+            page=0, text=text, font=font, origin=(x0, 10), bbox=(x0, 0, x0 + 10, 10)
+        )
+
+    merged = LayoutEngine(gap_tolerance=1).merge_line(
+        [token("a", 0), token("b", 10.5), token("c", 30), token("d", 40, font="g")]
+    )
+    assert [t.text for t in merged] == ["a b", "c", "d"]
+    assert merged[0].bbox == (0, 0, 20.5, 10)
+    assert LayoutEngine().merge_line([]) == []
@@ -0,0 +1,71 @@
+import pytest
+
+from texttokenizer.merge import LineMerger, get_merger
+from texttokenizer.token import Token
+from texttokenizer.util import merge_bboxes
+
+FONT = ("Arial-0", 10.0)
+
+
+def make_token(text, x0, x1, baseline=10.0, page=0, font=FONT):
+    return Token(
+        page=page,
+        text=text,
+        font=font,
+        origin=(x0, baseline),
+        bbox=(x0, baseline - 8.0, x1, baseline + 2.0),
+    )
+
+
+def test_get_merger():
+    assert get_merger("heuristic") is merge_bboxes
+    merger = get_merger("lines", baseline_tolerance=1.0, gap_tolerance=2.0)
+    assert merger == LineMerger(baseline_tolerance=1.0, gap_tolerance=2.0)
+    with pytest.raises(KeyError):
+        get_merger("unknown")
+
+
+def test_line_merger_empty():
+    assert LineMerger()([]) == []
+    assert merge_bboxes([]) == []
+
+
+def test_line_merger_matches_heuristic_on_exact_runs():
+    tokens = [
+        make_token("world", 20.0, 30.0),
+        make_token("hello", 10.0, 20.0),
+        make_token("next", 10.0, 20.0, baseline=30.0),
+    ]
+    assert LineMerger(baseline_tolerance=0, gap_tolerance=0)(tokens) == [
+        make_token("hello world", 10.0, 30.0),
+        make_token("next", 10.0, 20.0, baseline=30.0),
+    ]
+    assert merge_bboxes(tokens) == [
+        make_token("hello world", 10.0, 30.0),
+        make_token("next", 10.0, 20.0, baseline=30.0),
+    ]
+
+
+def test_line_merger_tolerances():
+    tokens = [
+        make_token("a", 0.0, 10.0),
+        make_token("b", 10.3, 20.0, baseline=10.2),
+        make_token("c", 20.2, 30.0),
+        make_token("d", 40.0, 50.0),
+    ]
+    merged = LineMerger(baseline_tolerance=0.5, gap_tolerance=0.5)(tokens)
+    assert [t.text for t in merged] == ["a b c", "d"]
+    assert merged[0].bbox == (0.0, 2.0, 30.0, 12.2)
+    assert merged[0].origin == (0.0, 10.0)
+    assert len(LineMerger(baseline_tolerance=0, gap_tolerance=0)(tokens)) == 4
+
+
+def test_line_merger_keeps_fonts_and_pages_apart():
+    tokens = [
+        make_token("a", 0.0, 10.0),
+        make_token("b", 10.0, 20.0, font=("Arial-16", 10.0)),
+        make_token("c", 20.0, 30.0, page=1),
+        make_token("d", 30.0, 40.0, page=1),
+    ]
+    merged = LineMerger()(tokens)
+    assert [(t.page, t.text) for t in merged] == [(0, "a"), (0, "b"), (1, "c d")]
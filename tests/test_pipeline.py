@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from texttokenizer.dataset import DatasetReader
+from texttokenizer.pipeline import process_document
+from texttokenizer.spatial import SpatialIndex
+
+PAGES = ["sample page 0", "sample page 1", "sample page 2"]
+
+
+@pytest.fixture
+def pdf_path(make_pdf):
+    return make_pdf("sample")
+
+
+def test_process_document(pdf_path, tmp_path, make_options, optimize_calls):
+    doc = process_document(make_options(pdf_path, no_cache=True))
+    assert doc.token_count == 3
+    tokens = json.loads(
+        tmp_path.joinpath("sample-preprocessed-tokens.json").read_text()
+    )
+    assert [t[0]["text"] for t in tokens.values()] == PAGES
+
+
+def test_process_document_cached(pdf_path, tmp_path, make_options, optimize_calls):
+    output = tmp_path.joinpath("sample-preprocessed-tokens.json")
+    process_document(make_options(pdf_path))
+    expected = output.read_text()
+    output.unlink()
+
+    doc = process_document(make_options(pdf_path))
+    assert len(optimize_calls) == 1
+    assert doc.token_count == 3
+    assert output.read_text() == expected
+
+    doc = process_document(make_options(pdf_path, pages="1"))
+    assert len(optimize_calls) == 1
+    assert doc.token_count == 1
+
+
+def test_process_document_incremental(pdf_path, tmp_path, make_options, optimize_calls):
+    options = make_options(pdf_path, no_cache=True, incremental=True)
+    process_document(options)
+    doc = process_document(options)
+    assert doc.token_count == 3
+    tokens = json.loads(
+        tmp_path.joinpath("sample-preprocessed-tokens.json").read_text()
+    )
+    assert [t[0]["text"] for t in tokens.values()] == PAGES
+    assert tmp_path.joinpath("sample-preprocessed-tokens.manifest.json").exists()
+
+
+def test_process_document_spatial_index(
+    pdf_path, tmp_path, make_options, optimize_calls
+):
+    options = make_options(pdf_path, spatial_index=True)
+    process_document(options)
+    index_file = tmp_path.joinpath("sample-preprocessed-tokens.index.npz")
+    index = SpatialIndex.load(index_file)
+    assert index.count == 3
+    assert index.nearest(2, (72, 72)).tolist() == [2]
+    # The index is cached with the tokens.
+    index_file.unlink()
+    process_document(options)
+    assert index_file.exists()
+
+
+def test_process_document_dataset(pdf_path, tmp_path, make_options, optimize_calls):
+    dataset = tmp_path.joinpath("dataset")
+    options = make_options(pdf_path, dataset=dataset)
+    assert process_document(options).token_count == 3
+    assert not tmp_path.joinpath("sample-preprocessed-tokens.json").exists()
+    reader = DatasetReader(dataset)
+    assert list(reader) == [str(pdf_path)]
+    assert [t.text for t in reader.tokens(str(pdf_path))] == PAGES
+
+
+def test_process_document_cached_page_reports(pdf_path, make_options, optimize_calls):
+    options = make_options(pdf_path, preprocessor_fast_path=True)
+    reports = process_document(options).page_reports
+    assert [r.page for r in reports] == [0, 1, 2]
+    # Both the preprocessed output and the tokens are cache hits.
+    doc = process_document(make_options(pdf_path, preprocessor_fast_path=True))
+    assert doc.token_count == 3
+    assert doc.page_reports == reports
@@ -0,0 +1,105 @@
+from pathlib import Path
+
+import fitz
+import pytest
+
+from texttokenizer.preprocessor import (
+    DIRECT,
+    OCR,
+    PageReport,
+    Preprocessor,
+    TextLayerDetector,
+)
+
+TEXT = "born digital text layer with enough characters"
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    path = tmp_path.joinpath("sample.pdf")
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), TEXT)
+    scan = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 50, 50), False)
+    page = doc.new_page()
+    page.insert_image(page.rect, pixmap=scan)
+    doc.new_page().insert_text((72, 72), TEXT)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def make_report(**kwargs):
+    args = {
+        "page": 0,
+        "chars": 100,
+        "fonts": 1,
+        "text_coverage": 0.2,
+        "image_coverage": 0.0,
+        "invalid_chars": 0.0,
+    }
+    return PageReport(**(args | kwargs))
+
+
+def test_needs_ocr():
+    detector = TextLayerDetector()
+    assert not detector.needs_ocr(make_report())
+    assert not detector.needs_ocr(make_report(chars=0, text_coverage=0))
+    assert detector.needs_ocr(make_report(chars=5, image_coverage=0.1))
+    assert detector.needs_ocr(make_report(text_coverage=0.01, image_coverage=0.9))
+    assert detector.needs_ocr(make_report(invalid_chars=0.5))
+
+
+def test_inspect(pdf_path):
+    with fitz.open(pdf_path) as doc:
+        reports = TextLayerDetector().inspect(doc)
+    assert [r.path for r in reports] == [DIRECT, OCR, DIRECT]
+    assert reports[0].chars == len(TEXT)
+    assert reports[1].image_coverage == 1.0
+
+
+@pytest.fixture
+def optimized(monkeypatch):
+    """Replaces ocrmypdf with a copy, recording the page count of each call."""
+    optimized = []
+
+    def optimize(self, src, dest, format="pdfa"):
+        data = src.read_bytes() if isinstance(src, Path) else src.read()
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            optimized.append(len(doc))
+        if isinstance(dest, Path):
+            dest.write_bytes(data)
+        else:
+            dest.write(data)
+
+    monkeypatch.setattr(Preprocessor, "optimize", optimize)
+    return optimized
+
+
+def test_preprocess_splices_ocr_pages(pdf_path, tmp_path, optimized):
+    dest = tmp_path.joinpath("dest.pdf")
+    reports = Preprocessor().preprocess(pdf_path, dest)
+    assert [r.path for r in reports] == [DIRECT, OCR, DIRECT]
+    assert optimized == [1]
+    with fitz.open(dest) as doc:
+        assert len(doc) == 3
+        assert doc[0].get_text().strip() == TEXT
+        assert doc[1].get_images()
+        assert doc[2].get_text().strip() == TEXT
+
+
+def test_preprocess_buffer(pdf_path, optimized):
+    data, reports = Preprocessor().preprocess_buffer(pdf_path.read_bytes())
+    assert [r.path for r in reports] == [DIRECT, OCR, DIRECT]
+    assert optimized == [1]
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        assert len(doc) == 3
+        assert doc[2].get_text().strip() == TEXT
+
+
+def test_preprocess_buffer_without_ocr(tmp_path, optimized):
+    with fitz.open() as doc:
+        doc.new_page().insert_text((72, 72), TEXT)
+        data = doc.tobytes()
+    preprocessed, _ = Preprocessor().preprocess_buffer(memoryview(data))
+    assert preprocessed is data
+    assert optimized == []
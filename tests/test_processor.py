@@ -0,0 +1,57 @@
+import fitz
+import pytest
+
+from texttokenizer.document import Document
+from texttokenizer.processor import FitzProcessor
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    path = tmp_path.joinpath("sample.pdf")
+    doc = fitz.open()
+    for i in range(6):
+        page = doc.new_page()
+        for line in range(5):
+            page.insert_text((72, 72 + line * 20), f"page {i} line {line}")
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def tokenize(path, **kwargs):
+    document = Document(filename=path, pages=None, pdf_doc=None)
+    FitzProcessor().tokenize(document, **kwargs)
+    return document.tokens
+
+
+def test_tokenize(pdf_path):
+    tokens = tokenize(pdf_path)
+    assert len(tokens) == 30
+    assert tokens[0].page == 0
+    assert tokens[0].text == "page 0 line 0"
+    assert tokens[-1].text == "page 5 line 4"
+
+
+def test_tokenize_parallel_matches_serial(pdf_path):
+    assert tokenize(pdf_path, workers=3) == tokenize(pdf_path)
+    assert tokenize(pdf_path, workers=2, merge_bboxes=True) == tokenize(
+        pdf_path, merge_bboxes=True
+    )
+
+
+def test_iter_tokens(pdf_path):
+    document = Document(filename=pdf_path, pages="1,3", pdf_doc=None)
+    pages = list(FitzProcessor().iter_tokens(document))
+    assert [idx for idx, _ in pages] == [1, 3]
+    assert all(len(tokens) == 5 for _, tokens in pages)
+    assert document.token_count == 10
+    assert document.tokens == []
+
+
+def test_tokenize_buffer(pdf_path):
+    data = pdf_path.read_bytes()
+    for workers in (1, 3):
+        document = Document.from_buffer(memoryview(data), filename=pdf_path)
+        assert document.data is data
+        FitzProcessor().tokenize(document, workers=workers)
+        assert document.tokens == tokenize(pdf_path)
@@ -0,0 +1,98 @@
+import multiprocessing
+import threading
+import time
+
+import ocrmypdf
+
+from texttokenizer.preprocessor import Preprocessor
+from texttokenizer.scheduler import OcrScheduler
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_jobs():
+    scheduler = OcrScheduler(4)
+    with scheduler.reserve(2) as jobs:
+        assert jobs == 2
+    with scheduler.reserve(100) as jobs:
+        assert jobs == 4
+        assert scheduler.metrics()["running"] == 1
+    metrics = scheduler.metrics()
+    assert metrics["runs"] == 2
+    assert metrics["pages"] == 102
+    assert metrics["running"] == 0
+    assert metrics["queue_depth"] == 0
+
+
+def test_even_share():
+    scheduler = OcrScheduler(8)
+    with scheduler.reserve(2):
+        # Half of the budget with one run in flight, limited by the free cores.
+        assert scheduler.jobs(10) == 4
+        with scheduler.reserve(10) as jobs:
+            assert jobs == 4
+            assert scheduler.jobs(10) == 2
+
+
+def test_small_documents_first():
+    scheduler = OcrScheduler(1)
+    order = []
+
+    def run(pages):
+        with scheduler.reserve(pages):
+            order.append(pages)
+
+    with scheduler.reserve(1):
+        large = threading.Thread(target=run, args=(50,))
+        large.start()
+        wait_for(lambda: scheduler.metrics()["queue_depth"] == 1)
+        small = threading.Thread(target=run, args=(2,))
+        small.start()
+        wait_for(lambda: scheduler.metrics()["queue_depth"] == 2)
+    large.join()
+    small.join()
+    assert order == [2, 50]
+    metrics = scheduler.metrics()
+    assert metrics["max_queue_depth"] == 2
+    assert metrics["wait_seconds"] > 0
+
+
+def hold_reservation(scheduler, pages, release):
+    with scheduler.reserve(pages):
+        release.wait()
+
+
+def test_renew():
+    context = multiprocessing.get_context("fork")
+    scheduler = OcrScheduler(4, context=context)
+    with scheduler.reserve(1):
+        pass
+    release = context.Event()
+    worker = context.Process(target=hold_reservation, args=(scheduler, 2, release))
+    worker.start()
+    wait_for(lambda: scheduler.metrics()["running"] == 1)
+    scheduler.renew()
+    # The worker of the old pool releases into the old state.
+    release.set()
+    worker.join()
+    assert scheduler.free.value == 4
+    metrics = scheduler.metrics()
+    assert metrics["running"] == 0
+    assert metrics["runs"] == 1 and metrics["pages"] == 1
+
+
+def test_optimize_jobs(make_pdf, tmp_path, monkeypatch):
+    pdf_path = make_pdf("sample")
+    calls = []
+    monkeypatch.setattr(ocrmypdf, "ocr", lambda **kwargs: calls.append(kwargs))
+    scheduler = OcrScheduler(8)
+    Preprocessor(scheduler=scheduler).optimize(pdf_path, tmp_path / "out.pdf")
+    assert calls[0]["jobs"] == 3
+    assert scheduler.metrics()["pages"] == 3
+    Preprocessor().optimize(pdf_path, tmp_path / "out.pdf")
+    assert "jobs" not in calls[1]
@@ -0,0 +1,126 @@
+import json
+import threading
+import time
+
+import pytest
+
+from texttokenizer.client import Client, ServerBusy
+from texttokenizer.document import Document
+from texttokenizer.preprocessor import Preprocessor
+from texttokenizer.processor import FitzProcessor
+from texttokenizer.server import (
+    ServerOptions,
+    Service,
+    TokenizeRequest,
+    main,
+    make_server,
+    parse_request,
+)
+from texttokenizer.synthetic import CorpusSpec, generate_pdf
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("server")
+    options = ServerOptions(
+        socket=directory.joinpath("server.sock"),
+        workers=1,
+        max_queue=1,
+    )
+    server = make_server(options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    server.service.shutdown()
+
+
+@pytest.fixture
+def client(server):
+    return Client(socket=server.service.options.socket, retries=0)
+
+
+def test_tokenize(client, tmp_path):
+    filename = tmp_path.joinpath("doc.pdf")
+    generate_pdf(filename, CorpusSpec(pages=3, spans_per_page=10))
+    pages = list(client.tokenize(filename, pages="1-2", preprocess="none"))
+    document = Document(filename=filename, pages="1-2", pdf_doc=None)
+    FitzProcessor().tokenize(document)
+    assert [idx for idx, _ in pages] == [1, 2]
+    assert [t for _, tokens in pages for t in tokens] == document.tokens
+
+
+def test_health(client):
+    assert client.health() == {"workers": 1, "in_flight": 0, "capacity": 2}
+
+
+def test_queue_full(server, client):
+    service = server.service
+    assert service.admit() and service.admit()
+    try:
+        with pytest.raises(ServerBusy):
+            list(client.tokenize(b"%PDF", preprocess="none"))
+    finally:
+        service.release()
+        service.release()
+
+
+def test_invalid_request(client):
+    with pytest.raises(RuntimeError, match="400"):
+        list(client.tokenize(b"%PDF", preprocess="bogus"))
+    with pytest.raises(RuntimeError, match="500"):
+        list(client.tokenize(b"not a pdf", preprocess="none"))
+
+
+def test_parse_request():
+    request = parse_request("pages=1-3&merge_bboxes=1")
+    assert request.pages == "1-3"
+    assert request.merge_bboxes
+    assert request.preprocess == "fast"
+
+
+def wait_idle(service, timeout=5.0):
+    # Slots are released by future callbacks, just after the result is set.
+    deadline = time.monotonic() + timeout
+    while service.in_flight() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert service.in_flight() == 0
+
+
+def test_run_streams_pages(server, tmp_path):
+    filename = tmp_path.joinpath("doc.pdf")
+    generate_pdf(filename, CorpusSpec(pages=3, spans_per_page=10))
+    service = server.service
+    assert service.admit()
+    pages = service.run(filename.read_bytes(), TokenizeRequest(preprocess="none"))
+    assert json.loads(next(pages))["page"] == 0
+    assert [json.loads(line)["page"] for line in pages] == [1, 2]
+    wait_idle(service)
+
+
+def test_timeout_restarts_pool(tmp_path, monkeypatch):
+    # Workers are forked with an optimize that never returns.
+    monkeypatch.setattr(Preprocessor, "optimize", lambda *args: time.sleep(60))
+    options = ServerOptions(workers=1, max_queue=0, timeout=0.5)
+    service = Service(options)
+    try:
+        executor = service.executor
+        assert service.admit()
+        pages = service.run(b"%PDF", TokenizeRequest(preprocess="full"))
+        with pytest.raises(TimeoutError):
+            list(pages)
+        assert service.executor is not executor
+        # The slot is released once the hung worker is killed.
+        wait_idle(service)
+        filename = tmp_path.joinpath("doc.pdf")
+        generate_pdf(filename, CorpusSpec(pages=1, spans_per_page=5))
+        assert service.admit()
+        pages = service.run(filename.read_bytes(), TokenizeRequest(preprocess="none"))
+        assert len(list(pages)) == 1
+    finally:
+        service.shutdown()
+
+
+def test_preprocessor_use_pdfa_flag():
+    params = {param.name: param for param in main.params}
+    assert params["preprocessor_use_pdfa"].is_flag
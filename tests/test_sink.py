@@ -0,0 +1,39 @@
+import csv
+import json
+
+from texttokenizer.sink import CsvTokenSink, TemplatizerTokenSink, open_sink
+from texttokenizer.token import Token
+
+TOKENS = [
+    Token(page=0, text="foo", font=("Arial-0", 10.0), origin=(1, 2), bbox=(1, 0, 3, 2)),
+    Token(page=1, text="bar", font=("Arial-0", 12.0), origin=(4, 5), bbox=(4, 3, 6, 5)),
+]
+
+
+def test_templatizer_sink(tmp_path):
+    filename = tmp_path.joinpath("tokens.json")
+    with TemplatizerTokenSink(filename) as sink:
+        sink.write(TOKENS[:1])
+        sink.write(TOKENS[1:])
+    expected = {f"token_{i}": [t.as_templatizer_dict()] for i, t in enumerate(TOKENS)}
+    assert filename.read_text() == json.dumps(expected)
+    assert sink.count == 2
+
+
+def test_templatizer_sink_empty(tmp_path):
+    filename = tmp_path.joinpath("tokens.json")
+    with open_sink("templatizer", filename):
+        pass
+    assert json.loads(filename.read_text()) == {}
+
+
+def test_csv_sink(tmp_path):
+    filename = tmp_path.joinpath("tokens.csv")
+    with CsvTokenSink(filename) as sink:
+        for token in TOKENS:
+            sink.write([token])
+    with open(filename, newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == list(Token.csv_headers())
+    assert len(rows) == 3
+    assert rows[1][:2] == ["0", "foo"]
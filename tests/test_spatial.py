@@ -0,0 +1,83 @@
+import random
+
+import numpy as np
+import pytest
+
+from texttokenizer.spatial import SpatialIndex
+from texttokenizer.synthetic import CorpusSpec, generate_pdf
+from texttokenizer.token import Token
+
+
+def token(page, text, bbox):
+    return Token(
+        page=page, text=text, font=("Arial", 10.0), origin=bbox[::3], bbox=bbox
+    )
+
+
+TOKENS = [
+    token(0, "a", (10, 10, 20, 20)),
+    token(0, "b", (30, 10, 40, 20)),
+    token(0, "c", (10, 40, 20, 50)),
+    token(1, "d", (0, 0, 100, 100)),
+]
+
+
+@pytest.fixture(scope="module")
+def synthetic(tmp_path_factory):
+    filename = tmp_path_factory.mktemp("spatial").joinpath("doc.pdf")
+    spec = CorpusSpec(pages=2, spans_per_page=200, rotated_ratio=0.1)
+    return generate_pdf(filename, spec)
+
+
+def test_queries():
+    index = SpatialIndex.from_tokens(TOKENS)
+    assert index.intersecting(0, (15, 15, 35, 15)).tolist() == [0, 1]
+    assert index.contained(0, (0, 0, 45, 25)).tolist() == [0, 1]
+    assert index.contained(1, (0, 0, 45, 25)).tolist() == []
+    assert index.nearest(0, (12, 35), k=2).tolist() == [2, 0]
+    assert index.nearest(1, (500, 500)).tolist() == [3]
+    assert index.reading_order(0).tolist() == [0, 1, 2]
+    assert index.neighbors(0, 1) == (0, 2)
+    assert index.neighbors(1, 3) == (None, None)
+    assert index.intersecting(5, (0, 0, 1, 1)).tolist() == []
+
+
+def test_queries_match_linear_scan(synthetic):
+    index = SpatialIndex.from_tokens(synthetic)
+    rng = random.Random(0)
+    for _ in range(100):
+        page = rng.randrange(2)
+        x, y = rng.uniform(0, 600), rng.uniform(0, 800)
+        box = (x, y, x + rng.uniform(0, 200), y + rng.uniform(0, 200))
+        expected = [
+            i
+            for i, t in enumerate(synthetic)
+            if t.page == page
+            and t.bbox[0] <= box[2]
+            and t.bbox[2] >= box[0]
+            and t.bbox[1] <= box[3]
+            and t.bbox[3] >= box[1]
+        ]
+        assert sorted(index.intersecting(page, box).tolist()) == expected
+
+        point = (rng.uniform(-50, 700), rng.uniform(-50, 900))
+        page_index = index.page(page)
+        tokens = np.arange(len(page_index))
+        expected = np.sort(page_index.distances(point, tokens))[:3]
+        nearest = index.nearest(page, point, k=3) - page_index.offset
+        assert np.allclose(page_index.distances(point, nearest), expected)
+
+
+def test_save_load(synthetic, tmp_path):
+    index = SpatialIndex.from_tokens(synthetic)
+    filename = tmp_path.joinpath("index.npz")
+    index.save(filename)
+    loaded = SpatialIndex.load(filename)
+    assert loaded.count == index.count
+    box = (100, 100, 300, 300)
+    assert loaded.intersecting(1, box).tolist() == index.intersecting(1, box).tolist()
+    assert (
+        loaded.nearest(0, (50, 50), 4).tolist()
+        == index.nearest(0, (50, 50), 4).tolist()
+    )
+    assert loaded.neighbors(1, 250) == index.neighbors(1, 250)
@@ -0,0 +1,27 @@
+from texttokenizer.document import Document
+from texttokenizer.processor import FitzProcessor
+from texttokenizer.synthetic import CorpusSpec, generate_pdf
+
+
+def test_generate_pdf(tmp_path):
+    filename = tmp_path.joinpath("synthetic.pdf")
+    spec = CorpusSpec(
+        pages=4, spans_per_page=60, rotated_ratio=0.1, image_pages_ratio=0.25
+    )
+    expected = generate_pdf(filename, spec)
+    document = Document(filename=filename, pages=None, pdf_doc=None)
+    FitzProcessor().tokenize(document)
+
+    assert len(document.page_indices) == 4
+    assert len(expected) == 180
+    assert len(document.tokens) == len(expected)
+    for token, truth in zip(document.tokens, expected):
+        assert token.text == truth.text
+        assert token.font[0].startswith(truth.font[0])
+        assert all(abs(a - b) < 0.5 for a, b in zip(token.bbox, truth.bbox))
+
+
+def test_generate_pdf_deterministic(tmp_path):
+    spec = CorpusSpec(pages=2, spans_per_page=10, seed=3)
+    first = generate_pdf(tmp_path.joinpath("a.pdf"), spec)
+    assert generate_pdf(tmp_path.joinpath("b.pdf"), spec) == first
@@ -0,0 +1,52 @@
+import pytest
+
+from texttokenizer.token import Token, TokenTable
+
+
+def make_token(page, text, x=0.0):
+    return Token(
+        page=page,
+        text=text,
+        font=("Arial-0", 10.0),
+        origin=(x, 10.0),
+        bbox=(x, 2.0, x + 5.0, 10.0),
+    )
+
+
+TOKENS = [
+    make_token(0, "foo"),
+    make_token(0, "bar", 6.0),
+    make_token(2, "foo", 1.0),
+    make_token(3, "baz"),
+]
+
+
+def test_token_slots():
+    with pytest.raises(AttributeError):
+        TOKENS[0].extra = 1
+
+
+def test_token_table_roundtrip():
+    table = TokenTable.from_tokens(TOKENS)
+    assert len(table) == 4
+    assert table.to_tokens() == TOKENS
+    assert table[-1] == TOKENS[-1]
+    assert table.fonts == ["Arial-0"]
+    assert table.texts == ["foo", "bar", "baz"]
+
+
+def test_token_table_pages():
+    table = TokenTable.from_tokens(TOKENS)
+    assert table.page_range(0) == (0, 2)
+    assert table.page_range(1) == (2, 2)
+    assert table.page(0).to_tokens() == TOKENS[:2]
+    assert table.page(1).to_tokens() == []
+    view = table.page(2)
+    assert view.to_tokens() == TOKENS[2:3]
+    assert view.bboxes.obj is table.bboxes
+
+
+def test_token_table_order():
+    table = TokenTable.from_tokens(TOKENS)
+    with pytest.raises(ValueError):
+        table.append(make_token(1, "late"))
@@ -3,9 +3,11 @@ from pathlib import Path
 import pytest
 
 from texttokenizer.util import (
+    as_bytes,
     expand_page_list,
     flag_composer,
     flags_decomposer,
+    page_shards,
     suffix_path,
 )
 
@@ -28,6 +30,14 @@ def test_expand_page_list():
         expand_page_list("-", 4)
 
 
+def test_page_shards():
+    assert page_shards([0], 4) == [[0]]
+    assert page_shards([0, 1, 2, 3], 2) == [[0, 1], [2, 3]]
+    assert page_shards([0, 1, 2, 3, 4], 2) == [[0, 1, 2], [3, 4]]
+    assert page_shards([1, 3, 4], 8) == [[1], [3], [4]]
+    assert page_shards([], 2) == []
+
+
 def test_flag_composer():
     assert flag_composer({}) == 0
     assert flag_composer({"superscript": True}) == 1
@@ -83,3 +93,11 @@ def test_flag_decomposer():
         "serif": True,
         "superscript": False,
     }
+
+
+def test_as_bytes():
+    data = b"%PDF-1.7"
+    assert as_bytes(data) is data
+    assert as_bytes(memoryview(data)) is data
+    assert as_bytes(memoryview(data)[1:]) == data[1:]
+    assert as_bytes(bytearray(data)) == data
@@ -3,43 +3,73 @@
 This script tokenizes a given pdf document into text tokens where each token is
 a pair of text extracted from the document and the corresponding bounding box
 for the text.
+
+Multiple documents (files, directories, globs or a manifest) can be processed in
+a single batch run over a pool of worker processes.
 """
 
-from dataclasses import asdict, dataclass
+import time
+from importlib import import_module
 from pathlib import Path
-from tempfile import mkdtemp
+from typing import TYPE_CHECKING
 
 import click
-import dacite
-from loguru import logger as log
-
-from .annotator import FitzAnnotator, PDFiumAnnotator
-from .document import Document
-from .preprocessor import Preprocessor
-from .processor import FitzProcessor
-from .util import suffix_path
-
-
-@dataclass(kw_only=True)
-class Options:
-    annotate: bool
-    annotate_bbox: bool
-    annotate_text: bool
-    annotate_token: bool
-    annotator: str
-    annotator_font: Path
-    preprocessor_use_pdfa: bool
-    filename: Path
-    pages: str | None
-    merge_bboxes: bool
-    token_format: str
-    tmproot: Path
+
+if TYPE_CHECKING:
+    from .pipeline import Options
+
+# The phases import heavy backends (fitz, ocrmypdf, pypdfium2, PIL), so they are
+# only imported when a document is processed or their names are accessed.
+LAZY_ATTRS = {
+    "FitzAnnotator": ".annotator",
+    "PDFiumAnnotator": ".annotator",
+    "BatchOptions": ".batch",
+    "run_batch": ".batch",
+    "Document": ".document",
+    "Options": ".pipeline",
+    "process_document": ".pipeline",
+    "profiler": ".instrument",
+    "Preprocessor": ".preprocessor",
+    "FitzProcessor": ".processor",
+    "Token": ".token",
+    "TokenTable": ".token",
+    "suffix_path": ".util",
+}
+
+
+def __getattr__(name: str):
+    if name not in LAZY_ATTRS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(LAZY_ATTRS[name], __name__), name)
+    globals()[name] = value
+    return value
 
 
 @click.option("--annotate", is_flag=True, help="save the annotated document.")
 @click.option("--annotate_bbox", default=True, help="annotate token bbox.")
 @click.option("--annotate_text", default=False, help="annotate token text.")
 @click.option("--annotate_token", default=True, help="annotate token index.")
+@click.option(
+    "--annotate_workers",
+    default=1,
+    help="number of worker processes annotating pages of a document.",
+)
+@click.option(
+    "--annotate_profile",
+    type=click.Choice(["thumbnail", "preview", "review", "full"]),
+    default="full",
+    help="resolution of annotated images, 36, 72, 150 or 300 dpi.",
+)
+@click.option(
+    "--annotate_dpi",
+    type=int,
+    help="resolution of annotated images, overrides the profile.",
+)
+@click.option(
+    "--annotate_tile_size",
+    default=0,
+    help="save annotated pages as pyramids of tiles of this many pixels.",
+)
 @click.option(
     "--annotator",
     type=click.Choice(["fitz", "pdfium"]),
@@ -52,10 +82,36 @@ class Options:
     help="path to font for annotation.",
 )
 @click.option("--merge_bboxes", is_flag=True, help="flag to merge overlapping bboxes.")
+@click.option(
+    "--merge_strategy",
+    type=click.Choice(["heuristic", "lines"]),
+    default="heuristic",
+    help="bbox merge implementation to use.",
+)
+@click.option(
+    "--merge_baseline_tolerance",
+    default=0.5,
+    help="max baseline difference of tokens on the same line (lines strategy).",
+)
+@click.option(
+    "--merge_gap_tolerance",
+    default=0.5,
+    help="max horizontal gap between merged tokens (lines strategy).",
+)
+@click.option(
+    "--layout",
+    is_flag=True,
+    help="read tokens in block and line reading order (multi-column aware).",
+)
+@click.option(
+    "--page_workers",
+    default=1,
+    help="number of worker processes tokenizing pages of a document.",
+)
 @click.option("--pages", help="process specified pages (ranges or comma separated)")
 @click.option(
     "--token_format",
-    type=click.Choice(["csv", "templatizer"]),
+    type=click.Choice(["csv", "templatizer", "columnar"]),
     default="templatizer",
     help="output format for tokens.",
 )
@@ -64,47 +120,144 @@ class Options:
     is_flag=True,
     help="use pdf/a format conversion in preprocessor.",
 )
+@click.option(
+    "--preprocessor_fast_path",
+    is_flag=True,
+    help="only preprocess pages without a usable text layer.",
+)
+@click.option(
+    "--spatial_index",
+    is_flag=True,
+    help="save a spatial index of the token bboxes with the tokens.",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help="only re-tokenize pages changed since the previous run.",
+)
+@click.option(
+    "--dataset",
+    help="add the tokens of all documents to a sharded dataset in this directory.",
+)
+@click.option(
+    "--dataset_shard_size", default=256, help="max dataset shard size in megabytes."
+)
 @click.option("--tmproot", default="./tmp", help="root directory for temp files.")
-@click.argument("filename")
+@click.option(
+    "--journal",
+    help="record progress in this journal file and resume the run it records.",
+)
+@click.option(
+    "--cache_dir",
+    "--cache-dir",
+    default="~/.cache/texttokenizer",
+    help="directory for cached preprocessed documents and tokens.",
+)
+@click.option("--cache_size", default=10240, help="max cache size in megabytes.")
+@click.option("--no_cache", "--no-cache", is_flag=True, help="disable the cache.")
+@click.option(
+    "--manifest",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="file listing documents to process, one per line.",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    help="number of worker processes for batch runs.",
+)
+@click.option(
+    "--timeout", type=float, help="per document timeout in seconds for batch runs."
+)
+@click.option("--retries", default=0, help="retries per failed document in batches.")
+@click.option(
+    "--ocr_budget",
+    type=int,
+    help="cores shared by the OCR of all batch workers, all cores by default.",
+)
+@click.option(
+    "--profile",
+    help="write per stage timing and memory report to this file.",
+)
+@click.option(
+    "--profile_format",
+    type=click.Choice(["json", "prometheus"]),
+    default="json",
+    help="format of the profile report.",
+)
+@click.option(
+    "--profile_cprofile",
+    is_flag=True,
+    help="dump cProfile stats per stage next to the report (main process only).",
+)
+@click.option(
+    "--profile_tracemalloc",
+    is_flag=True,
+    help="record peak python heap usage per stage with tracemalloc.",
+)
+@click.argument("filenames", nargs=-1)
 @click.command()
-def cli(**kwargs):
-    config = dacite.Config(type_hooks={Path: lambda d: Path(d).expanduser().resolve()})
-    options = dacite.from_dict(data_class=Options, data=kwargs, config=config)
-    options.tmproot.mkdir(parents=True, exist_ok=True)
-
-    doc = dacite.from_dict(data_class=Document, data=asdict(options))
-    preprocessor = Preprocessor()
-    processor = FitzProcessor()
-
-    fonts_dir = None
-    if options.annotate:
-        tempdir = Path(
-            mkdtemp(prefix=f"{doc.filename.with_suffix('').name}-", dir=options.tmproot)
-        )
-        log.info(f"using tempdir {tempdir}")
-        fonts_dir = tempdir.joinpath("fonts")
-        annotatorCls = (
-            PDFiumAnnotator if options.annotator == "pdfium" else FitzAnnotator
-        )
-        annotator = dacite.from_dict(
-            data_class=annotatorCls,
-            data={"fonts_dir": fonts_dir, **kwargs},
-            config=config,
+def cli(filenames, manifest, workers, timeout, retries, ocr_budget, **kwargs):
+    import dacite
+
+    from .batch import (
+        BatchOptions,
+        batch_options,
+        expand_inputs,
+        log_summary,
+        run_batch,
+        summarize,
+    )
+    from .instrument import profiler
+    from .journal import log_progress, open_journal
+    from .pipeline import Options, dacite_config, process_document
+    from .scheduler import OcrScheduler
+
+    paths = expand_inputs(list(filenames), manifest)
+    if not paths:
+        raise click.UsageError("no documents given to process.")
+    options = dacite.from_dict(
+        data_class=Options,
+        data={"filename": paths[0], **kwargs},
+        config=dacite_config,
+    )
+    if options.profile is not None:
+        profiler.enable(
+            cprofile=options.profile_cprofile,
+            tracemalloc=options.profile_tracemalloc,
         )
+    journal = None
+    if options.journal is not None:
+        journal = open_journal(options.journal)
+        paths = journal.resume(paths)
+        if not paths:
+            log_progress(journal.state.progress())
+            return
+    # Journaled runs always go through the batch runner, which records outcomes.
+    if (
+        journal is None
+        and len(paths) == 1
+        and workers == 1
+        and timeout is None
+        and not retries
+    ):
+        process_document(options)
+        write_profile(options)
+        return
 
-    format = "pdfa" if options.preprocessor_use_pdfa else "pdf"
-    preprocessed = suffix_path(doc.filename, "preprocessed")
-    preprocessor.optimize(doc.filename, preprocessed, format)
-    doc.update_pdf_doc(preprocessed)
+    batch = BatchOptions(workers=workers, timeout=timeout, retries=retries)
+    scheduler = OcrScheduler(ocr_budget, slots=workers)
+    start = time.perf_counter()
+    results = run_batch(batch_options(options, paths), batch, scheduler, journal)
+    summary = summarize(results, time.perf_counter() - start, scheduler.metrics())
+    log_summary(summary)
+    write_profile(options)
+    if summary["failed"]:
+        raise click.exceptions.Exit(1)
 
-    processor.tokenize(doc, fonts_dir=fonts_dir, merge_bboxes=options.merge_bboxes)
 
-    if options.token_format == "templatizer":
-        filename = suffix_path(doc.filename, "tokens", ext=".json")
-        doc.save_templatizer_tokens(filename)
-    else:
-        filename = suffix_path(doc.filename, "tokens", ext=".csv")
-        doc.save_csv_tokens(filename)
+def write_profile(options: "Options"):
+    from .instrument import profiler
 
-    if options.annotate:
-        annotator.annotate(doc)
+    if options.profile is not None:
+        profiler.write(options.profile, options.profile_format)
@@ -0,0 +1,292 @@
+"""asyncio pipeline API.
+
+    async with AsyncPipeline(options, concurrency={"preprocess": 2}) as pipeline:
+        async for token in pipeline.tokenize(Path("doc.pdf")):
+            ...
+        async for result in pipeline.run(paths):
+            ...
+
+`run` processes many documents with the preprocess, tokenize, write and
+annotate stages as separate tasks connected by bounded queues, each stage
+running on its own executor with its configured concurrency. Document N+1 can
+then be preprocessed while document N is tokenized and document N-1 written.
+Documents are processed in memory, outputs are written next to their filename.
+"""
+
+import asyncio
+import threading
+import time
+from collections.abc import AsyncIterator, Iterable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from io import BytesIO
+from pathlib import Path
+
+from loguru import logger as log
+
+from .batch import DocumentResult
+from .document import Document
+from .pipeline import Options, make_annotator, make_fonts_dir, make_processor
+from .preprocessor import Preprocessor
+from .sink import open_sink, sink_ext
+from .token import Token
+from .util import PdfBuffer, PdfSource, as_bytes, suffix_path
+
+STAGES = ("preprocess", "tokenize", "write", "annotate")
+# Stages that mostly wait on files run on threads, the others on processes.
+THREAD_STAGES = ("write",)
+# How often a producer blocked on a full queue checks if the consumer stopped.
+STOP_POLL_SECONDS = 0.1
+
+# A document given as a file, or as a filename naming its outputs and its pdf.
+Source = Path | tuple[Path, PdfBuffer]
+PageTokens = list[tuple[int, list[Token]]]
+
+
+def preprocess_source(source: PdfSource, options: Options) -> bytes:
+    """Returns the preprocessed pdf of a file or in memory pdf."""
+    data = source.read_bytes() if isinstance(source, Path) else as_bytes(source)
+    format = "pdfa" if options.preprocessor_use_pdfa else "pdf"
+    preprocessor = Preprocessor()
+    if options.preprocessor_fast_path:
+        data, _ = preprocessor.preprocess_buffer(data, format)
+        return data
+    optimized = BytesIO()
+    preprocessor.optimize(BytesIO(data), optimized, format)
+    return optimized.getvalue()
+
+
+def tokenize_data(data: bytes, options: Options, fonts_dir: Path | None) -> PageTokens:
+    document = Document.from_buffer(
+        data, filename=options.filename, pages=options.pages
+    )
+    try:
+        pages = make_processor(options).iter_tokens(
+            document, fonts_dir=fonts_dir, merge_bboxes=options.merge_bboxes
+        )
+        return list(pages)
+    finally:
+        document.pdf_doc.close()
+
+
+def write_tokens(options: Options, pages: PageTokens) -> Path:
+    ext = sink_ext(options.token_format)
+    filename = suffix_path(options.filename, "tokens", ext=ext)
+    with open_sink(options.token_format, filename) as sink:
+        for _, tokens in pages:
+            sink.write(tokens)
+    return filename
+
+
+def annotate_data(data: bytes, options: Options, pages: PageTokens, fonts_dir: Path):
+    document = Document.from_buffer(
+        data, filename=options.filename, pages=options.pages
+    )
+    try:
+        document.tokens = [token for _, tokens in pages for token in tokens]
+        make_annotator(options, fonts_dir).annotate(document)
+    finally:
+        document.pdf_doc.close()
+
+
+@dataclass(kw_only=True)
+class Job:
+    """A document moving through the stages of the pipeline."""
+
+    options: Options
+    source: PdfSource
+    start: float = field(default_factory=time.perf_counter)
+    data: bytes | None = None
+    fonts_dir: Path | None = None
+    pages: PageTokens = field(default_factory=list)
+    page_count: int = 0
+    token_count: int = 0
+    error: str | None = None
+
+
+class AsyncPipeline:
+    """Runs the pipeline stages concurrently across documents.
+
+    Concurrency maps stage names to the number of documents processed at once
+    by that stage (1 by default), queue_size bounds the documents waiting
+    between two stages. Caching and incremental runs are not supported.
+    """
+
+    def __init__(
+        self,
+        options: Options,
+        concurrency: dict[str, int] | None = None,
+        queue_size: int = 2,
+    ):
+        unknown = set(concurrency or {}) - set(STAGES)
+        if unknown:
+            raise ValueError(f"unknown stages {unknown}, expected one of {STAGES}")
+        self.options = options
+        self.concurrency = {stage: 1 for stage in STAGES} | (concurrency or {})
+        self.queue_size = queue_size
+        self.executors: dict[str, Executor] = {}
+        options.tmproot.mkdir(parents=True, exist_ok=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for executor in self.executors.values():
+            executor.shutdown(cancel_futures=True)
+        self.executors = {}
+
+    def executor(self, stage: str) -> Executor:
+        if stage not in self.executors:
+            executorCls = (
+                ThreadPoolExecutor if stage in THREAD_STAGES else ProcessPoolExecutor
+            )
+            self.executors[stage] = executorCls(max_workers=self.concurrency[stage])
+        return self.executors[stage]
+
+    async def submit(self, stage: str, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor(stage), fn, *args)
+
+    def job(self, source: Source) -> Job:
+        filename, data = source if isinstance(source, tuple) else (source, None)
+        options = replace(self.options, filename=filename)
+        return Job(options=options, source=filename if data is None else data)
+
+    async def tokenize(self, source: Source) -> AsyncIterator[Token]:
+        """Yields the tokens of a document as each page is tokenized.
+
+        Pages are tokenized on a thread, at most queue_size pages ahead of the
+        consumer.
+        """
+        job = self.job(source)
+        data = await self.submit(
+            "preprocess", preprocess_source, job.source, job.options
+        )
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        stop = threading.Event()
+
+        def put(item) -> bool:
+            """Puts item on the queue from the thread, false once stopped."""
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while not stop.is_set():
+                try:
+                    future.result(timeout=STOP_POLL_SECONDS)
+                    return True
+                except TimeoutError:
+                    continue
+            future.cancel()
+            return False
+
+        def produce():
+            document = Document.from_buffer(
+                data, filename=job.options.filename, pages=job.options.pages
+            )
+            try:
+                pages = make_processor(job.options).iter_tokens(
+                    document, merge_bboxes=job.options.merge_bboxes
+                )
+                for _, tokens in pages:
+                    if not put(tokens):
+                        return
+            except Exception as e:
+                put(e)
+            finally:
+                document.pdf_doc.close()
+                put(None)
+
+        producer = loop.run_in_executor(None, produce)
+        try:
+            while (tokens := await queue.get()) is not None:
+                if isinstance(tokens, Exception):
+                    raise tokens
+                for token in tokens:
+                    yield token
+        finally:
+            # Stops the producer if the consumer stopped early.
+            stop.set()
+            await asyncio.gather(producer, return_exceptions=True)
+
+    async def _preprocess(self, job: Job):
+        job.data = await self.submit(
+            "preprocess", preprocess_source, job.source, job.options
+        )
+
+    async def _tokenize(self, job: Job):
+        if job.options.annotate:
+            job.fonts_dir = make_fonts_dir(job.options)
+        job.pages = await self.submit(
+            "tokenize", tokenize_data, job.data, job.options, job.fonts_dir
+        )
+        job.page_count = len(job.pages)
+        job.token_count = sum(len(tokens) for _, tokens in job.pages)
+        if not job.options.annotate:
+            job.data = None
+
+    async def _write(self, job: Job):
+        await self.submit("write", write_tokens, job.options, job.pages)
+        if not job.options.annotate:
+            job.pages = []
+
+    async def _annotate(self, job: Job):
+        await self.submit(
+            "annotate", annotate_data, job.data, job.options, job.pages, job.fonts_dir
+        )
+        job.data, job.pages = None, []
+
+    async def run(self, sources: Iterable[Source]) -> AsyncIterator[DocumentResult]:
+        """Processes documents through all stages, yielding results as they finish.
+
+        A document failing a stage is reported with its error and skips the
+        remaining stages, the other documents are not affected.
+        """
+        stages = [s for s in STAGES if s != "annotate" or self.options.annotate]
+        queues = [asyncio.Queue(self.queue_size) for _ in stages]
+        results: asyncio.Queue = asyncio.Queue()
+        queues.append(results)
+
+        async def feed():
+            for source in sources:
+                await queues[0].put(self.job(source))
+            for _ in range(self.concurrency[stages[0]]):
+                await queues[0].put(None)
+
+        async def work(i: int, stage: str):
+            step = getattr(self, f"_{stage}")
+            while (job := await queues[i].get()) is not None:
+                if job.error is None:
+                    try:
+                        await step(job)
+                    except Exception as e:
+                        log.error(f"{stage} failed {job.options.filename} - {e!r}")
+                        job.error = repr(e)
+                await queues[i + 1].put(job)
+
+        async def run_stage(i: int, stage: str):
+            await asyncio.gather(
+                *(work(i, stage) for _ in range(self.concurrency[stage]))
+            )
+            # Each worker of the next stage stops on its own sentinel.
+            workers = self.concurrency[stages[i + 1]] if i + 1 < len(stages) else 1
+            for _ in range(workers):
+                await queues[i + 1].put(None)
+
+        tasks = [asyncio.create_task(feed())]
+        tasks += [asyncio.create_task(run_stage(i, s)) for i, s in enumerate(stages)]
+        try:
+            while (job := await results.get()) is not None:
+                yield DocumentResult(
+                    filename=job.options.filename,
+                    ok=job.error is None,
+                    pages=job.page_count,
+                    tokens=job.token_count,
+                    seconds=time.perf_counter() - job.start,
+                    error=job.error,
+                )
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,28 +1,97 @@
+import json
+import math
 from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass, field
-from io import BytesIO
 from pathlib import Path
 
 import fitz
-import pypdfium2 as pdfium
 from loguru import logger as log
 from PIL import Image, ImageDraw
 from PIL.ImageFont import FreeTypeFont, ImageFont, truetype
 
 from .document import Document
-from .token import Font
-from .util import suffix_path
+from .fontstore import read_font_index
+from .instrument import profiler, stage
+from .token import Font, Token
+from .util import PdfSource, as_bytes, open_pdf, page_shards, suffix_path
 
-fitz.TOOLS.set_aa_level(4)
+SHARDS_PER_WORKER = 4
+# Annotation resolutions, from a quick look to print quality.
+DPI_PROFILES = {"thumbnail": 36, "preview": 72, "review": 150, "full": 300}
+# Pixels around a tile within which tokens are drawn, so labels and text of
+# tokens just outside the tile are not cut at its edges.
+TILE_MARGIN = 64
+
+# A region of a page in pdf points or image pixels (x0, y0, x1, y1).
+Box = tuple[float, float, float, float]
 
 
 class Config:
+    # Defaults of the "full" profile.
     dpi: int = 300
     scale: float = 4.16666667  # (dpi * 1/72)
+    label_size: int = 22
     genfiles_suffix: str = "png"
     text_color = (255, 0, 0)
     box_color = (255, 0, 0)
     stroke = 1
+    # Anti-aliasing level of fitz rendering, set when rendering as it is global.
+    aa_level: int = 4
+
+
+class FontCache:
+    """A bounded LRU cache of FreeType fonts keyed by font file and size.
+
+    Loading a FreeTypeFont opens the font file and builds a new face, which
+    dominates drawing dense pages when done per token. The cache is shared by
+    all annotators in the process, so fonts are reused across pages and
+    documents of a run.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.fonts: OrderedDict[tuple[str, float], FreeTypeFont] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: Path | str, size: float) -> FreeTypeFont:
+        key = (str(path), size)
+        font = self.fonts.get(key)
+        if font is not None:
+            self.hits += 1
+            self.fonts.move_to_end(key)
+            return font
+        self.misses += 1
+        font = truetype(font=key[0], size=size)
+        self.fonts[key] = font
+        if len(self.fonts) > self.maxsize:
+            self.fonts.popitem(last=False)
+        return font
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.fonts),
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def merge(self, stats: dict):
+        """Adds the hits and misses counted by the cache of another process."""
+        self.hits += stats["hits"]
+        self.misses += stats["misses"]
+
+    def clear(self):
+        self.fonts.clear()
+        self.hits = self.misses = 0
+
+
+font_cache = FontCache()
 
 
 @dataclass(kw_only=True)
@@ -34,35 +103,72 @@ class Annotator(ABC):
     annotate_token: bool
     annotator_font: Path
     fonts_dir: Path
+    annotate_workers: int = 1
+    annotate_profile: str = "full"
+    annotate_dpi: int | None = None
+    annotate_tile_size: int = 0
 
     fonts: dict[str, Path] = field(default_factory=dict)
+    font_index: dict[int, dict[str, Path]] = field(default_factory=dict)
     default_font: ImageFont | None
 
     def __post_init__(self):
-        self.default_font = truetype(str(self.annotator_font), size=22)
-
-    def load_fonts(self, fonts_dir: Path):
-        fonts = {}
-        for f in fonts_dir.iterdir():
-            if f.is_file():
-                fonts[f.with_suffix("").name] = f
-        self.fonts = fonts
+        if self.annotate_profile not in DPI_PROFILES:
+            raise ValueError(f"unknown annotation profile {self.annotate_profile}")
+        # Token labels keep their size relative to the page at any resolution.
+        size = max(round(Config.label_size * self.dpi / Config.dpi), 6)
+        self.default_font = font_cache.get(self.annotator_font, size)
+
+    # Computed rather than set in __post_init__, as dacite resets init=False
+    # fields to their defaults after construction.
+    @property
+    def dpi(self) -> int:
+        return self.annotate_dpi or DPI_PROFILES[self.annotate_profile]
+
+    @property
+    def scale(self) -> float:
+        return self.dpi / 72
+
+    def load_fonts(self, idx: int):
+        self.fonts = self.font_index.get(idx, {})
         log.info(f"page fonts {self.fonts}")
 
     def get_font(self, font: Font) -> ImageFont:
         name, size = font
-        size = size * Config.scale
+        size = size * self.scale
         if name in self.fonts:
-            return FreeTypeFont(font=str(self.fonts[name]), size=size)
+            return font_cache.get(self.fonts[name], size)
         log.warning(f"font {font[0]} not found in loaded page fonts.")
         return self.default_font
 
-    def write_tokens(self, img: Image.Image, tokens):
+    def write_tokens(self, img: Image.Image, tokens, offset=(0, 0)):
+        """Draws the tokens of a page on its image, or on a tile of it at offset.
+
+        Token indices are positions in the page tokens, tokens away from the
+        image are skipped.
+        """
         draw = ImageDraw.Draw(img)
+        ox, oy = offset
+        width, height = img.size
         for i, token in enumerate(tokens):
-            font = self.get_font(token.font)
-            bbox = tuple(map(lambda x: x * Config.scale, token.bbox))
-            origin = tuple(map(lambda x: x * Config.scale, token.origin))
+            x0, y0, x1, y1 = token.bbox
+            bbox = (
+                x0 * self.scale - ox,
+                y0 * self.scale - oy,
+                x1 * self.scale - ox,
+                y1 * self.scale - oy,
+            )
+            if (
+                bbox[2] < -TILE_MARGIN
+                or bbox[3] < -TILE_MARGIN
+                or bbox[0] > width + TILE_MARGIN
+                or bbox[1] > height + TILE_MARGIN
+            ):
+                continue
+            origin = (
+                token.origin[0] * self.scale - ox,
+                token.origin[1] * self.scale - oy,
+            )
             if self.annotate_token:
                 draw.text(
                     origin,
@@ -72,6 +178,7 @@ class Annotator(ABC):
                     anchor="ls",
                 )
             if self.annotate_text:
+                font = self.get_font(token.font)
                 draw.text(
                     origin, token.text, font=font, fill=Config.text_color, anchor="ls"
                 )
@@ -83,44 +190,269 @@ class Annotator(ABC):
         if not (self.annotate_bbox or self.annotate_text or self.annotate_token):
             log.warning("annotation requested but nothing to annotate")
             return
-        page_images = self.get_page_images(document)
-        for idx, img in page_images:
-            page_tokens = [t for t in document.tokens if t.page == idx]
-            self.load_fonts(self.fonts_dir.joinpath(str(idx)))
-            self.write_tokens(img=img, tokens=page_tokens)
-            filename = suffix_path(document.filename, f"annotated-{idx}", ext=".png")
-            img.save(filename)
+        self.font_index = read_font_index(self.fonts_dir)
+        tokens = tokens_by_page(document.tokens)
+        args = (document.filename, document.page_indices, tokens, document.source)
+        if self.annotate_workers > 1 and len(document.page_indices) > 1:
+            filenames = self.annotate_parallel(*args)
+        else:
+            filenames = self.annotate_pages(*args)
+        for filename in filenames:
             log.info(f"writing annotated {filename}")
+        log.info(f"font cache stats {font_cache.stats()}")
+
+    def annotate_pages(
+        self,
+        filename: Path,
+        page_indices: list[int],
+        tokens: dict[int, list[Token]],
+        source: PdfSource | None = None,
+    ) -> Iterator[Path]:
+        """Renders, draws and saves one page at a time, yielding the image files.
+
+        Pages are rendered from source, the file or in memory pdf, defaulting to
+        filename. Images are saved next to filename, as tile pyramids when a
+        tile size is set.
+        """
+        if self.annotate_tile_size:
+            yield from self.annotate_tiled(filename, page_indices, tokens, source)
+            return
+        page_images = self.render_pages(
+            filename if source is None else source, page_indices
+        )
+        while True:
+            # Pages are rendered lazily, so rendering is accounted per page.
+            with stage("render"):
+                page = next(page_images, None)
+            if page is None:
+                break
+            idx, img = page
+            self.load_fonts(idx)
+            with stage("draw"):
+                self.write_tokens(img=img, tokens=tokens.get(idx, []))
+            output = suffix_path(filename, f"annotated-{idx}", ext=".png")
+            with stage("save_image"):
+                img.save(output)
+            yield output
+
+    def annotate_tiled(
+        self,
+        filename: Path,
+        page_indices: list[int],
+        tokens: dict[int, list[Token]],
+        source: PdfSource | None = None,
+    ) -> Iterator[Path]:
+        """Renders, draws and saves pages one tile at a time, yielding manifests.
+
+        Each tile is rendered from its own clip of the page, so memory is bounded
+        by the tile size whatever the page size. The tiles of a page go in an
+        `-annotated-{idx}` directory as `{level}/{row}_{col}.png`, level 0 at
+        full resolution and each next level halving it down to a single tile,
+        described by a `tiles.json` manifest.
+        """
+        size = self.annotate_tile_size
+        with self.open_document(filename if source is None else source) as doc:
+            for idx in page_indices:
+                self.load_fonts(idx)
+                page_tokens = tokens.get(idx, [])
+                directory = suffix_path(filename, f"annotated-{idx}", ext="")
+                directory.joinpath("0").mkdir(parents=True, exist_ok=True)
+                page_width, page_height = self.page_size(doc, idx)
+                width = math.ceil(page_width * self.scale)
+                height = math.ceil(page_height * self.scale)
+                for row, col, box in tile_boxes(width, height, size):
+                    clip = tuple(v / self.scale for v in box)
+                    with stage("render"):
+                        img = self.render_page(doc, idx, clip)
+                    with stage("draw"):
+                        self.write_tokens(img=img, tokens=page_tokens, offset=box[:2])
+                    with stage("save_image"):
+                        img.save(directory.joinpath("0", f"{row}_{col}.png"))
+                with stage("pyramid"):
+                    levels = build_pyramid(directory, width, height, size)
+                manifest = directory.joinpath("tiles.json")
+                manifest.write_text(
+                    json.dumps(
+                        {
+                            "page": idx,
+                            "dpi": self.dpi,
+                            "scale": self.scale,
+                            "width": width,
+                            "height": height,
+                            "tile_size": size,
+                            "levels": levels,
+                            "tiles": "{level}/{row}_{col}.png",
+                        }
+                    )
+                )
+                yield manifest
+
+    def annotate_shard(
+        self,
+        filename: Path,
+        page_indices: list[int],
+        tokens: dict[int, list[Token]],
+        source: PdfSource | None = None,
+    ) -> tuple[list[Path], dict, dict]:
+        """Annotates a range of pages in a worker.
+
+        Returns the files, the stage stats and the font cache hits and misses of
+        the shard.
+        """
+        # Drop stats inherited from a forked parent, they are accounted there.
+        profiler.collect()
+        hits, misses = font_cache.hits, font_cache.misses
+        filenames = list(self.annotate_pages(filename, page_indices, tokens, source))
+        fonts = {"hits": font_cache.hits - hits, "misses": font_cache.misses - misses}
+        return filenames, profiler.collect(), fonts
+
+    def annotate_parallel(
+        self,
+        filename: Path,
+        page_indices: list[int],
+        tokens: dict[int, list[Token]],
+        source: PdfSource | None = None,
+    ) -> Iterator[Path]:
+        """Annotates page ranges across worker processes.
+
+        Each worker renders, draws and encodes a single page at a time and at
+        most two shards per worker are queued, so memory stays flat regardless
+        of the page count. An in memory source is copied to the worker with each
+        shard, files are opened by path.
+        """
+        workers = self.annotate_workers
+        shards = deque(page_shards(page_indices, workers * SHARDS_PER_WORKER))
+        log.info(f"annotating {len(shards)} page shards over {workers} workers")
+        with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as executor:
+            futures = deque()
+            while shards or futures:
+                while shards and len(futures) < workers * 2:
+                    shard = shards.popleft()
+                    shard_tokens = {idx: tokens.get(idx, []) for idx in shard}
+                    futures.append(
+                        executor.submit(
+                            self.annotate_shard, filename, shard, shard_tokens, source
+                        )
+                    )
+                filenames, stats, fonts = futures.popleft().result()
+                profiler.merge(stats)
+                # Glyphs are loaded in the workers, their lookups are counted here.
+                font_cache.merge(fonts)
+                yield from filenames
+
+    def render_pages(
+        self, source: PdfSource, page_indices: list[int]
+    ) -> Iterator[tuple[int, Image.Image]]:
+        """Yields page indices and the corresponding PIL image, one at a time.
+
+        The source is a pdf file or an in memory pdf.
+        """
+        with self.open_document(source) as doc:
+            for idx in page_indices:
+                yield idx, self.render_page(doc, idx)
 
     @abstractmethod
-    def get_page_images(self, document: Document) -> list[tuple[int, Image.Image]]:
-        """Returns a list of tuples of page indices and corresponding PIL image."""
+    def open_document(self, source: PdfSource):
+        """Returns a context manager opening source with the rendering backend."""
+
+    @abstractmethod
+    def page_size(self, doc, idx: int) -> tuple[float, float]:
+        """Returns the width and height of a page in pdf points."""
+
+    @abstractmethod
+    def render_page(self, doc, idx: int, clip: Box | None = None) -> Image.Image:
+        """Renders a page, or the clip of it given in pdf points, at scale."""
+
+
+def tokens_by_page(tokens: list[Token]) -> dict[int, list[Token]]:
+    """Returns tokens bucketed by page, keeping their order within a page."""
+    pages: dict[int, list[Token]] = {}
+    for token in tokens:
+        pages.setdefault(token.page, []).append(token)
+    return pages
+
+
+def tile_boxes(width: int, height: int, size: int) -> Iterator[tuple[int, int, Box]]:
+    """Yields the row, column and pixel box of each tile of an image, by row."""
+    for row in range(math.ceil(height / size)):
+        for col in range(math.ceil(width / size)):
+            x0, y0 = col * size, row * size
+            yield row, col, (x0, y0, min(x0 + size, width), min(y0 + size, height))
+
+
+def build_pyramid(directory: Path, width: int, height: int, size: int) -> int:
+    """Builds the downsampled levels of the level 0 tiles in directory.
+
+    Each tile of a level is assembled from the four tiles under it and halved,
+    so at most five tiles are in memory. Returns the number of levels.
+    """
+    level = 0
+    while width > size or height > size:
+        width, height = math.ceil(width / 2), math.ceil(height / 2)
+        level += 1
+        directory.joinpath(str(level)).mkdir(exist_ok=True)
+        for row, col, (x0, y0, x1, y1) in tile_boxes(width, height, size):
+            canvas = Image.new("RGB", (size * 2, size * 2), "white")
+            for dy in (0, 1):
+                for dx in (0, 1):
+                    name = f"{row * 2 + dy}_{col * 2 + dx}.png"
+                    child = directory.joinpath(str(level - 1), name)
+                    if child.exists():
+                        with Image.open(child) as img:
+                            canvas.paste(img, (dx * size, dy * size))
+            tile = canvas.reduce(2).crop((0, 0, x1 - x0, y1 - y0))
+            tile.save(directory.joinpath(str(level), f"{row}_{col}.png"))
+    return level + 1
 
 
 @dataclass(kw_only=True)
 class PDFiumAnnotator(Annotator):
     """A pdfium (PyPdfium2) based annotator."""
 
-    def get_page_images(self, document: Document):
-        doc = pdfium.PdfDocument(document.filename)
-        renderer = doc.render(
-            pdfium.PdfBitmap.to_pil,
-            page_indices=document.page_indices,
-            scale=Config.scale,
-        )
-        return zip(document.page_indices, renderer)
+    @contextmanager
+    def open_document(self, source: PdfSource):
+        # Imported on use as only this backend needs pdfium.
+        import pypdfium2 as pdfium
+
+        # pdfium reads files on demand and in memory pdfs from bytes in place.
+        if not isinstance(source, Path):
+            source = as_bytes(source)
+        doc = pdfium.PdfDocument(source)
+        try:
+            yield doc
+        finally:
+            doc.close()
+
+    def page_size(self, doc, idx: int) -> tuple[float, float]:
+        return doc[idx].get_size()
+
+    def render_page(self, doc, idx: int, clip: Box | None = None) -> Image.Image:
+        page = doc[idx]
+        crop = (0, 0, 0, 0)
+        if clip is not None:
+            # pdfium crops the given margins off the left, bottom, right and top.
+            width, height = page.get_size()
+            x0, y0, x1, y1 = clip
+            crop = (x0, height - y1, width - x1, y0)
+        return page.render(scale=self.scale, crop=crop).to_pil()
 
 
 @dataclass(kw_only=True)
 class FitzAnnotator(Annotator):
     """A fitz (PyMuPdf) based annotator."""
 
-    def get_page_images(self, document: Document):
-        page_images = []
-        for idx in document.page_indices:
-            pix = document.pdf_doc[idx].get_pixmap(dpi=Config.dpi)
-            pix.gamma_with(1.01)
-            buff = pix.pil_tobytes("png")
-            img = Image.open(BytesIO(buff))
-            page_images.append((idx, img))
-        return page_images
+    def open_document(self, source: PdfSource):
+        fitz.TOOLS.set_aa_level(Config.aa_level)
+        return open_pdf(source)
+
+    def page_size(self, doc, idx: int) -> tuple[float, float]:
+        rect = doc[idx].rect
+        return rect.width, rect.height
+
+    def render_page(self, doc, idx: int, clip: Box | None = None) -> Image.Image:
+        pix = doc[idx].get_pixmap(dpi=self.dpi, clip=clip)
+        pix.gamma_with(1.01)
+        # The samples are copied into PIL directly, without encoding to an
+        # intermediate png.
+        size = (pix.width, pix.height)
+        return Image.frombytes("RGB", size, pix.samples_mv, "raw", "RGB", pix.stride)
@@ -0,0 +1,305 @@
+import glob
+import math
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+
+from loguru import logger as log
+
+from .instrument import profiler
+from .journal import Journal, log_progress, open_journal
+from .pipeline import Options, process_document
+from .scheduler import OcrScheduler, install_scheduler
+
+GLOB_CHARS = set("*?[")
+GENERATED_SUFFIXES = ("-preprocessed",)
+
+
+@dataclass(kw_only=True)
+class BatchOptions:
+    workers: int
+    timeout: float | None
+    retries: int
+
+    def __post_init__(self):
+        if self.workers < 1:
+            raise ValueError(f"at least one worker is required, got {self.workers}")
+
+
+@dataclass(kw_only=True)
+class DocumentResult:
+    """Outcome of processing a single document in a batch run."""
+
+    filename: Path
+    ok: bool
+    attempts: int = 1
+    pages: int = 0
+    tokens: int = 0
+    seconds: float = 0.0
+    error: str | None = None
+    profile: dict = field(default_factory=dict)
+
+
+def is_generated(path: Path) -> bool:
+    """Returns true if the path looks like an output of a previous run."""
+    return path.with_suffix("").name.endswith(GENERATED_SUFFIXES)
+
+
+def expand_inputs(inputs: list[str], manifest: Path | None = None) -> list[Path]:
+    """Returns the list of documents given as files, directories, globs or a manifest.
+
+    Directories are searched recursively for pdf files. Manifest entries are one
+    path per line, blank lines and lines starting with # are ignored and relative
+    paths are resolved against the manifest location. Duplicates are dropped
+    while preserving the order documents were given in.
+    """
+    paths: list[Path] = []
+    for item in inputs:
+        path = Path(item).expanduser()
+        if path.is_dir():
+            found = sorted(p for p in path.rglob("*.pdf") if p.is_file())
+            paths.extend(p for p in found if not is_generated(p))
+        elif GLOB_CHARS & set(item):
+            found = sorted(Path(p) for p in glob.glob(str(path), recursive=True))
+            paths.extend(p for p in found if p.is_file() and not is_generated(p))
+        else:
+            paths.append(path)
+    if manifest is not None:
+        with open(manifest) as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                path = Path(line).expanduser()
+                if not path.is_absolute():
+                    path = manifest.parent.joinpath(path)
+                paths.append(path)
+    resolved = (p.resolve() for p in paths)
+    return list(dict.fromkeys(resolved))
+
+
+def process_one(options: Options) -> DocumentResult:
+    """Processes a single document in a worker."""
+    start = time.perf_counter()
+    if options.profile is not None:
+        profiler.enable(tracemalloc=options.profile_tracemalloc)
+        # Drop stats inherited from a forked parent, they are accounted there.
+        profiler.collect()
+    try:
+        doc = process_document(options)
+        pages, tokens = len(doc.page_indices), doc.token_count
+        doc.pdf_doc.close()
+        if options.journal is not None:
+            # The worker holds the temp records of the document, the parent only
+            # records it done.
+            open_journal(options.journal).remove_temps(options.filename)
+    finally:
+        if options.journal is not None:
+            open_journal(options.journal).sync()
+    return DocumentResult(
+        filename=options.filename,
+        ok=True,
+        pages=pages,
+        tokens=tokens,
+        seconds=time.perf_counter() - start,
+        profile=profiler.collect(),
+    )
+
+
+def kill_workers(executor: ProcessPoolExecutor):
+    """Kills the worker processes of a pool, e.g. stuck in native code."""
+    # The executor has no public way to stop a running worker, its private map of
+    # worker processes is used instead.
+    processes = getattr(executor, "_processes", None)
+    if processes is None:
+        log.warning("can't kill the workers of this executor, leaving them to finish")
+        return
+    for process in list(processes.values()):
+        process.kill()
+
+
+def input_size(filename: Path) -> int:
+    """Returns the size of a document, 0 if it can't be read.
+
+    The size is a cheap proxy for the page count, that would need every document
+    to be opened in the parent before the first one is submitted.
+    """
+    try:
+        return filename.stat().st_size
+    except OSError:
+        return 0
+
+
+def run_batch(
+    options: list[Options],
+    batch: BatchOptions,
+    scheduler: OcrScheduler | None = None,
+    journal: Journal | None = None,
+) -> list[DocumentResult]:
+    """Processes the given documents over a pool of worker processes.
+
+    Each document is retried up to `batch.retries` times on failure. The timeout
+    is enforced from the parent by killing the workers, so it also stops
+    documents stuck in native code. A worker crash or timeout only fails the
+    document that caused it: the pool is restarted and the other documents in
+    flight are requeued without being charged an attempt. As a crash doesn't
+    tell which document caused it, those in flight are then rerun one at a time.
+    With a scheduler, the workers share its OCR budget and documents are
+    processed smallest first. With a journal, the outcome of each document is
+    recorded in it and the progress of the run is logged.
+    """
+    if scheduler is not None:
+        options = sorted(options, key=lambda opts: input_size(opts.filename))
+    pending = deque((opts, 1) for opts in options)
+    # Documents in flight during a crash, run alone until the cause is found.
+    suspects: deque[tuple[Options, int]] = deque()
+    running: dict[Future, tuple[Options, int, float]] = {}
+    results: list[DocumentResult] = []
+
+    def make_executor():
+        return ProcessPoolExecutor(
+            max_workers=batch.workers,
+            initializer=install_scheduler,
+            initargs=(scheduler,),
+        )
+
+    def submit(opts: Options, attempt: int):
+        future = executor.submit(process_one, opts)
+        deadline = time.monotonic() + batch.timeout if batch.timeout else math.inf
+        running[future] = (opts, attempt, deadline)
+
+    def fail(opts: Options, attempt: int, error: str):
+        if attempt <= batch.retries:
+            log.warning(f"retrying {opts.filename} after failure - {error}")
+            pending.append((opts, attempt + 1))
+            return
+        log.error(f"failed {opts.filename} - {error}")
+        results.append(
+            DocumentResult(
+                filename=opts.filename, ok=False, attempts=attempt, error=error
+            )
+        )
+        if journal is not None:
+            journal.failed(opts.filename, error)
+
+    executor = make_executor()
+    try:
+        while pending or suspects or running:
+            if suspects:
+                if not running:
+                    submit(*suspects.popleft())
+            else:
+                while pending and len(running) < batch.workers:
+                    submit(*pending.popleft())
+            deadline = min(deadline for _, _, deadline in running.values())
+            timeout = None
+            if deadline != math.inf:
+                timeout = max(deadline - time.monotonic(), 0)
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # Deadlines passed, the pool is restarted below.
+                now = time.monotonic()
+                for future, (opts, attempt, deadline) in list(running.items()):
+                    if deadline <= now:
+                        del running[future]
+                        fail(
+                            opts, attempt, "TimeoutError: document processing timed out"
+                        )
+                kill_workers(executor)
+                innocent = [(opts, attempt) for opts, attempt, _ in running.values()]
+                pending.extendleft(reversed(innocent))
+            crashed = []
+            for future in done:
+                opts, attempt, _ = running.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    crashed.append((opts, attempt))
+                except Exception as e:
+                    fail(opts, attempt, f"{type(e).__name__}: {e}")
+                else:
+                    result.attempts = attempt
+                    profiler.merge(result.profile)
+                    results.append(result)
+                    log.info(f"processed {opts.filename} in {result.seconds:.2f}s")
+                    if journal is not None:
+                        journal.done(
+                            opts.filename, result.pages, result.tokens, result.seconds
+                        )
+                        log_progress(journal.state.progress())
+            if crashed:
+                # Every document in flight fails along with the crashed worker.
+                crashed.extend((opts, attempt) for opts, attempt, _ in running.values())
+                if len(crashed) == 1:
+                    fail(*crashed[0], "worker crashed")
+                else:
+                    log.warning(
+                        f"worker crashed with {len(crashed)} documents in flight, "
+                        "rerunning them one at a time"
+                    )
+                    suspects.extend(crashed)
+            if crashed or not done:
+                log.warning("worker pool broken, restarting")
+                running.clear()
+                executor.shutdown(wait=False, cancel_futures=True)
+                if scheduler is not None:
+                    scheduler.renew()
+                executor = make_executor()
+    finally:
+        executor.shutdown(cancel_futures=True)
+        if journal is not None:
+            journal.sync()
+    return results
+
+
+def batch_options(base: Options, filenames: list[Path]) -> list[Options]:
+    """Returns per document options derived from the given base options."""
+    return [replace(base, filename=filename) for filename in filenames]
+
+
+def summarize(
+    results: list[DocumentResult], elapsed: float, ocr: dict | None = None
+) -> dict:
+    """Returns throughput and failure statistics for a batch run.
+
+    ocr are the metrics of the OCR scheduler of the run, if any.
+    """
+    ok = [r for r in results if r.ok]
+    pages = sum(r.pages for r in ok)
+    elapsed = max(elapsed, 1e-9)
+    return {
+        "documents": len(results),
+        "succeeded": len(ok),
+        "failed": len(results) - len(ok),
+        "retried": sum(1 for r in results if r.attempts > 1),
+        "pages": pages,
+        "tokens": sum(r.tokens for r in ok),
+        "seconds": elapsed,
+        "documents_per_second": len(ok) / elapsed,
+        "pages_per_second": pages / elapsed,
+        "failures": {str(r.filename): r.error for r in results if not r.ok},
+        "ocr": ocr or {},
+    }
+
+
+def log_summary(summary: dict):
+    log.info(
+        f"processed {summary['succeeded']}/{summary['documents']} documents "
+        f"({summary['pages']} pages, {summary['tokens']} tokens) in "
+        f"{summary['seconds']:.1f}s - {summary['documents_per_second']:.2f} docs/s, "
+        f"{summary['pages_per_second']:.2f} pages/s, {summary['retried']} retried"
+    )
+    ocr = summary["ocr"]
+    if ocr.get("runs"):
+        log.info(
+            f"ocr of {ocr['pages']} pages in {ocr['runs']} runs on {ocr['budget']} "
+            f"cores - {ocr['seconds_per_page']:.2f}s/page "
+            f"(max {ocr['max_seconds_per_page']:.2f}s), "
+            f"{ocr['wait_seconds']:.1f}s waiting, "
+            f"max queue depth {ocr['max_queue_depth']}"
+        )
+    for filename, error in summary["failures"].items():
+        log.error(f"failed {filename} - {error}")
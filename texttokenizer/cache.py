@@ -0,0 +1,154 @@
+import hashlib
+import json
+import mmap
+import os
+import shutil
+from pathlib import Path
+
+from loguru import logger as log
+
+# Bump to invalidate cached outputs when the processing code changes them.
+CACHE_VERSION = 1
+# The cache is scanned for eviction at least every EVICT_PUTS puts, to account
+# for the puts of other processes, and evicted down to EVICT_TARGET of its size.
+EVICT_PUTS = 64
+EVICT_TARGET = 0.9
+
+
+def file_digest(filename: Path) -> str:
+    """Returns the sha256 hex digest of the file contents.
+
+    The file is memory mapped and hashed in place, without reading it into
+    python buffers.
+    """
+    with open(filename, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return hashlib.sha256(data).hexdigest()
+
+
+class Cache:
+    """A content addressed on-disk cache of phase outputs, with LRU eviction.
+
+    Each entry is a directory named after a key derived from the input content
+    and the options that affect the output. Entries are touched when read and
+    the least recently used ones are evicted once the cache exceeds `max_bytes`.
+    Files are written atomically so concurrent workers can share a cache.
+
+    The size is only scanned on the first put, then kept up to date with the
+    bytes put by this process and scanned again once it exceeds `max_bytes` or
+    after `EVICT_PUTS` puts.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        # Size of the cache as of the last scan, plus the bytes put since.
+        self.estimated_bytes: int | None = None
+        self.puts = 0
+
+    @staticmethod
+    def key(digest: str, **options) -> str:
+        """Returns the cache key for content digest and output affecting options."""
+        data = json.dumps(
+            {"version": CACHE_VERSION, "digest": digest, "options": options},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def entry(self, key: str) -> Path:
+        return self.root.joinpath(key)
+
+    def fetch(self, key: str, name: str, dest: Path) -> bool:
+        """Copies the cached file to dest, returns false on a cache miss."""
+        entry = self.entry(key)
+        try:
+            shutil.copyfile(entry.joinpath(name), dest)
+            os.utime(entry)
+        except FileNotFoundError:
+            log.info(f"cache miss {key[:12]} {name}")
+            return False
+        log.info(f"cache hit {key[:12]} {name}")
+        return True
+
+    def fetch_meta(self, key: str) -> dict:
+        try:
+            with open(self.entry(key).joinpath("meta.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def put(self, key: str, name: str, src: Path, meta: dict | None = None):
+        """Stores a copy of src in the cache entry for key."""
+        entry = self.entry(key)
+        entry.mkdir(parents=True, exist_ok=True)
+        dest = entry.joinpath(name)
+        tmp = self._tmp_path(dest)
+        shutil.copyfile(src, tmp)
+        size = tmp.stat().st_size
+        os.replace(tmp, dest)
+        if meta is not None:
+            dest = entry.joinpath("meta.json")
+            tmp = self._tmp_path(dest)
+            size += tmp.write_text(json.dumps(meta))
+            os.replace(tmp, dest)
+        log.info(f"cache put {key[:12]} {name}")
+        self.puts += 1
+        if self.estimated_bytes is not None:
+            self.estimated_bytes += size
+        if (
+            self.estimated_bytes is None
+            or self.estimated_bytes > self.max_bytes
+            or self.puts >= EVICT_PUTS
+        ):
+            self.evict()
+
+    def _tmp_path(self, dest: Path) -> Path:
+        return dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+
+    def size(self) -> int:
+        return sum(f.stat().st_size for f in self.root.rglob("*") if f.is_file())
+
+    def evict(self):
+        """Removes least recently used entries once the cache exceeds max_bytes.
+
+        Entries are removed until the cache fits EVICT_TARGET of max_bytes, so a
+        full cache is not scanned again on every put.
+        """
+        entries = []
+        for entry in self.root.iterdir():
+            if not entry.is_dir():
+                continue
+            try:
+                size = sum(f.stat().st_size for f in entry.iterdir())
+                entries.append((entry.stat().st_mtime, size, entry))
+            except FileNotFoundError:
+                continue
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            for _, size, entry in sorted(entries):
+                if total <= self.max_bytes * EVICT_TARGET:
+                    break
+                log.info(f"cache evict {entry.name[:12]} ({size} bytes)")
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+        self.estimated_bytes = total
+        self.puts = 0
+
+
+_caches: dict[Path, Cache] = {}
+
+
+def open_cache(root: Path, max_bytes: int) -> Cache:
+    """Returns the cache of the process for a cache directory.
+
+    The cache is kept for the life of the process, so its size is not scanned
+    again for every document.
+    """
+    cache = _caches.get(root)
+    if cache is None or cache.max_bytes != max_bytes:
+        cache = _caches[root] = Cache(root, max_bytes)
+    return cache
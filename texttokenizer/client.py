@@ -0,0 +1,110 @@
+import http.client
+import json
+import socket
+import time
+from collections.abc import Iterator
+from pathlib import Path
+from urllib.parse import urlencode, urlparse
+
+from .token import Token
+
+
+class ServerBusy(Exception):
+    """Raised when the server queue is full and retries are exhausted."""
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float | None = None):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class Client:
+    """Client of the texttokenizer server, over tcp (url) or a unix socket."""
+
+    def __init__(
+        self,
+        url: str = "http://127.0.0.1:8765",
+        socket: Path | None = None,
+        timeout: float | None = None,
+        retries: int = 3,
+        backoff: float = 0.5,
+    ):
+        self.url = urlparse(url)
+        self.socket = socket
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+    def connection(self) -> http.client.HTTPConnection:
+        if self.socket is not None:
+            return UnixHTTPConnection(str(self.socket), timeout=self.timeout)
+        return http.client.HTTPConnection(
+            self.url.hostname, self.url.port, timeout=self.timeout
+        )
+
+    def health(self) -> dict:
+        conn = self.connection()
+        try:
+            conn.request("GET", "/health")
+            return json.loads(conn.getresponse().read())
+        finally:
+            conn.close()
+
+    def tokenize(
+        self,
+        document: Path | bytes,
+        pages: str | None = None,
+        merge_bboxes: bool = False,
+        preprocess: str = "fast",
+    ) -> Iterator[tuple[int, list[Token]]]:
+        """Yields the tokens of each page as they are streamed back.
+
+        Requests rejected because the server queue is full are retried with
+        exponential backoff, then ServerBusy is raised.
+        """
+        data = document if isinstance(document, bytes) else document.read_bytes()
+        params = {"merge_bboxes": int(merge_bboxes), "preprocess": preprocess}
+        if pages:
+            params["pages"] = pages
+        path = f"/tokenize?{urlencode(params)}"
+        for attempt in range(self.retries + 1):
+            conn = self.connection()
+            try:
+                conn.request(
+                    "POST",
+                    path,
+                    body=data,
+                    headers={"Content-Type": "application/pdf"},
+                )
+                response = conn.getresponse()
+                if response.status == http.client.SERVICE_UNAVAILABLE:
+                    response.read()
+                    delay = float(response.getheader("Retry-After", self.backoff))
+                    time.sleep(max(delay, self.backoff * 2**attempt))
+                    continue
+                if response.status != http.client.OK:
+                    error = json.loads(response.read()).get("error")
+                    raise RuntimeError(f"tokenize failed ({response.status}): {error}")
+                for line in response:
+                    page = json.loads(line)
+                    yield page["page"], [token_from_dict(t) for t in page["tokens"]]
+                return
+            finally:
+                conn.close()
+        raise ServerBusy(f"server busy after {self.retries + 1} attempts")
+
+
+def token_from_dict(data: dict) -> Token:
+    return Token(
+        page=data["page"],
+        text=data["text"],
+        font=tuple(data["font"]),
+        origin=tuple(data["origin"]),
+        bbox=tuple(data["bbox"]),
+    )
@@ -0,0 +1,173 @@
+"""Binary columnar token format.
+
+A token file starts with the magic `TTOK`, a little endian uint32 format version
+and uint64 header length, followed by a json header and the column data. The
+header describes the token count, the fonts and texts dictionaries sizes, the
+[start, end) token range of each page and the dtype, shape and offset of each
+column. Columns are 64 byte aligned so they can be memory mapped in place, and
+coordinates are kept as float64 so tokens read back are identical to the
+tokens written:
+
+    page        int32   [n]
+    font_id     uint32  [n]     index into the fonts list in the header
+    font_size   float64 [n]
+    origin      float64 [n, 2]
+    bbox        float64 [n, 4]
+    text_id     uint32  [n]     index into the texts dictionary
+    text_offset int64   [t + 1] offsets of each distinct text in text_data
+    text_data   uint8   [...]   utf-8 encoded distinct texts
+"""
+
+import json
+import struct
+from pathlib import Path
+
+import numpy as np
+
+from .token import Token, TokenTable
+
+MAGIC = b"TTOK"
+VERSION = 1
+PREAMBLE = struct.Struct("<4sIQ")
+ALIGNMENT = 64
+
+
+def table_columns(table: TokenTable) -> dict[str, np.ndarray]:
+    """Returns the typed columns of a token table, in file order."""
+    texts = [text.encode() for text in table.texts]
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum([len(text) for text in texts], out=offsets[1:])
+    return {
+        "page": np.asarray(table.pages, dtype=np.int32),
+        "font_id": np.asarray(table.font_ids, dtype=np.uint32),
+        "font_size": np.asarray(table.font_sizes, dtype=np.float64),
+        "origin": np.asarray(table.origins, dtype=np.float64).reshape(-1, 2),
+        "bbox": np.asarray(table.bboxes, dtype=np.float64).reshape(-1, 4),
+        "text_id": np.asarray(table.text_ids, dtype=np.uint32),
+        "text_offset": offsets,
+        "text_data": np.frombuffer(b"".join(texts), dtype=np.uint8),
+    }
+
+
+def page_ranges(pages: np.ndarray) -> dict[str, list[int]]:
+    """Returns the [start, end) token range of each page in sorted page column."""
+    values, starts = np.unique(pages, return_index=True)
+    ends = np.append(starts[1:], len(pages))
+    return {str(p): [int(s), int(e)] for p, s, e in zip(values, starts, ends)}
+
+
+def align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_columnar(table: TokenTable, f):
+    """Writes the token table in the columnar format to a binary file object."""
+    columns = table_columns(table)
+    header = {
+        "count": len(table),
+        "fonts": table.fonts,
+        "texts": len(table.texts),
+        "pages": page_ranges(columns["page"]),
+        "columns": {},
+    }
+    # Column offsets depend on the header length, which depends on the offsets,
+    # so offsets are computed relative to the aligned end of the header.
+    offset = 0
+    for name, column in columns.items():
+        header["columns"][name] = {
+            "dtype": column.dtype.str,
+            "shape": list(column.shape),
+            "offset": offset,
+        }
+        offset = align(offset + column.nbytes)
+    data = json.dumps(header).encode()
+    start = align(PREAMBLE.size + len(data))
+    f.write(PREAMBLE.pack(MAGIC, VERSION, len(data)))
+    f.write(data)
+    f.write(b"\0" * (start - PREAMBLE.size - len(data)))
+    position = 0
+    for name, column in columns.items():
+        column_offset = header["columns"][name]["offset"]
+        f.write(b"\0" * (column_offset - position))
+        f.write(column.tobytes())
+        position = column_offset + column.nbytes
+
+
+class ColumnarTokenReader:
+    """Memory maps a columnar token file for random access by page.
+
+    Columns are numpy views of the mapped file, nothing is parsed or copied
+    until tokens are accessed. The tokens can also be read from an aligned
+    offset within a larger file, e.g. a dataset shard, whose mapping can be
+    shared by passing it as data.
+    """
+
+    def __init__(self, filename: Path, offset: int = 0, data: np.ndarray | None = None):
+        self.filename = filename
+        if data is None:
+            data = np.memmap(filename, dtype=np.uint8, mode="r")
+        self.data = data
+        magic, version, length = PREAMBLE.unpack_from(self.data, offset)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{filename} is not a version {VERSION} token file")
+        header_start = offset + PREAMBLE.size
+        self.header = json.loads(bytes(self.data[header_start : header_start + length]))
+        start = offset + align(PREAMBLE.size + length)
+        self.columns = {
+            name: np.frombuffer(
+                self.data,
+                dtype=np.dtype(spec["dtype"]),
+                count=int(np.prod(spec["shape"])),
+                offset=start + spec["offset"],
+            ).reshape(spec["shape"])
+            for name, spec in self.header["columns"].items()
+        }
+        self.fonts: list[str] = self.header["fonts"]
+        self.pages = {int(p): tuple(r) for p, r in self.header["pages"].items()}
+
+    def __len__(self) -> int:
+        return self.header["count"]
+
+    def text(self, text_id: int) -> str:
+        offsets = self.columns["text_offset"]
+        start, end = offsets[text_id], offsets[text_id + 1]
+        return bytes(self.columns["text_data"][start:end]).decode()
+
+    def page_columns(self, page: int) -> dict[str, np.ndarray]:
+        """Returns views of the per token columns of a page."""
+        start, end = self.pages.get(page, (0, 0))
+        return {
+            name: column[start:end]
+            for name, column in self.columns.items()
+            if not name.startswith("text_") or name == "text_id"
+        }
+
+    def token(self, i: int) -> Token:
+        return self.slice(i, i + 1)[0]
+
+    def tokens(self, page: int | None = None) -> list[Token]:
+        """Returns the tokens of a page, or of the whole file."""
+        start, end = (0, len(self)) if page is None else self.pages.get(page, (0, 0))
+        return self.slice(start, end)
+
+    def slice(self, start: int, end: int) -> list[Token]:
+        """Returns the tokens in the [start, end) range, converting whole columns."""
+        c = self.columns
+        texts = {i: self.text(i) for i in set(c["text_id"][start:end].tolist())}
+        return [
+            Token(
+                page=page,
+                text=texts[text_id],
+                font=(self.fonts[font_id], font_size),
+                origin=tuple(origin),
+                bbox=tuple(bbox),
+            )
+            for page, text_id, font_id, font_size, origin, bbox in zip(
+                c["page"][start:end].tolist(),
+                c["text_id"][start:end].tolist(),
+                c["font_id"][start:end].tolist(),
+                c["font_size"][start:end].tolist(),
+                c["origin"][start:end].tolist(),
+                c["bbox"][start:end].tolist(),
+            )
+        ]
@@ -0,0 +1,214 @@
+"""Sharded token datasets.
+
+A dataset is a directory of size bounded shard files, each holding the tokens of
+many documents as consecutive columnar token blocks (see `columnar`), and index
+files mapping each document id to its shard, offset and length, token count and
+page range, one json line per document.
+
+Each writer appends to its own shards and index, named after a unique writer id,
+so worker processes write to the same dataset concurrently without locking. A
+document block is assembled in memory and written with a single call before its
+index line, so a document is either fully indexed or not indexed at all.
+"""
+
+import json
+import os
+import secrets
+from collections.abc import Iterable, Iterator
+from dataclasses import asdict, dataclass
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+from loguru import logger as log
+
+from .columnar import ColumnarTokenReader, align, write_columnar
+from .token import Token, TokenTable
+
+SHARD_SUFFIX = ".ttok"
+INDEX_SUFFIX = ".index.jsonl"
+
+
+@dataclass(kw_only=True)
+class DocumentEntry:
+    """Location of the tokens of a document in a dataset."""
+
+    id: str
+    shard: str
+    offset: int
+    length: int
+    tokens: int
+    # First and last page with tokens.
+    pages: list[int] | None
+
+
+class DatasetWriter:
+    """Appends the tokens of documents to the shards of a dataset directory.
+
+    A new shard is started once the current one would grow past shard_bytes, a
+    document larger than that gets a shard of its own.
+    """
+
+    def __init__(self, directory: Path, shard_bytes: int = 256 * 2**20):
+        self.directory = directory
+        self.shard_bytes = shard_bytes
+        self.id = f"{os.getpid()}-{secrets.token_hex(4)}"
+        self.pid = os.getpid()
+        self.sequence = 0
+        self.shard = None
+        self.size = 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.index = open(self.directory.joinpath(f"{self.id}{INDEX_SUFFIX}"), "a")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.shard is not None:
+            self.shard.close()
+            self.shard = None
+        self.index.close()
+
+    def _roll(self):
+        if self.shard is not None:
+            self.shard.close()
+        name = f"{self.id}-{self.sequence:05d}{SHARD_SUFFIX}"
+        self.sequence += 1
+        self.shard = open(self.directory.joinpath(name), "wb")
+        self.size = 0
+        log.info(f"writing dataset shard {name}")
+
+    def add(self, doc_id: str, tokens: TokenTable | Iterable[Token]) -> DocumentEntry:
+        """Appends the tokens of a document, in page order, and indexes them."""
+        table = (
+            tokens if isinstance(tokens, TokenTable) else TokenTable.from_tokens(tokens)
+        )
+        block = BytesIO()
+        write_columnar(table, block)
+        data = block.getvalue()
+        if self.shard is None or (
+            self.size and align(self.size) + len(data) > self.shard_bytes
+        ):
+            self._roll()
+        # Blocks start aligned so their columns can be memory mapped in place.
+        offset = align(self.size)
+        self.shard.write(b"\0" * (offset - self.size) + data)
+        self.shard.flush()
+        self.size = offset + len(data)
+        entry = DocumentEntry(
+            id=doc_id,
+            shard=Path(self.shard.name).name,
+            offset=offset,
+            length=len(data),
+            tokens=len(table),
+            pages=[min(table.pages), max(table.pages)] if len(table) else None,
+        )
+        self.index.write(json.dumps(asdict(entry)) + "\n")
+        self.index.flush()
+        return entry
+
+
+class DatasetTokenSink:
+    """Collects the tokens of a document like a TokenSink, adding them to a dataset.
+
+    Tokens are only added once the sink is closed without an error.
+    """
+
+    def __init__(self, writer: DatasetWriter, doc_id: str):
+        self.writer = writer
+        self.doc_id = doc_id
+        self.table = TokenTable()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+
+    @property
+    def count(self) -> int:
+        return len(self.table)
+
+    def write(self, tokens: Iterable[Token]):
+        self.table.extend(tokens)
+
+    def close(self):
+        if self.table is None:
+            return
+        entry = self.writer.add(self.doc_id, self.table)
+        self.table = None
+        log.info(f"writing tokens of {self.doc_id} in dataset shard {entry.shard}")
+
+
+_writers: dict[Path, DatasetWriter] = {}
+
+
+def dataset_writer(directory: Path, shard_bytes: int) -> DatasetWriter:
+    """Returns the writer of the process for a dataset directory.
+
+    Writers are kept open across documents, a forked process gets a new one.
+    """
+    writer = _writers.get(directory)
+    if writer is None or writer.pid != os.getpid():
+        writer = _writers[directory] = DatasetWriter(directory, shard_bytes)
+    return writer
+
+
+class DatasetReader:
+    """Random access by document id to the tokens of a dataset.
+
+    Shards are memory mapped on first use. Index entries pointing past the end
+    of their shard, e.g. left by a crashed writer, are skipped.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.entries: dict[str, DocumentEntry] = {}
+        self.shards: dict[str, np.ndarray] = {}
+        sizes = {
+            shard.name: shard.stat().st_size
+            for shard in directory.glob(f"*{SHARD_SUFFIX}")
+        }
+        for index in sorted(directory.glob(f"*{INDEX_SUFFIX}")):
+            with open(index) as f:
+                for line in f:
+                    try:
+                        entry = DocumentEntry(**json.loads(line))
+                    except (ValueError, TypeError):
+                        log.warning(f"skipping invalid entry in {index.name}")
+                        continue
+                    if entry.offset + entry.length > sizes.get(entry.shard, 0):
+                        log.warning(f"skipping truncated document {entry.id}")
+                        continue
+                    if entry.id in self.entries:
+                        log.warning(f"duplicate document {entry.id} in {index.name}")
+                    self.entries[entry.id] = entry
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.entries
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.entries)
+
+    def document(self, doc_id: str) -> ColumnarTokenReader:
+        """Returns a reader over the tokens of a document, by page or range."""
+        entry = self.entries[doc_id]
+        data = self.shards.get(entry.shard)
+        if data is None:
+            filename = self.directory.joinpath(entry.shard)
+            data = self.shards[entry.shard] = np.memmap(
+                filename, dtype=np.uint8, mode="r"
+            )
+        return ColumnarTokenReader(
+            self.directory.joinpath(entry.shard), offset=entry.offset, data=data
+        )
+
+    def tokens(self, doc_id: str, page: int | None = None) -> list[Token]:
+        return self.document(doc_id).tokens(page)
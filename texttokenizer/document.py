@@ -1,13 +1,11 @@
-import csv
-import json
 from dataclasses import dataclass, field
 from pathlib import Path
 
 import fitz
-from loguru import logger as log
 
-from .token import Font, Token
-from .util import expand_page_list
+from .sink import CsvTokenSink, TemplatizerTokenSink
+from .token import Font
+from .util import PdfBuffer, PdfSource, as_bytes, expand_page_list, open_pdf
 
 
 @dataclass(kw_only=True)
@@ -17,35 +15,48 @@ class Document:
     # These attributes are needed at instantiation.
     filename: Path
     pages: str | None
+    # The pdf contents when held in memory, the filename then only names it.
+    data: bytes | None = None
 
     # These attributes are populated through the phases.
     pdf_doc: fitz.Document | None
     page_indices: list[int] = field(default_factory=list)
     tokens: list = field(default_factory=list)
+    # Number of tokens extracted, also counted when tokens are streamed to a sink.
+    token_count: int = 0
     fonts: set[Font] = field(default_factory=set)
+    # Per page preprocessing path, populated by Preprocessor.preprocess.
+    page_reports: list = field(default_factory=list)
 
     def __post_init__(self):
-        self.update_pdf_doc(self.filename)
+        self.update_pdf_doc(self.source)
 
-    def update_pdf_doc(self, filename: Path):
+    @classmethod
+    def from_buffer(
+        cls, data: PdfBuffer, filename: Path = Path("document.pdf"), pages=None
+    ) -> "Document":
+        """Returns a document of an in memory pdf, named filename in outputs."""
+        return cls(filename=filename, pages=pages, pdf_doc=None, data=as_bytes(data))
+
+    @property
+    def source(self) -> PdfSource:
+        """The pdf contents if held in memory, its filename otherwise."""
+        return self.data if self.data is not None else self.filename
+
+    def update_pdf_doc(self, source: PdfSource):
         if self.pdf_doc:
             self.pdf_doc.close()
-        self.filename = filename
-        self.pdf_doc = fitz.open(self.filename)
+        if isinstance(source, Path):
+            self.filename, self.data = source, None
+        else:
+            self.data = as_bytes(source)
+        self.pdf_doc = open_pdf(source)
         self.page_indices = expand_page_list(self.pages, len(self.pdf_doc) - 1)
 
     def save_templatizer_tokens(self, filename: Path):
-        data = {}
-        for i, token in enumerate(self.tokens):
-            data[f"token_{i}"] = [token.as_templatizer_dict()]
-        with open(filename, "w") as f:
-            f.write(json.dumps(data))
-        log.info(f"writing tokens in {filename}")
+        with TemplatizerTokenSink(filename) as sink:
+            sink.write(self.tokens)
 
     def save_csv_tokens(self, filename: Path):
-        with open(filename, "w") as f:
-            writer = csv.writer(f)
-            writer.writerow(Token.csv_headers())
-            for token in self.tokens:
-                writer.writerow(token.as_csv_row())
-        log.info(f"writing tokens in {filename}")
+        with CsvTokenSink(filename) as sink:
+            sink.write(self.tokens)
@@ -0,0 +1,58 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from loguru import logger as log
+
+INDEX = "index.json"
+
+
+class FontStore:
+    """A content addressed store of font files.
+
+    Fonts are stored once per distinct font buffer as `<sha256>.<ext>`, so the same
+    embedded font extracted from many pages or documents is written only once
+    when documents share a store.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def add(self, buffer: bytes, ext: str) -> Path:
+        """Stores the font buffer if not already present, returns its path."""
+        digest = hashlib.sha256(buffer).hexdigest()
+        filename = self.root.joinpath(digest).with_suffix(f".{ext}")
+        if not filename.exists():
+            self.root.mkdir(parents=True, exist_ok=True)
+            # Written atomically as workers may add the same font concurrently.
+            tmp = filename.with_name(f".{filename.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(buffer)
+            os.replace(tmp, filename)
+            log.info(f"writing font {filename}")
+        return filename
+
+
+def write_font_index(fonts_dir: Path, index: dict[int, dict[str, Path]]):
+    """Writes the page index -> font name -> font file index of a document."""
+    fonts_dir.mkdir(parents=True, exist_ok=True)
+    data = {
+        str(idx): {name: str(path) for name, path in fonts.items()}
+        for idx, fonts in index.items()
+    }
+    filename = fonts_dir.joinpath(INDEX)
+    filename.write_text(json.dumps(data, indent=2))
+    log.info(f"writing font index {filename}")
+
+
+def read_font_index(fonts_dir: Path) -> dict[int, dict[str, Path]]:
+    """Reads the font index of a document written by write_font_index."""
+    filename = fonts_dir.joinpath(INDEX)
+    if not filename.exists():
+        log.warning(f"font index {filename} not found")
+        return {}
+    data = json.loads(filename.read_text())
+    return {
+        int(idx): {name: Path(path) for name, path in fonts.items()}
+        for idx, fonts in data.items()
+    }
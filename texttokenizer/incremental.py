@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+from collections.abc import Iterator
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import fitz
+from loguru import logger as log
+
+from .columnar import ColumnarTokenReader
+from .document import Document
+from .processor import Processor
+from .sink import ColumnarTokenSink
+from .token import Token
+
+# Bump to invalidate manifests when the tokenization code changes its output.
+MANIFEST_VERSION = 1
+
+
+@dataclass(kw_only=True)
+class PageEntry:
+    """The content digest of a page and the range of its tokens in the store."""
+
+    digest: str
+    start: int
+    end: int
+
+
+@dataclass(kw_only=True)
+class Manifest:
+    options: str
+    pages: dict[int, PageEntry]
+
+
+def options_digest(**options) -> str:
+    """Returns a digest of the options that affect the tokens of a page."""
+    data = json.dumps(
+        {"version": MANIFEST_VERSION, "options": options}, sort_keys=True, default=str
+    )
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def page_digest(doc: fitz.Document, idx: int, xrefs: dict[int, str]) -> str:
+    """Returns a digest of everything on the page that text extraction reads.
+
+    This covers the page geometry, its content streams and the fonts and form
+    xobjects it uses, identified by content rather than xref numbers so that a
+    rewritten file with the same pages has the same digests. Digests of shared
+    xrefs are memoized in xrefs.
+    """
+
+    def xref_digest(xref: int) -> str:
+        if xref not in xrefs:
+            if doc.xref_is_stream(xref):
+                data = doc.xref_stream_raw(xref)
+            else:
+                # Font dictionaries, digested by their embedded font file.
+                data = doc.extract_font(xref)[3] or b""
+            xrefs[xref] = hashlib.sha256(data).hexdigest()
+        return xrefs[xref]
+
+    page = doc[idx]
+    digest = hashlib.sha256()
+    geometry = (page.rotation, tuple(page.mediabox), tuple(page.cropbox))
+    digest.update(repr(geometry).encode())
+    digest.update(page.read_contents())
+    for xref, ext, kind, basefont, name, encoding, *_ in doc.get_page_fonts(idx):
+        digest.update(repr((ext, kind, basefont, name, encoding)).encode())
+        digest.update(xref_digest(xref).encode())
+    for xref, name, *_ in doc.get_page_xobjects(idx):
+        digest.update(name.encode())
+        digest.update(xref_digest(xref).encode())
+    return digest.hexdigest()
+
+
+def read_manifest(filename: Path) -> Manifest | None:
+    if not filename.exists():
+        return None
+    data = json.loads(filename.read_text())
+    if data.get("version") != MANIFEST_VERSION:
+        return None
+    return Manifest(
+        options=data["options"],
+        pages={int(idx): PageEntry(**entry) for idx, entry in data["pages"].items()},
+    )
+
+
+def write_manifest(filename: Path, manifest: Manifest):
+    data = {"version": MANIFEST_VERSION, **asdict(manifest)}
+    tmp = filename.with_name(f".{filename.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data, indent=2))
+    os.replace(tmp, filename)
+    log.info(f"writing manifest {filename}")
+
+
+def iter_tokens_incremental(
+    processor: Processor,
+    document: Document,
+    store: Path,
+    manifest_file: Path,
+    options: str,
+    merge_bboxes: bool = False,
+    workers: int = 1,
+) -> Iterator[tuple[int, list[Token]]]:
+    """Yields the tokens of each page, only tokenizing pages that changed.
+
+    The tokens of all pages are kept in a columnar store, with a manifest of
+    each page's content digest and token range. Pages whose digest and options
+    match the manifest of a previous run are read back from the store, the
+    other pages are tokenized by the processor. The store and manifest are
+    replaced once all pages are yielded.
+    """
+    xrefs: dict[int, str] = {}
+    digests = {
+        idx: page_digest(document.pdf_doc, idx, xrefs) for idx in document.page_indices
+    }
+    manifest = read_manifest(manifest_file)
+    reader = None
+    reused, kept = {}, {}
+    if manifest is not None and manifest.options == options and store.exists():
+        reader = ColumnarTokenReader(store)
+        reused = {
+            idx: manifest.pages[idx]
+            for idx, digest in digests.items()
+            if idx in manifest.pages and manifest.pages[idx].digest == digest
+        }
+        # Pages not requested in this run are carried over for later runs,
+        # unless the document no longer has them.
+        page_count = len(document.pdf_doc)
+        kept = {
+            idx: entry
+            for idx, entry in manifest.pages.items()
+            if idx not in digests and idx < page_count
+        }
+    changed = [idx for idx in document.page_indices if idx not in reused]
+    log.info(f"reusing tokens of {len(reused)} pages, tokenizing {len(changed)} pages")
+
+    tokenized = processor.iter_tokens(
+        document, merge_bboxes=merge_bboxes, workers=workers, page_indices=changed
+    )
+    pages = {}
+    tmp = store.with_name(f".{store.name}.{os.getpid()}.tmp")
+    with ColumnarTokenSink(tmp) as sink:
+        for idx in sorted(digests.keys() | kept.keys()):
+            if idx in kept:
+                entry = kept[idx]
+                start = sink.count
+                sink.write(reader.slice(entry.start, entry.end))
+                pages[idx] = PageEntry(digest=entry.digest, start=start, end=sink.count)
+                continue
+            if idx in reused:
+                tokens = reader.slice(reused[idx].start, reused[idx].end)
+                document.token_count += len(tokens)
+            else:
+                _, tokens = next(tokenized)
+            start = sink.count
+            sink.write(tokens)
+            pages[idx] = PageEntry(digest=digests[idx], start=start, end=sink.count)
+            yield idx, tokens
+    # Exhausts the processor so it finalizes the document.
+    for _ in tokenized:
+        pass
+    del reader
+    os.replace(tmp, store)
+    write_manifest(manifest_file, Manifest(options=options, pages=pages))
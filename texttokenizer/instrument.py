@@ -0,0 +1,183 @@
+import cProfile
+import json
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from importlib import metadata
+from pathlib import Path
+
+from loguru import logger as log
+
+# ru_maxrss is reported in kilobytes on linux and in bytes on macos.
+RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+def peak_rss() -> int:
+    """Returns the peak resident set size of the process in bytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT
+
+
+def package_version() -> str:
+    try:
+        return metadata.version("texttokenizer")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+@dataclass(kw_only=True)
+class StageStats:
+    """Totals of the runs of a stage.
+
+    `process_peak_rss_bytes` is the peak rss of the whole process as of the end
+    of the stage, not the memory used by the stage, which is measured by
+    `peak_traced_bytes` for the python heap.
+    """
+
+    calls: int = 0
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    process_peak_rss_bytes: int = 0
+    peak_traced_bytes: int = 0
+
+    def merge(self, other: "StageStats"):
+        self.calls += other.calls
+        self.wall_seconds += other.wall_seconds
+        self.cpu_seconds += other.cpu_seconds
+        self.process_peak_rss_bytes = max(
+            self.process_peak_rss_bytes, other.process_peak_rss_bytes
+        )
+        self.peak_traced_bytes = max(self.peak_traced_bytes, other.peak_traced_bytes)
+
+
+class Profiler:
+    """Collects per stage wall time, cpu time and the process peak memory.
+
+    Stages are named phases of the pipeline (preprocess, get_text, convert, merge,
+    fonts, render, draw, save, index). Collection is disabled by default, leaving
+    only the overhead of entering a context manager. When enabled, stages can also
+    be run under cProfile (stats dumped per stage) and tracemalloc (peak python
+    heap usage per stage).
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.use_cprofile = False
+        self.use_tracemalloc = False
+        self.stats: dict[str, StageStats] = {}
+        self.cprofiles: dict[str, cProfile.Profile] = {}
+        self._profiling = False
+        # Traced peaks of the enclosing stages, before nested stages reset it.
+        self._traced_peaks: list[int] = []
+
+    def enable(self, cprofile: bool = False, tracemalloc: bool = False):
+        self.enabled = True
+        self.use_cprofile = cprofile
+        self.use_tracemalloc = tracemalloc
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        profile = None
+        # Only one cProfile profiler can be active at a time, nested stages are
+        # accounted to the outer stage.
+        if self.use_cprofile and not self._profiling:
+            profile = self.cprofiles.setdefault(name, cProfile.Profile())
+            self._profiling = True
+            profile.enable()
+        if self.use_tracemalloc:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if self._traced_peaks:
+                outer = tracemalloc.get_traced_memory()[1]
+                self._traced_peaks[-1] = max(self._traced_peaks[-1], outer)
+            self._traced_peaks.append(0)
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            stats = self.stats.setdefault(name, StageStats())
+            stats.calls += 1
+            stats.wall_seconds += time.perf_counter() - wall
+            stats.cpu_seconds += time.process_time() - cpu
+            stats.process_peak_rss_bytes = max(stats.process_peak_rss_bytes, peak_rss())
+            if self.use_tracemalloc:
+                traced = max(
+                    self._traced_peaks.pop(), tracemalloc.get_traced_memory()[1]
+                )
+                stats.peak_traced_bytes = max(stats.peak_traced_bytes, traced)
+                # The peak of a nested stage is also a peak of the enclosing one.
+                if self._traced_peaks:
+                    self._traced_peaks[-1] = max(self._traced_peaks[-1], traced)
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+
+    def collect(self) -> dict[str, dict]:
+        """Returns the collected stats and resets them, e.g. to send to a parent."""
+        stats = {name: asdict(s) for name, s in self.stats.items()}
+        self.stats = {}
+        return stats
+
+    def merge(self, stats: dict[str, dict]):
+        """Merges stats collected in another process."""
+        for name, data in stats.items():
+            self.stats.setdefault(name, StageStats()).merge(StageStats(**data))
+
+    def report(self) -> dict:
+        return {
+            "version": package_version(),
+            "peak_rss_bytes": peak_rss(),
+            "stages": {name: asdict(s) for name, s in self.stats.items()},
+        }
+
+    def prometheus(self) -> str:
+        """Returns the report in the prometheus text exposition format."""
+        metrics = [
+            ("calls", "calls_total", "counter", "number of stage runs"),
+            ("wall_seconds", "wall_seconds_total", "counter", "stage wall time"),
+            ("cpu_seconds", "cpu_seconds_total", "counter", "stage cpu time"),
+            (
+                "process_peak_rss_bytes",
+                "process_peak_rss_bytes",
+                "gauge",
+                "process peak rss after stage",
+            ),
+            ("peak_traced_bytes", "peak_traced_bytes", "gauge", "peak traced heap"),
+        ]
+        version = package_version()
+        lines = []
+        for field, metric, kind, help in metrics:
+            name = f"texttokenizer_stage_{metric}"
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for stage, stats in self.stats.items():
+                value = getattr(stats, field)
+                labels = f'stage="{stage}",version="{version}"'
+                lines.append(f"{name}{{{labels}}} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, filename: Path, format: str = "json"):
+        """Writes the report as json or prometheus textfile, with cProfile dumps."""
+        if format == "prometheus":
+            filename.write_text(self.prometheus())
+        else:
+            filename.write_text(json.dumps(self.report(), indent=2))
+        log.info(f"writing profile {filename}")
+        for stage, profile in self.cprofiles.items():
+            dump = filename.with_name(f"{filename.with_suffix('').name}-{stage}.prof")
+            profile.dump_stats(dump)
+            log.info(f"writing cprofile {dump}")
+
+
+profiler = Profiler()
+
+
+def stage(name: str):
+    """Returns a context manager accounting the enclosed code to the named stage."""
+    return profiler.stage(name)
@@ -0,0 +1,333 @@
+"""Run journals for resumable batch runs.
+
+A journal is an append-only json lines file recording the progress of runs over
+a corpus: each run, the documents begun with the hash of their input, the stages
+completed, the temp files created and the documents done or failed. Records are
+buffered and written and fsynced in batches, a crash loses at most the records
+of the last batch and only their work is redone.
+
+Every process appends its records with single O_APPEND writes of whole lines,
+so batch workers record the stages of their documents in the same journal the
+parent records the outcomes in. Rerunning with the same journal skips documents
+done with an unchanged input, reuses the outputs of stages completed by
+interrupted documents and removes the temp files and partial outputs they left.
+Documents that finish remove their temp files and preprocessed output.
+"""
+
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from loguru import logger as log
+
+from .cache import file_digest
+
+RUN = "run"
+BEGIN = "begin"
+STAGE = "stage"
+TEMP = "temp"
+DONE = "done"
+FAILED = "failed"
+
+PREPROCESS = "preprocess"
+TOKENIZE = "tokenize"
+ANNOTATE = "annotate"
+
+
+def input_stat(filename: Path) -> dict:
+    """Returns the size and modification time identifying an unchanged input."""
+    stat = filename.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+@dataclass(kw_only=True)
+class DocumentState:
+    """Progress of a document over all the runs of a journal."""
+
+    digest: str | None = None
+    # Outputs of the stages completed for the input digest, by stage.
+    stages: dict[str, str | None] = field(default_factory=dict)
+    # Temp files and outputs created by attempts that were not done.
+    temps: list[str] = field(default_factory=list)
+    done: dict | None = None
+    error: str | None = None
+
+
+class JournalState:
+    """The state of a journal, built by replaying its records."""
+
+    def __init__(self):
+        self.documents: dict[str, DocumentState] = {}
+        self.run: dict = {}
+        # Documents and pages done since the start of the last run.
+        self.run_documents = 0
+        self.run_pages = 0
+
+    @classmethod
+    def load(cls, filename: Path) -> "JournalState":
+        state = cls()
+        if not filename.exists():
+            return state
+        with open(filename) as f:
+            for line in f:
+                try:
+                    state.apply(json.loads(line))
+                except (ValueError, KeyError):
+                    # The last line of a crashed run may be cut short.
+                    log.warning(f"skipping invalid record in journal {filename}")
+        return state
+
+    def document(self, filename: str) -> DocumentState:
+        doc = self.documents.get(filename)
+        if doc is None:
+            doc = self.documents[filename] = DocumentState()
+        return doc
+
+    def apply(self, record: dict):
+        event = record["event"]
+        if event == RUN:
+            self.run = record
+            self.run_documents = self.run_pages = 0
+            return
+        doc = self.document(record["document"])
+        if event == BEGIN:
+            if record["digest"] != doc.digest:
+                doc.digest = record["digest"]
+                doc.stages.clear()
+            doc.done = None
+        elif event == STAGE:
+            if record["digest"] == doc.digest:
+                doc.stages[record["stage"]] = record.get("output")
+        elif event == TEMP:
+            doc.temps.append(record["path"])
+        elif event == DONE:
+            doc.done = record
+            doc.error = None
+            doc.temps.clear()
+            self.run_documents += 1
+            self.run_pages += record["pages"]
+        elif event == FAILED:
+            doc.error = record["error"]
+        else:
+            raise KeyError(event)
+
+    def is_done(self, filename: Path) -> bool:
+        """Returns true if the document is done and its input did not change since.
+
+        The input is only hashed again when its size or mtime changed.
+        """
+        doc = self.documents.get(str(filename))
+        if doc is None or doc.done is None:
+            return False
+        try:
+            stat = input_stat(filename)
+        except OSError:
+            return False
+        if all(doc.done.get(key) == value for key, value in stat.items()):
+            return True
+        return stat["size"] == doc.done.get("size") and (
+            file_digest(filename) == doc.digest
+        )
+
+    def stage_output(self, filename: Path, digest: str, stage: str) -> Path | None:
+        """Returns the existing output of a stage completed for the input digest."""
+        doc = self.documents.get(str(filename))
+        if doc is None or doc.digest != digest or doc.stages.get(stage) is None:
+            return None
+        output = Path(doc.stages[stage])
+        return output if output.exists() else None
+
+    def orphans(self) -> list[Path]:
+        """Returns the temp files left by documents that were not done.
+
+        Outputs of completed stages are kept for reuse.
+        """
+        paths = []
+        for doc in self.documents.values():
+            if doc.done is not None:
+                continue
+            outputs = set(doc.stages.values())
+            paths.extend(Path(p) for p in doc.temps if p not in outputs)
+        return list(dict.fromkeys(paths))
+
+    def finished_temps(self, filename: Path) -> list[Path]:
+        """Returns the temp files of a finished document, except its token output."""
+        doc = self.documents.get(str(filename))
+        if doc is None:
+            return []
+        output = doc.stages.get(TOKENIZE)
+        return list(dict.fromkeys(Path(p) for p in doc.temps if p != output))
+
+    def progress(self, now: float | None = None) -> dict:
+        """Returns the progress, throughput and ETA of the last run."""
+        now = time.time() if now is None else now
+        total = self.run.get("documents", 0)
+        done = self.run.get("skipped", 0) + self.run_documents
+        elapsed = max(now - self.run.get("time", now), 1e-9)
+        rate = self.run_documents / elapsed
+        remaining = max(total - done, 0)
+        return {
+            "documents": total,
+            "done": done,
+            "remaining": remaining,
+            "seconds": elapsed,
+            "documents_per_second": rate,
+            "pages_per_second": self.run_pages / elapsed,
+            "eta_seconds": remaining / rate if rate else None,
+        }
+
+
+class Journal:
+    """Appends records to a journal file, fsyncing them in batches.
+
+    Records are written once `sync_records` are pending or the oldest pending
+    one is `sync_seconds` old, and on sync. The state of the journal as loaded
+    when opened is kept in `state` and updated with the records of this process.
+    """
+
+    def __init__(
+        self,
+        filename: Path,
+        sync_records: int = 64,
+        sync_seconds: float = 1.0,
+        state: JournalState | None = None,
+    ):
+        self.filename = filename
+        self.sync_records = sync_records
+        self.sync_seconds = sync_seconds
+        self.state = JournalState.load(filename) if state is None else state
+        self.pid = os.getpid()
+        self.pending: list[str] = []
+        self.pending_since = 0.0
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        self.fd = os.open(filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.fd is None:
+            return
+        self.sync()
+        os.close(self.fd)
+        self.fd = None
+
+    def sync(self):
+        if not self.pending:
+            return
+        os.write(self.fd, "".join(self.pending).encode())
+        os.fsync(self.fd)
+        self.pending.clear()
+
+    def record(self, event: str, **data):
+        record = {"event": event, "time": time.time(), **data}
+        self.state.apply(record)
+        if not self.pending:
+            self.pending_since = record["time"]
+        self.pending.append(json.dumps(record) + "\n")
+        if (
+            len(self.pending) >= self.sync_records
+            or record["time"] - self.pending_since >= self.sync_seconds
+        ):
+            self.sync()
+
+    def begin(self, filename: Path, digest: str):
+        self.record(BEGIN, document=str(filename), digest=digest)
+
+    def stage(self, filename: Path, digest: str, stage: str, output: Path | None):
+        self.record(
+            STAGE,
+            document=str(filename),
+            digest=digest,
+            stage=stage,
+            output=None if output is None else str(output),
+        )
+
+    def temp(self, filename: Path, path: Path):
+        self.record(TEMP, document=str(filename), path=str(path))
+
+    def done(self, filename: Path, pages: int, tokens: int, seconds: float):
+        try:
+            stat = input_stat(filename)
+        except OSError:
+            stat = {}
+        self.record(
+            DONE,
+            document=str(filename),
+            pages=pages,
+            tokens=tokens,
+            seconds=seconds,
+            **stat,
+        )
+
+    def remove_temps(self, filename: Path):
+        """Removes the temp files and preprocessed output of a finished document.
+
+        Only its token output is kept, a rerun skips the document once it is done.
+        """
+        for path in self.state.finished_temps(filename):
+            if remove_temp(path):
+                log.info(f"removed {path}")
+
+    def failed(self, filename: Path, error: str):
+        self.record(FAILED, document=str(filename), error=error)
+
+    def resume(self, filenames: list[Path]) -> list[Path]:
+        """Starts a run over the documents, returning the ones not done yet.
+
+        Temp files left by interrupted documents are removed first.
+        """
+        for path in self.state.orphans():
+            if remove_temp(path):
+                log.info(f"removed orphaned {path}")
+        pending = [f for f in filenames if not self.state.is_done(f)]
+        skipped = len(filenames) - len(pending)
+        if skipped:
+            log.info(f"skipping {skipped} documents done in a previous run")
+        self.record(RUN, documents=len(filenames), skipped=skipped)
+        self.sync()
+        return pending
+
+
+def remove_temp(path: Path) -> bool:
+    """Removes a temp file or directory, returns false if it doesn't exist."""
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    elif path.exists():
+        path.unlink()
+    else:
+        return False
+    return True
+
+
+_journals: dict[Path, Journal] = {}
+
+
+def open_journal(filename: Path) -> Journal:
+    """Returns the journal of the process for a journal file.
+
+    A forked process gets its own journal, sharing the state loaded by the parent.
+    """
+    journal = _journals.get(filename)
+    if journal is None:
+        journal = _journals[filename] = Journal(filename)
+    elif journal.pid != os.getpid():
+        # Pending records are the parent's to write.
+        journal = _journals[filename] = Journal(filename, state=journal.state)
+    return journal
+
+
+def log_progress(progress: dict):
+    eta = progress["eta_seconds"]
+    log.info(
+        f"progress {progress['done']}/{progress['documents']} documents - "
+        f"{progress['documents_per_second']:.2f} docs/s, "
+        f"{progress['pages_per_second']:.2f} pages/s, "
+        f"eta {'unknown' if eta is None else f'{eta / 60:.1f}m'}"
+    )
@@ -0,0 +1,134 @@
+"""Reading order layout of fitz pages.
+
+fitz groups the characters of a page into spans, lines and blocks in a single
+extraction pass. The layout engine keeps that hierarchy rather than flattening
+the spans and rediscovering lines from their bboxes: tokens are read block by
+block and line by line, and spans are merged within their line only.
+
+Blocks are ordered by recursive XY cuts. A group of blocks is split at vertical
+gutters into columns read left to right, or else at horizontal gaps into bands
+read top to bottom, until its blocks can't be separated and are read top to
+bottom. Blocks on both sides of a gutter that line up row by row are a table
+rather than columns, they are split into rows first.
+"""
+
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+
+import fitz
+
+from .token import Token
+
+# Extraction flags of the "dict" mode without images, whose pixel data is never
+# used for tokens.
+TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+BBox = tuple[float, float, float, float]
+
+
+def split(boxes: list[BBox], group: list[int], axis: int, gap: float):
+    """Splits a group of boxes where their projections on axis are gap apart.
+
+    Returns the groups in increasing coordinate order.
+    """
+    group = sorted(group, key=lambda i: boxes[i][axis])
+    groups = [[group[0]]]
+    end = boxes[group[0]][axis + 2]
+    for i in group[1:]:
+        if boxes[i][axis] > end + gap:
+            groups.append([])
+        groups[-1].append(i)
+        end = max(end, boxes[i][axis + 2])
+    return groups
+
+
+@dataclass(kw_only=True)
+class LayoutEngine:
+    """Produces the tokens of a page in reading order from the fitz text hierarchy.
+
+    `column_gap` is the minimum width of a gutter between columns and `band_gap`
+    the minimum height of a gap between bands, in points. Blocks are rows of a
+    table when more than `table_alignment` of the blocks of the smaller side of
+    a gutter have a block on the other side within `row_tolerance` vertically.
+    With merging, spans on the same line with the same font and at most
+    `gap_tolerance` apart are merged into one token.
+    """
+
+    column_gap: float = 8.0
+    band_gap: float = 1.0
+    table_alignment: float = 0.5
+    row_tolerance: float = 2.0
+    gap_tolerance: float = 0.5
+    flags: int = TEXT_FLAGS
+
+    def blocks(self, page: fitz.Page) -> list[dict]:
+        """Returns the text blocks of the page in fitz order."""
+        blocks = page.get_text("dict", flags=self.flags)["blocks"]
+        return [block for block in blocks if block.get("lines")]
+
+    def is_table(self, boxes: list[BBox], columns: list[list[int]]) -> bool:
+        """Returns true if the blocks on both sides of each gutter line up by rows."""
+        tolerance = self.row_tolerance
+        for left, right in zip(columns, columns[1:]):
+            smaller, other = sorted((left, right), key=len)
+            rows = sorted((boxes[i][1], boxes[i][3]) for i in other)
+            tops = [y0 for y0, _ in rows]
+            aligned = 0
+            for i in smaller:
+                _, y0, _, y1 = boxes[i]
+                start = bisect_left(tops, y0 - tolerance)
+                end = bisect_right(tops, y0 + tolerance)
+                aligned += any(abs(y1 - b) <= tolerance for _, b in rows[start:end])
+            if aligned > len(smaller) * self.table_alignment:
+                return True
+        return False
+
+    def reading_order(self, boxes: list[BBox]) -> list[int]:
+        """Returns the indices of the block boxes in reading order."""
+
+        def cut(group: list[int]) -> list[int]:
+            if len(group) <= 1:
+                return group
+            columns = split(boxes, group, 0, self.column_gap)
+            if len(columns) > 1 and not self.is_table(boxes, columns):
+                return [i for column in columns for i in cut(column)]
+            bands = split(boxes, group, 1, self.band_gap)
+            if len(bands) > 1:
+                return [i for band in bands for i in cut(band)]
+            if len(columns) > 1:
+                # A single row of table cells.
+                return [i for column in columns for i in cut(column)]
+            return sorted(group, key=lambda i: (boxes[i][1], boxes[i][0]))
+
+        return cut(list(range(len(boxes))))
+
+    def lines(self, blocks: list[dict]) -> list[list[dict]]:
+        """Returns the spans of each line of the blocks, in reading order."""
+        order = self.reading_order([tuple(block["bbox"]) for block in blocks])
+        return [line["spans"] for i in order for line in blocks[i]["lines"]]
+
+    def merge_line(self, tokens: list[Token]) -> list[Token]:
+        """Merges runs of adjacent same font tokens of a line."""
+        merged = tokens[:1]
+        for token in tokens[1:]:
+            last = merged[-1]
+            if (
+                token.font == last.font
+                and abs(token.bbox[0] - last.bbox[2]) <= self.gap_tolerance
+            ):
+                x0, y0, x1, y1 = last.bbox
+                merged[-1] = Token(
+                    page=last.page,
+                    text=f"{last.text} {token.text}",
+                    font=last.font,
+                    origin=last.origin,
+                    bbox=(
+                        min(x0, token.bbox[0]),
+                        min(y0, token.bbox[1]),
+                        max(x1, token.bbox[2]),
+                        max(y1, token.bbox[3]),
+                    ),
+                )
+            else:
+                merged.append(token)
+        return merged
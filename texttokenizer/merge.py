@@ -0,0 +1,95 @@
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import numpy as np
+
+from .token import Token
+from .util import merge_bboxes
+
+Merger = Callable[[list[Token]], list[Token]]
+
+
+@dataclass(kw_only=True)
+class LineMerger:
+    """Merges tokens into runs on the same line using vectorized bbox operations.
+
+    Tokens are grouped into lines by page and baseline (origin y) within
+    `baseline_tolerance`. Within a line, horizontally adjacent tokens with the same
+    font are merged into a single token when the gap between them is within
+    `gap_tolerance`. Each run is merged in one pass, producing tokens in line order.
+    """
+
+    baseline_tolerance: float = 0.5
+    gap_tolerance: float = 0.5
+
+    def __call__(self, tokens: list[Token]) -> list[Token]:
+        if not tokens:
+            return []
+        font_ids: dict = {}
+        fonts = np.array([font_ids.setdefault(t.font, len(font_ids)) for t in tokens])
+        pages = np.array([t.page for t in tokens])
+        bboxes = np.array([t.bbox for t in tokens], dtype=np.float64).reshape(-1, 4)
+        baselines = np.array([t.origin[1] for t in tokens], dtype=np.float64)
+
+        # Group tokens into lines: sort by page and baseline and start a new line
+        # whenever the page changes or the baseline jumps beyond the tolerance.
+        order = np.lexsort((baselines, pages))
+        line_break = np.ones(len(tokens), dtype=bool)
+        line_break[1:] = (np.diff(pages[order]) != 0) | (
+            np.diff(baselines[order]) > self.baseline_tolerance
+        )
+        lines = np.empty(len(tokens), dtype=np.int64)
+        lines[order] = np.cumsum(line_break)
+
+        # Order tokens left to right within each line and split the line into runs
+        # of same font tokens separated by no more than the gap tolerance.
+        order = np.lexsort((bboxes[:, 0], lines))
+        sorted_bboxes = bboxes[order]
+        gaps = sorted_bboxes[1:, 0] - sorted_bboxes[:-1, 2]
+        run_break = np.ones(len(tokens), dtype=bool)
+        run_break[1:] = (
+            (np.diff(lines[order]) != 0)
+            | (np.diff(fonts[order]) != 0)
+            | (np.abs(gaps) > self.gap_tolerance)
+        )
+        starts = np.flatnonzero(run_break)
+        ends = np.append(starts[1:], len(tokens))
+
+        x0 = np.minimum.reduceat(sorted_bboxes[:, 0], starts)
+        y0 = np.minimum.reduceat(sorted_bboxes[:, 1], starts)
+        x1 = np.maximum.reduceat(sorted_bboxes[:, 2], starts)
+        y1 = np.maximum.reduceat(sorted_bboxes[:, 3], starts)
+
+        merged = []
+        for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+            first = tokens[order[start]]
+            if end - start == 1:
+                merged.append(first)
+                continue
+            text = " ".join(tokens[j].text for j in order[start:end])
+            bbox = (float(x0[i]), float(y0[i]), float(x1[i]), float(y1[i]))
+            merged.append(
+                Token(
+                    page=first.page,
+                    text=text,
+                    font=first.font,
+                    origin=first.origin,
+                    bbox=bbox,
+                )
+            )
+        return merged
+
+
+MERGE_STRATEGIES: dict[str, Callable[..., Merger]] = {
+    "heuristic": lambda **kwargs: merge_bboxes,
+    "lines": LineMerger,
+}
+
+
+def get_merger(strategy: str, **kwargs) -> Merger:
+    """Returns the merge function for the given strategy name.
+
+    Keyword arguments configure the strategy (e.g. tolerances for `lines`) and
+    are ignored by strategies that take no configuration.
+    """
+    return MERGE_STRATEGIES[strategy](**kwargs)
@@ -0,0 +1,264 @@
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from tempfile import mkdtemp
+
+import dacite
+from loguru import logger as log
+
+from .cache import Cache, file_digest, open_cache
+from .dataset import DatasetTokenSink, dataset_writer
+from .document import Document
+from .fontstore import FontStore
+from .incremental import iter_tokens_incremental, options_digest
+from .instrument import stage
+from .journal import ANNOTATE, PREPROCESS, TOKENIZE, open_journal
+from .layout import LayoutEngine
+from .merge import get_merger
+from .preprocessor import PageReport, Preprocessor
+from .processor import FitzProcessor
+from .scheduler import installed_scheduler
+from .sink import open_sink, sink_ext
+from .spatial import SpatialIndex
+from .util import suffix_path
+
+dacite_config = dacite.Config(
+    type_hooks={Path: lambda d: Path(d).expanduser().resolve()}
+)
+
+PREPROCESSED = "preprocessed.pdf"
+TOKENS = "tokens"
+SPATIAL_INDEX = "index.npz"
+
+
+@dataclass(kw_only=True)
+class Options:
+    annotate: bool
+    annotate_bbox: bool
+    annotate_text: bool
+    annotate_token: bool
+    annotator: str
+    annotator_font: Path
+    preprocessor_use_pdfa: bool
+    filename: Path
+    pages: str | None
+    merge_bboxes: bool
+    token_format: str
+    tmproot: Path
+    preprocessor_fast_path: bool = False
+    page_workers: int = 1
+    annotate_workers: int = 1
+    annotate_profile: str = "full"
+    annotate_dpi: int | None = None
+    annotate_tile_size: int = 0
+    merge_strategy: str = "heuristic"
+    merge_baseline_tolerance: float = 0.5
+    merge_gap_tolerance: float = 0.5
+    layout: bool = False
+    cache_dir: Path | None = None
+    cache_size: int = 10240
+    no_cache: bool = False
+    profile: Path | None = None
+    profile_format: str = "json"
+    profile_cprofile: bool = False
+    profile_tracemalloc: bool = False
+    incremental: bool = False
+    spatial_index: bool = False
+    dataset: Path | None = None
+    dataset_shard_size: int = 256
+    journal: Path | None = None
+
+
+def make_processor(options: Options) -> FitzProcessor:
+    merger = get_merger(
+        options.merge_strategy,
+        baseline_tolerance=options.merge_baseline_tolerance,
+        gap_tolerance=options.merge_gap_tolerance,
+    )
+    # Fonts are deduplicated across all documents sharing the temp root.
+    font_store = FontStore(options.tmproot.joinpath("fonts"))
+    layout = (
+        LayoutEngine(gap_tolerance=options.merge_gap_tolerance)
+        if options.layout
+        else None
+    )
+    return FitzProcessor(merger=merger, font_store=font_store, layout=layout)
+
+
+def make_fonts_dir(options: Options) -> Path:
+    """Returns a new directory for the font index of the document in options."""
+    tempdir = Path(
+        mkdtemp(prefix=f"{options.filename.with_suffix('').name}-", dir=options.tmproot)
+    )
+    log.info(f"using tempdir {tempdir}")
+    return tempdir.joinpath("fonts")
+
+
+def make_annotator(options: Options, fonts_dir: Path):
+    # The annotation backends (pypdfium2, PIL) are only imported when used.
+    from .annotator import FitzAnnotator, PDFiumAnnotator
+
+    annotatorCls = PDFiumAnnotator if options.annotator == "pdfium" else FitzAnnotator
+    return dacite.from_dict(
+        data_class=annotatorCls,
+        data={"fonts_dir": fonts_dir, **asdict(options)},
+        config=dacite_config,
+    )
+
+
+def cached_page_reports(cache: Cache, key: str) -> list[PageReport]:
+    """Returns the page reports cached with the preprocessed output for key."""
+    reports = cache.fetch_meta(key).get("page_reports", [])
+    return [PageReport(**report) for report in reports]
+
+
+def process_document(options: Options) -> Document:
+    """Runs all the phases for a single document as specified by options."""
+    options.tmproot.mkdir(parents=True, exist_ok=True)
+
+    doc = dacite.from_dict(data_class=Document, data=asdict(options))
+    preprocessor = Preprocessor(scheduler=installed_scheduler())
+    processor = make_processor(options)
+
+    cache = None
+    if not options.no_cache and options.cache_dir is not None:
+        cache = open_cache(options.cache_dir, options.cache_size * 2**20)
+    journal = None
+    if options.journal is not None:
+        journal = open_journal(options.journal)
+    if cache is not None or journal is not None:
+        digest = file_digest(doc.filename)
+    if journal is not None:
+        journal.begin(options.filename, digest)
+
+    fonts_dir = None
+    if options.annotate:
+        fonts_dir = make_fonts_dir(options)
+        annotator = make_annotator(options, fonts_dir)
+        if journal is not None:
+            journal.temp(options.filename, fonts_dir.parent)
+
+    format = "pdfa" if options.preprocessor_use_pdfa else "pdf"
+    preprocessed = suffix_path(doc.filename, "preprocessed")
+    if journal is not None:
+        journal.temp(options.filename, preprocessed)
+    if cache is not None:
+        preprocessed_key = cache.key(
+            digest, format=format, fast_path=options.preprocessor_fast_path
+        )
+    # The preprocessed output of an interrupted run of the journal is reused.
+    if journal is not None and journal.state.stage_output(
+        options.filename, digest, PREPROCESS
+    ):
+        log.info(f"reusing {preprocessed} of a previous run")
+        if cache is not None:
+            doc.page_reports = cached_page_reports(cache, preprocessed_key)
+    elif cache is None or not cache.fetch(preprocessed_key, PREPROCESSED, preprocessed):
+        with stage("preprocess"):
+            if options.preprocessor_fast_path:
+                doc.page_reports = preprocessor.preprocess(
+                    doc.filename, preprocessed, format
+                )
+            else:
+                preprocessor.optimize(doc.filename, preprocessed, format)
+        if cache is not None:
+            # The page reports are cached along with the output they describe.
+            reports = [asdict(report) for report in doc.page_reports]
+            cache.put(
+                preprocessed_key,
+                PREPROCESSED,
+                preprocessed,
+                {"page_reports": reports},
+            )
+    else:
+        doc.page_reports = cached_page_reports(cache, preprocessed_key)
+    if journal is not None:
+        journal.stage(options.filename, digest, PREPROCESS, preprocessed)
+    doc.update_pdf_doc(preprocessed)
+
+    filename = suffix_path(doc.filename, "tokens", ext=sink_ext(options.token_format))
+    index_filename = suffix_path(doc.filename, "tokens", ext=".index.npz")
+    # Tokens added to a dataset are not written to a file that could be cached.
+    if cache is not None and options.dataset is None:
+        tokens_key = cache.key(
+            preprocessed_key,
+            pages=doc.page_indices,
+            merge_bboxes=options.merge_bboxes,
+            merge_strategy=options.merge_strategy,
+            merge_baseline_tolerance=options.merge_baseline_tolerance,
+            merge_gap_tolerance=options.merge_gap_tolerance,
+            layout=options.layout,
+            token_format=options.token_format,
+        )
+        # Annotation needs the tokens in memory, so cached tokens are only used
+        # when they just need to be written out.
+        if (
+            not options.annotate
+            and cache.fetch(tokens_key, TOKENS, filename)
+            and (
+                not options.spatial_index
+                or cache.fetch(tokens_key, SPATIAL_INDEX, index_filename)
+            )
+        ):
+            doc.token_count = cache.fetch_meta(tokens_key).get("token_count", 0)
+            if journal is not None:
+                journal.stage(options.filename, digest, TOKENIZE, filename)
+            return doc
+
+    # Annotation needs the fonts of every page, which are only extracted when
+    # pages are tokenized, so incremental runs are limited to writing tokens.
+    if options.incremental and not options.annotate:
+        pages = iter_tokens_incremental(
+            processor,
+            doc,
+            store=suffix_path(doc.filename, "tokens", ext=".pages.ttok"),
+            manifest_file=suffix_path(doc.filename, "tokens", ext=".manifest.json"),
+            options=options_digest(
+                merge_bboxes=options.merge_bboxes,
+                merge_strategy=options.merge_strategy,
+                merge_baseline_tolerance=options.merge_baseline_tolerance,
+                merge_gap_tolerance=options.merge_gap_tolerance,
+                layout=options.layout,
+            ),
+            merge_bboxes=options.merge_bboxes,
+            workers=options.page_workers,
+        )
+    else:
+        pages = processor.iter_tokens(
+            doc,
+            fonts_dir=fonts_dir,
+            merge_bboxes=options.merge_bboxes,
+            workers=options.page_workers,
+        )
+    spatial_index = SpatialIndex() if options.spatial_index else None
+    if options.dataset is not None:
+        writer = dataset_writer(options.dataset, options.dataset_shard_size * 2**20)
+        sink = DatasetTokenSink(writer, str(options.filename))
+    else:
+        sink = open_sink(options.token_format, filename)
+        if journal is not None:
+            journal.temp(options.filename, filename)
+    with sink:
+        for idx, tokens in pages:
+            with stage("save"):
+                sink.write(tokens)
+            if spatial_index is not None:
+                with stage("index"):
+                    spatial_index.add_page(idx, tokens)
+            # Tokens are only kept in memory when they are needed for annotation.
+            if options.annotate:
+                doc.tokens.extend(tokens)
+    if spatial_index is not None:
+        spatial_index.save(index_filename)
+    if cache is not None and options.dataset is None:
+        cache.put(tokens_key, TOKENS, filename, {"token_count": doc.token_count})
+        if spatial_index is not None:
+            cache.put(tokens_key, SPATIAL_INDEX, index_filename)
+    if journal is not None:
+        output = None if options.dataset is not None else filename
+        journal.stage(options.filename, digest, TOKENIZE, output)
+
+    if options.annotate:
+        annotator.annotate(doc)
+        if journal is not None:
+            journal.stage(options.filename, digest, ANNOTATE, None)
+    return doc
@@ -1,16 +1,121 @@
+import shutil
+from dataclasses import dataclass
+from io import BytesIO
 from pathlib import Path
+from typing import BinaryIO
 
-import ocrmypdf
+import fitz
 from loguru import logger as log
 
+from .scheduler import OcrScheduler
+from .util import PdfBuffer, as_bytes
+
+OCR = "ocr"
+DIRECT = "direct"
+
+
+@dataclass(kw_only=True)
+class PageReport:
+    """Text layer statistics of a page and the preprocessing path it takes."""
+
+    page: int
+    chars: int
+    fonts: int
+    text_coverage: float
+    image_coverage: float
+    invalid_chars: float
+    path: str = DIRECT
+
+
+@dataclass(kw_only=True)
+class TextLayerDetector:
+    """Detects pages that lack a usable text layer and need OCR.
+
+    A page needs OCR when it has images but (almost) no text, when images cover
+    most of the page with little text on top (e.g. a scan with a header stamp) or
+    when its text is mostly unmappable (replacement) characters.
+    """
+
+    min_chars: int = 20
+    min_text_coverage: float = 0.02
+    max_image_coverage: float = 0.5
+    max_invalid_chars: float = 0.1
+
+    def inspect_page(self, doc: fitz.Document, idx: int) -> PageReport:
+        page = doc[idx]
+        area = abs(page.rect) or 1.0
+        chars = invalid = 0
+        text_area = 0.0
+        text = page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)
+        for block in text["blocks"]:
+            for line in block.get("lines", []):
+                for span in line["spans"]:
+                    content = span["text"].strip()
+                    if not content:
+                        continue
+                    chars += len(content)
+                    invalid += content.count("\ufffd")
+                    text_area += abs(fitz.Rect(span["bbox"]) & page.rect)
+        image_area = sum(
+            abs(fitz.Rect(image["bbox"]) & page.rect) for image in page.get_image_info()
+        )
+        report = PageReport(
+            page=idx,
+            chars=chars,
+            fonts=len(doc.get_page_fonts(idx)),
+            text_coverage=min(text_area / area, 1.0),
+            image_coverage=min(image_area / area, 1.0),
+            invalid_chars=invalid / chars if chars else 0.0,
+        )
+        if self.needs_ocr(report):
+            report.path = OCR
+        return report
+
+    def needs_ocr(self, report: PageReport) -> bool:
+        if report.image_coverage > 0 and report.chars < self.min_chars:
+            return True
+        if (
+            report.image_coverage > self.max_image_coverage
+            and report.text_coverage < self.min_text_coverage
+        ):
+            return True
+        return report.invalid_chars > self.max_invalid_chars
+
+    def inspect(self, doc: fitz.Document) -> list[PageReport]:
+        return [self.inspect_page(doc, idx) for idx in range(len(doc))]
+
+
+def count_pages(src: Path | BinaryIO) -> int:
+    if isinstance(src, Path):
+        with fitz.open(src) as doc:
+            return len(doc)
+    position = src.tell()
+    data = src.read()
+    src.seek(position)
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        return len(doc)
+
 
 class Preprocessor:
     """
     Implements a OMP (OcrMyPDF) based preprocessor.
+
+    With a scheduler, ocrmypdf runs share its budget of cores with the runs of
+    other processes instead of each using all cores.
     """
 
-    def optimize(self, src: Path, dest: Path, format="pdfa"):
-        """pre-processes the given document to optimize it."""
+    def __init__(self, scheduler: OcrScheduler | None = None):
+        self.scheduler = scheduler
+
+    def optimize(self, src: Path | BinaryIO, dest: Path | BinaryIO, format="pdfa"):
+        """pre-processes the given document to optimize it.
+
+        The source and destination are files or binary streams, e.g. BytesIO to
+        keep the document in memory.
+        """
+        # ocrmypdf and its plugins are slow to import, so only when OCR runs.
+        import ocrmypdf
+
         log.info(f"preprocessing - {src}")
         args = {
             "input_file": src,
@@ -20,5 +125,87 @@ class Preprocessor:
             "clean": True,
             "optimize": 3,
         }
-        ocrmypdf.ocr(**args)
+        if self.scheduler is None:
+            ocrmypdf.ocr(**args)
+        else:
+            with self.scheduler.reserve(count_pages(src)) as jobs:
+                ocrmypdf.ocr(jobs=jobs, **args)
         log.info(f"writing preprocessed - {dest}")
+
+    def preprocess(
+        self,
+        src: Path,
+        dest: Path,
+        format="pdfa",
+        detector: TextLayerDetector | None = None,
+    ) -> list[PageReport]:
+        """pre-processes only the pages of the document that need OCR.
+
+        Pages with a usable text layer are copied as is, the remaining pages are
+        optimized through ocrmypdf and spliced back in place. Returns a report of
+        the path each page took.
+        """
+        detector = detector or TextLayerDetector()
+        with fitz.open(src) as doc:
+            reports, ocr_pages = self.inspect(doc, detector)
+            if not ocr_pages:
+                log.info(f"no pages need OCR, skipping preprocessing - {src}")
+                shutil.copyfile(src, dest)
+            elif len(ocr_pages) == len(doc):
+                self.optimize(src, dest, format)
+            else:
+                self.optimize_pages(doc, ocr_pages, format)
+                doc.save(dest, garbage=3, deflate=True)
+                log.info(f"writing preprocessed - {dest}")
+        return reports
+
+    def preprocess_buffer(
+        self,
+        data: PdfBuffer,
+        format="pdfa",
+        detector: TextLayerDetector | None = None,
+    ) -> tuple[bytes, list[PageReport]]:
+        """pre-processes an in memory pdf like preprocess, without any files.
+
+        Returns the preprocessed pdf, which is data itself when no page needs
+        OCR, along with the page reports. Pages needing OCR are copied into the
+        input of ocrmypdf.
+        """
+        data = as_bytes(data)
+        detector = detector or TextLayerDetector()
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            reports, ocr_pages = self.inspect(doc, detector)
+            if not ocr_pages:
+                log.info("no pages need OCR, skipping preprocessing")
+                return data, reports
+            if len(ocr_pages) == len(doc):
+                optimized = BytesIO()
+                self.optimize(BytesIO(data), optimized, format)
+                return optimized.getvalue(), reports
+            self.optimize_pages(doc, ocr_pages, format)
+            return doc.tobytes(garbage=3, deflate=True), reports
+
+    def inspect(
+        self, doc: fitz.Document, detector: TextLayerDetector
+    ) -> tuple[list[PageReport], list[int]]:
+        """Returns the page reports and the pages needing OCR."""
+        reports = detector.inspect(doc)
+        for report in reports:
+            log.info(f"page {report.page} preprocessing path: {report.path}")
+        return reports, [r.page for r in reports if r.path == OCR]
+
+    def optimize_pages(self, doc: fitz.Document, pages: list[int], format="pdfa"):
+        """Optimizes the given pages of doc and splices them back in place.
+
+        The pages are passed through ocrmypdf in memory.
+        """
+        with fitz.open() as subset:
+            for idx in pages:
+                subset.insert_pdf(doc, from_page=idx, to_page=idx)
+            src = BytesIO(subset.tobytes())
+        optimized = BytesIO()
+        self.optimize(src, optimized, format)
+        with fitz.open(stream=optimized.getvalue(), filetype="pdf") as optimized:
+            for i, idx in enumerate(pages):
+                doc.delete_page(idx)
+                doc.insert_pdf(optimized, from_page=i, to_page=i, start_at=idx)
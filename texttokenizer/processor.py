@@ -1,12 +1,25 @@
 from abc import ABC, abstractmethod
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import TypeAlias
 
 import fitz
 from loguru import logger as log
 
 from .document import Document
+from .fontstore import FontStore, write_font_index
+from .instrument import profiler, stage
+from .layout import LayoutEngine
+from .merge import Merger
 from .token import Font, Token
-from .util import guess_font, merge_bboxes
+from .util import PdfSource, guess_font, merge_bboxes, open_pdf, page_shards
+
+SHARDS_PER_WORKER = 4
+
+# Page index, tokens, names of the fonts used and their font files.
+PageResult: TypeAlias = tuple[int, list[Token], set[str], dict[str, Path]]
 
 
 class Processor(ABC):
@@ -15,76 +28,242 @@ class Processor(ABC):
     """
 
     @abstractmethod
+    def iter_tokens(
+        self,
+        document: Document,
+        fonts_dir: Path | None = None,
+        merge_bboxes: bool = False,
+        workers: int = 1,
+        page_indices: list[int] | None = None,
+    ) -> Iterator[tuple[int, list[Token]]]:
+        """processes the given document, yielding the tokens of each page.
+
+        Only the given page indices are processed if any, the document page
+        indices otherwise.
+        """
+
     def tokenize(
         self,
         document: Document,
         fonts_dir: Path | None = None,
         merge_bboxes: bool = False,
+        workers: int = 1,
     ):
-        """processes the given document to tokenize it."""
+        """processes the given document to tokenize it, keeping all tokens."""
+        for _, tokens in self.iter_tokens(document, fonts_dir, merge_bboxes, workers):
+            document.tokens.extend(tokens)
 
 
 class FitzProcessor(Processor):
     """
     Implements a fitz (PyMuPDF) based processor.
+
+    With a layout engine, tokens follow the block and line structure of fitz in
+    reading order and are merged within lines, the merger is not used.
     """
 
-    def extract_page_fonts(
-        self, doc: fitz.Document, idx: int, fonts: set[str], dir: Path
+    def __init__(
+        self,
+        merger: Merger = merge_bboxes,
+        font_store: FontStore | None = None,
+        layout: LayoutEngine | None = None,
     ):
-        filepath = dir.joinpath(str(idx))
-        filepath.mkdir(parents=True, exist_ok=True)
-        for font in doc.get_page_fonts(idx):
-            log.info(f"extracting page font: {font}")
-            font_data = doc.extract_font(font[0], named=True)
-            name, ext, font_obj = guess_font(font, font_data)
-            log.info(f"extracting as {name}.{ext}")
-            if name in fonts:
-                filename = filepath.joinpath(name).with_suffix(f".{ext}")
-                with open(filename, "wb") as f:
-                    f.write(font_obj.buffer)
-                log.info(f"writing font {filename}")
+        self.merger = merger
+        # Fonts are stored in fonts_dir per document unless a shared store is given.
+        self.font_store = font_store
+        self.layout = layout
 
-    def tokenize(
+    def extract_page_fonts(
+        self,
+        doc: fitz.Document,
+        idx: int,
+        fonts: set[str],
+        store: FontStore,
+        extracted: dict[int, tuple[str, Path]],
+    ) -> dict[str, Path]:
+        """Returns the font files of the fonts used on the page.
+
+        Each font xref is extracted into the store only once per document, the
+        extracted dict maps xrefs already seen to their name and font file.
+        """
+        with stage("fonts"):
+            page_fonts = {}
+            for font in doc.get_page_fonts(idx):
+                xref = font[0]
+                if xref not in extracted:
+                    log.info(f"extracting page font: {font}")
+                    font_data = doc.extract_font(xref, named=True)
+                    name, ext, font_obj = guess_font(font, font_data)
+                    log.info(f"extracting as {name}.{ext}")
+                    extracted[xref] = (name, store.add(font_obj.buffer, ext))
+                name, filename = extracted[xref]
+                if name in fonts:
+                    page_fonts[name] = filename
+            return page_fonts
+
+    def iter_tokens(
         self,
         document: Document,
         fonts_dir: Path | None = None,
         merge_bboxes: bool = False,
-    ):
+        workers: int = 1,
+        page_indices: list[int] | None = None,
+    ) -> Iterator[tuple[int, list[Token]]]:
         log.info(f"processing - {document.filename}")
-        for idx in document.page_indices:
-            tokens, fonts = self.tokenize_page(idx, document.pdf_doc[idx], merge_bboxes)
+        if page_indices is None:
+            page_indices = document.page_indices
+        if workers > 1 and len(page_indices) > 1:
+            results = self.tokenize_parallel(
+                document, page_indices, fonts_dir, merge_bboxes, workers
+            )
+        else:
+            results = self.tokenize_pages(
+                document.pdf_doc, page_indices, fonts_dir, merge_bboxes
+            )
+        font_index = {}
+        for idx, tokens, fonts, page_fonts in results:
             log.info(f"extracted {len(tokens)} tokens from page {idx}")
             log.info(f"fonts used: {fonts}")
-            document.tokens.extend(tokens)
-            if fonts_dir is not None:
-                self.extract_page_fonts(document.pdf_doc, idx, fonts, fonts_dir)
+            document.token_count += len(tokens)
+            font_index[idx] = page_fonts
+            yield idx, tokens
         document.fonts = set(sorted(document.fonts))
+        if fonts_dir is not None:
+            write_font_index(fonts_dir, font_index)
+
+    def tokenize_pages(
+        self,
+        doc: fitz.Document,
+        page_indices: list[int],
+        fonts_dir: Path | None,
+        merge_bboxes: bool,
+    ) -> Iterator[PageResult]:
+        store = None
+        if fonts_dir is not None:
+            store = self.font_store or FontStore(fonts_dir)
+        extracted = {}
+        for idx in page_indices:
+            tokens, fonts = self.tokenize_page(idx, doc[idx], merge_bboxes)
+            page_fonts = {}
+            if store is not None:
+                page_fonts = self.extract_page_fonts(doc, idx, fonts, store, extracted)
+            yield idx, tokens, fonts, page_fonts
+
+    def tokenize_shard(
+        self,
+        source: PdfSource,
+        page_indices: list[int],
+        fonts_dir: Path | None,
+        merge_bboxes: bool,
+    ) -> tuple[list[PageResult], dict]:
+        """Tokenizes a range of pages in a worker with its own fitz document.
+
+        Returns the page results along with the stage stats of the worker.
+        """
+        # Drop stats inherited from a forked parent, they are accounted there.
+        profiler.collect()
+        with open_pdf(source) as doc:
+            results = list(
+                self.tokenize_pages(doc, page_indices, fonts_dir, merge_bboxes)
+            )
+        return results, profiler.collect()
+
+    def tokenize_parallel(
+        self,
+        document: Document,
+        page_indices: list[int],
+        fonts_dir: Path | None,
+        merge_bboxes: bool,
+        workers: int,
+    ) -> Iterator[PageResult]:
+        """Tokenizes contiguous page ranges across worker processes.
+
+        Results are yielded in the document page order, so the tokens match
+        the serial mode exactly. At most two shards per worker are in flight,
+        bounding the tokens held in memory. An in memory document is copied to
+        the worker with each shard, files are opened by path.
+        """
+        shards = deque(page_shards(page_indices, workers * SHARDS_PER_WORKER))
+        log.info(f"tokenizing {len(shards)} page shards over {workers} workers")
+        with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as executor:
+            futures = deque()
+            while shards or futures:
+                while shards and len(futures) < workers * 2:
+                    futures.append(
+                        executor.submit(
+                            self.tokenize_shard,
+                            document.source,
+                            shards.popleft(),
+                            fonts_dir,
+                            merge_bboxes,
+                        )
+                    )
+                results, stats = futures.popleft().result()
+                profiler.merge(stats)
+                yield from results
 
     def tokenize_page(
         self, idx: int, page: fitz.Page, merge: bool
     ) -> tuple[list[Token], set[str]]:
+        if self.layout is not None:
+            return self.tokenize_layout(idx, page, merge)
         fonts: set[str] = set()
         tokens: list[Token] = []
-        for block in page.get_text("dict")["blocks"]:
-            if "lines" not in block:
-                continue
-            for line in block["lines"]:
-                for span in line["spans"]:
-                    args = {
-                        "page": idx,
-                        "bbox": span["bbox"],
-                        "origin": span["origin"],
-                        "text": span["text"].strip(),
-                    }
-                    if not args["text"]:
-                        continue
-                    args["font"] = self.extract_font(span)
-                    token = Token(**args)
-                    tokens.append(token)
-                    fonts.add(args["font"][0])
+        with stage("get_text"):
+            blocks = page.get_text("dict")["blocks"]
+        with stage("convert"):
+            for block in blocks:
+                if "lines" not in block:
+                    continue
+                for line in block["lines"]:
+                    for span in line["spans"]:
+                        args = {
+                            "page": idx,
+                            "bbox": span["bbox"],
+                            "origin": span["origin"],
+                            "text": span["text"].strip(),
+                        }
+                        if not args["text"]:
+                            continue
+                        args["font"] = self.extract_font(span)
+                        token = Token(**args)
+                        tokens.append(token)
+                        fonts.add(args["font"][0])
         if merge:
-            tokens = merge_bboxes(tokens)
+            with stage("merge"):
+                tokens = self.merger(tokens)
+        return (tokens, fonts)
+
+    def tokenize_layout(
+        self, idx: int, page: fitz.Page, merge: bool
+    ) -> tuple[list[Token], set[str]]:
+        fonts: set[str] = set()
+        tokens: list[Token] = []
+        with stage("get_text"):
+            blocks = self.layout.blocks(page)
+        with stage("layout"):
+            lines = self.layout.lines(blocks)
+        with stage("convert"):
+            for spans in lines:
+                line_tokens = []
+                for span in spans:
+                    text = span["text"].strip()
+                    if not text:
+                        continue
+                    font = self.extract_font(span)
+                    line_tokens.append(
+                        Token(
+                            page=idx,
+                            bbox=span["bbox"],
+                            origin=span["origin"],
+                            text=text,
+                            font=font,
+                        )
+                    )
+                    fonts.add(font[0])
+                if merge:
+                    line_tokens = self.layout.merge_line(line_tokens)
+                tokens.extend(line_tokens)
         return (tokens, fonts)
 
     def extract_font(self, span: dict) -> Font:
@@ -0,0 +1,165 @@
+import math
+import multiprocessing
+import os
+import time
+from contextlib import contextmanager
+
+from loguru import logger as log
+
+
+class OcrScheduler:
+    """Shares a budget of cores between the ocrmypdf runs of worker processes.
+
+    Each run reserves `jobs` cores for its duration, sized from its page count and
+    the current load: no more cores than pages, no more than are free and no more
+    than an even share of the budget between the runs in flight and waiting. Runs
+    wait while the budget is used up and the waiting run with the fewest pages
+    goes first, so small documents are not stuck behind large ones.
+
+    The state lives in shared memory and the scheduler is handed to worker
+    processes on creation (see `install_scheduler`). `slots` bounds the number
+    of waiting runs.
+    """
+
+    def __init__(self, budget: int | None = None, slots: int = 64, context=None):
+        self.context = context or multiprocessing.get_context()
+        self.budget = budget or os.cpu_count() or 1
+        self.slots = slots
+        # Shared state replaced by renew, see there.
+        self.retired: list[dict] = []
+        self._allocate()
+
+    def _allocate(self):
+        context = self.context
+        self.condition = context.Condition()
+        # All shared values are guarded by condition.
+        self.free = context.RawValue("i", self.budget)
+        self.running = context.RawValue("i", 0)
+        self.waiting = context.RawValue("i", 0)
+        self.max_waiting = context.RawValue("i", 0)
+        self.tickets = context.RawValue("q", 0)
+        self.runs = context.RawValue("i", 0)
+        self.pages = context.RawValue("q", 0)
+        self.ocr_seconds = context.RawValue("d", 0.0)
+        self.max_page_seconds = context.RawValue("d", 0.0)
+        self.wait_seconds = context.RawValue("d", 0.0)
+        # Page count and arrival ticket of each waiting run, 0 for free slots.
+        self.slot_pages = context.RawArray("q", self.slots)
+        self.slot_tickets = context.RawArray("q", self.slots)
+
+    def renew(self):
+        """Replaces the shared state, e.g. after the worker processes crashed.
+
+        Processes of the old pool may still release their reservations, or hold
+        the lock when killed, so the new pool gets a fresh budget and lock that
+        only it shares. The metric totals are carried over. The old state is kept,
+        as memory freed in the shared heap would be reused by new values the old
+        processes could still write to.
+        """
+        self.retired.append(
+            {name: value for name, value in vars(self).items() if name != "retired"}
+        )
+        totals = {
+            name: getattr(self, name).value
+            for name in (
+                "max_waiting",
+                "runs",
+                "pages",
+                "ocr_seconds",
+                "max_page_seconds",
+                "wait_seconds",
+            )
+        }
+        self._allocate()
+        for name, value in totals.items():
+            getattr(self, name).value = value
+
+    def _register(self, pages: int) -> int:
+        for slot, registered in enumerate(self.slot_pages):
+            if not registered:
+                self.tickets.value += 1
+                self.slot_pages[slot] = max(pages, 1)
+                self.slot_tickets[slot] = self.tickets.value
+                self.waiting.value += 1
+                self.max_waiting.value = max(self.max_waiting.value, self.waiting.value)
+                return slot
+        raise RuntimeError(f"more than {len(self.slot_pages)} ocr runs waiting")
+
+    def _is_next(self, slot: int) -> bool:
+        """Returns true if the run in slot has the fewest pages of the waiting runs."""
+        key = (self.slot_pages[slot], self.slot_tickets[slot])
+        return all(
+            not pages or (pages, ticket) >= key
+            for pages, ticket in zip(self.slot_pages, self.slot_tickets)
+        )
+
+    def jobs(self, pages: int) -> int:
+        """Returns the cores to give a run of pages starting now."""
+        share = math.ceil(self.budget / (self.running.value + self.waiting.value + 1))
+        return max(1, min(pages, self.free.value, share))
+
+    @contextmanager
+    def reserve(self, pages: int):
+        """Waits for cores to OCR pages, yields the number of jobs to run with."""
+        start = time.perf_counter()
+        with self.condition:
+            slot = self._register(pages)
+            try:
+                while self.free.value < 1 or not self._is_next(slot):
+                    self.condition.wait()
+            except BaseException:
+                self.condition.notify_all()
+                raise
+            finally:
+                self.slot_pages[slot] = 0
+                self.waiting.value -= 1
+            jobs = self.jobs(pages)
+            self.free.value -= jobs
+            self.running.value += 1
+            self.wait_seconds.value += time.perf_counter() - start
+        log.info(f"ocr of {pages} pages with {jobs} jobs")
+        start = time.perf_counter()
+        try:
+            yield jobs
+        finally:
+            seconds = time.perf_counter() - start
+            with self.condition:
+                self.free.value += jobs
+                self.running.value -= 1
+                self.runs.value += 1
+                self.pages.value += pages
+                self.ocr_seconds.value += seconds
+                self.max_page_seconds.value = max(
+                    self.max_page_seconds.value, seconds / max(pages, 1)
+                )
+                self.condition.notify_all()
+
+    def metrics(self) -> dict:
+        """Returns the queue depth and OCR time statistics."""
+        with self.condition:
+            pages = self.pages.value
+            return {
+                "budget": self.budget,
+                "running": self.running.value,
+                "queue_depth": self.waiting.value,
+                "max_queue_depth": self.max_waiting.value,
+                "runs": self.runs.value,
+                "pages": pages,
+                "ocr_seconds": self.ocr_seconds.value,
+                "seconds_per_page": self.ocr_seconds.value / pages if pages else 0.0,
+                "max_seconds_per_page": self.max_page_seconds.value,
+                "wait_seconds": self.wait_seconds.value,
+            }
+
+
+_scheduler: OcrScheduler | None = None
+
+
+def install_scheduler(scheduler: OcrScheduler | None):
+    """Sets the scheduler of the process, e.g. as a worker pool initializer."""
+    global _scheduler
+    _scheduler = scheduler
+
+
+def installed_scheduler() -> OcrScheduler | None:
+    return _scheduler
@@ -0,0 +1,373 @@
+"""texttokenizer server
+
+Serves tokenization over a local HTTP endpoint (tcp or unix socket) from a pool
+of warm worker processes, which import the backends and build the preprocessor
+and processor once instead of per document.
+
+    POST /tokenize?pages=0-3&merge_bboxes=1&preprocess=fast   (pdf as body)
+    GET  /health
+
+Tokens are streamed back as newline delimited json, one object per page with
+its index and tokens. Requests beyond the worker count are queued up to
+`--max_queue`, further requests are rejected with 503 so clients can back off.
+"""
+
+import json
+import multiprocessing
+import os
+import socketserver
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from pathlib import Path
+from queue import Empty, Queue
+from urllib.parse import parse_qs, urlparse
+
+import click
+import dacite
+from loguru import logger as log
+
+from .document import Document
+from .merge import get_merger
+from .pipeline import dacite_config
+from .preprocessor import Preprocessor
+from .processor import FitzProcessor
+
+PREPROCESS_MODES = ("none", "fast", "full")
+PAGE_POLL_SECONDS = 0.1
+
+
+@dataclass(kw_only=True)
+class ServerOptions:
+    host: str = "127.0.0.1"
+    port: int = 8765
+    socket: Path | None = None
+    workers: int = 2
+    max_queue: int = 8
+    max_bytes: int = 100 * 2**20
+    timeout: float = 300.0
+    preprocessor_use_pdfa: bool = False
+    merge_strategy: str = "heuristic"
+
+
+@dataclass(kw_only=True)
+class TokenizeRequest:
+    pages: str | None = None
+    merge_bboxes: bool = False
+    preprocess: str = "fast"
+
+
+class WorkerState:
+    """The preprocessor and processor instances kept warm in a worker process."""
+
+    def __init__(self, options: ServerOptions):
+        self.options = options
+        self.preprocessor = Preprocessor()
+        self.processor = FitzProcessor(merger=get_merger(options.merge_strategy))
+
+
+_state: WorkerState | None = None
+
+
+def init_worker(options: ServerOptions):
+    global _state
+    _state = WorkerState(options)
+    log.info(f"worker {os.getpid()} ready")
+
+
+def warm() -> int:
+    return os.getpid()
+
+
+def tokenize(data: bytes, request: TokenizeRequest, pages: Queue) -> int:
+    """Tokenizes a pdf in a warm worker, sending each page to the pages queue.
+
+    Pages are sent as ndjson lines, as soon as they are tokenized. The document
+    stays in memory throughout, no temp files are written. Returns the number
+    of pages sent.
+    """
+    format = "pdfa" if _state.options.preprocessor_use_pdfa else "pdf"
+    if request.preprocess == "fast":
+        data, _ = _state.preprocessor.preprocess_buffer(data, format)
+    elif request.preprocess == "full":
+        optimized = BytesIO()
+        _state.preprocessor.optimize(BytesIO(data), optimized, format)
+        data = optimized.getvalue()
+    doc = Document.from_buffer(data, pages=request.pages)
+    try:
+        count = 0
+        for idx, tokens in _state.processor.iter_tokens(
+            doc, merge_bboxes=request.merge_bboxes
+        ):
+            page = {"page": idx, "tokens": [asdict(t) for t in tokens]}
+            pages.put(json.dumps(page) + "\n")
+            count += 1
+        return count
+    finally:
+        doc.pdf_doc.close()
+
+
+class Service:
+    """Admits requests up to the queue capacity and runs them on the pool.
+
+    A request holds its slot until its worker is done with the document. A
+    document running past the timeout is stopped by restarting the pool, which
+    also fails the other documents in flight on it.
+    """
+
+    def __init__(self, options: ServerOptions):
+        self.options = options
+        self.capacity = options.workers + options.max_queue
+        self.slots = threading.BoundedSemaphore(self.capacity)
+        self.lock = threading.Lock()
+        # Pages are sent back from the workers through queues of the manager.
+        self.manager = multiprocessing.Manager()
+        self.executor = self.start_pool()
+
+    def start_pool(self) -> ProcessPoolExecutor:
+        executor = ProcessPoolExecutor(
+            max_workers=self.options.workers,
+            initializer=init_worker,
+            initargs=(self.options,),
+        )
+        # Workers are started on demand, so start them all before serving.
+        futures = [executor.submit(warm) for _ in range(self.options.workers)]
+        for future in futures:
+            future.result()
+        return executor
+
+    def restart_pool(self, executor: ProcessPoolExecutor, kill: bool = False):
+        """Replaces a pool with a new one, killing its workers if asked."""
+        with self.lock:
+            if self.executor is not executor:
+                return
+            log.warning("restarting worker pool")
+            self.executor = self.start_pool()
+        if kill:
+            # The executor has no public way to stop a running worker.
+            for process in list(executor._processes.values()):
+                process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def admit(self) -> bool:
+        """Reserves a slot for a request, returns false when the queue is full."""
+        return self.slots.acquire(blocking=False)
+
+    def release(self):
+        self.slots.release()
+
+    def in_flight(self) -> int:
+        # Reads the semaphore counter, only used for reporting.
+        return self.capacity - self.slots._value
+
+    def run(self, data: bytes, request: TokenizeRequest) -> Iterator[str]:
+        """Runs an admitted request, returns its ndjson page lines as they arrive.
+
+        The slot of the request is released once the document is done.
+        """
+        with self.lock:
+            executor = self.executor
+        try:
+            pages = self.manager.Queue()
+            future = executor.submit(tokenize, data, request, pages)
+        except BaseException as e:
+            self.release()
+            if isinstance(e, BrokenProcessPool):
+                self.restart_pool(executor)
+            raise
+        timer = threading.Timer(self.options.timeout, self.expire, (executor, future))
+        timer.daemon = True
+        timer.start()
+        future.add_done_callback(lambda _: timer.cancel())
+        future.add_done_callback(lambda _: self.release())
+        return self.stream(executor, future, pages)
+
+    def expire(self, executor: ProcessPoolExecutor, future: Future):
+        if not future.done():
+            log.warning(f"document timed out after {self.options.timeout}s")
+            self.restart_pool(executor, kill=True)
+
+    def stream(
+        self, executor: ProcessPoolExecutor, future: Future, pages: Queue
+    ) -> Iterator[str]:
+        start = time.monotonic()
+        while not future.done():
+            try:
+                yield pages.get(timeout=PAGE_POLL_SECONDS)
+            except Empty:
+                pass
+        # Pages are all queued by the time the worker returns.
+        while True:
+            try:
+                yield pages.get_nowait()
+            except Empty:
+                break
+        try:
+            future.result()
+        except BrokenProcessPool:
+            if time.monotonic() - start >= self.options.timeout:
+                raise TimeoutError("document processing timed out")
+            self.restart_pool(executor)
+            raise
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
+        self.manager.shutdown()
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "texttokenizer"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def service(self) -> Service:
+        return self.server.service
+
+    def log_message(self, format, *args):
+        log.info(format % args)
+
+    def address_string(self) -> str:
+        return self.client_address[0] if self.client_address else "unix"
+
+    def send_json(self, status: HTTPStatus, data: dict, headers: dict | None = None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/health":
+            return self.send_json(HTTPStatus.NOT_FOUND, {"error": "not found"})
+        self.send_json(
+            HTTPStatus.OK,
+            {
+                "workers": self.service.options.workers,
+                "in_flight": self.service.in_flight(),
+                "capacity": self.service.capacity,
+            },
+        )
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/tokenize":
+            return self.send_json(HTTPStatus.NOT_FOUND, {"error": "not found"})
+        length = int(self.headers.get("Content-Length", 0))
+        if length > self.service.options.max_bytes:
+            self.close_connection = True
+            return self.send_json(
+                HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "document too large"}
+            )
+        # The body is read before any response so the client is not cut off.
+        data = self.rfile.read(length)
+        try:
+            request = parse_request(url.query)
+        except ValueError as e:
+            return self.send_json(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+        if not self.service.admit():
+            return self.send_json(
+                HTTPStatus.SERVICE_UNAVAILABLE,
+                {"error": "queue full"},
+                {"Retry-After": "1"},
+            )
+        try:
+            pages = self.service.run(data, request)
+            # Errors before the first page still get an error status.
+            first = next(pages, None)
+        except Exception as e:
+            log.exception(f"tokenize request failed: {e}")
+            return self.send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": repr(e)})
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            if first is not None:
+                self.write_chunk(first)
+            for page in pages:
+                self.write_chunk(page)
+        except Exception as e:
+            # The response is left unterminated so the client sees it failed.
+            log.exception(f"tokenize request failed: {e}")
+            self.close_connection = True
+            return
+        finally:
+            pages.close()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def write_chunk(self, data: str):
+        chunk = data.encode()
+        self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+
+
+def parse_request(query: str) -> TokenizeRequest:
+    params = {k: v[-1] for k, v in parse_qs(query).items()}
+    preprocess = params.get("preprocess", "fast")
+    if preprocess not in PREPROCESS_MODES:
+        raise ValueError(f"preprocess must be one of {PREPROCESS_MODES}")
+    return TokenizeRequest(
+        pages=params.get("pages"),
+        merge_bboxes=params.get("merge_bboxes", "0").lower() in ("1", "true"),
+        preprocess=preprocess,
+    )
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(options: ServerOptions) -> socketserver.BaseServer:
+    """Returns a server bound to the unix socket if given, the tcp port otherwise."""
+    if options.socket is not None:
+        options.socket.unlink(missing_ok=True)
+        server = UnixHTTPServer(str(options.socket), Handler)
+    else:
+        server = ThreadingHTTPServer((options.host, options.port), Handler)
+    server.service = Service(options)
+    return server
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", help="address to listen on.")
+@click.option("--port", default=8765, help="port to listen on.")
+@click.option("--socket", help="listen on this unix socket instead of tcp.")
+@click.option("--workers", default=2, help="number of warm worker processes.")
+@click.option("--max_queue", default=8, help="requests queued beyond the workers.")
+@click.option("--max_bytes", default=100 * 2**20, help="maximum document size.")
+@click.option("--timeout", default=300.0, help="seconds allowed per document.")
+@click.option(
+    "--preprocessor_use_pdfa",
+    is_flag=True,
+    help="use pdf/a format conversion in preprocessor.",
+)
+@click.option(
+    "--merge_strategy",
+    type=click.Choice(["heuristic", "lines"]),
+    default="heuristic",
+    help="how bboxes are merged when requested.",
+)
+def main(**kwargs):
+    options = dacite.from_dict(ServerOptions, kwargs, config=dacite_config)
+    server = make_server(options)
+    where = options.socket or f"http://{options.host}:{server.server_address[1]}"
+    log.info(f"serving on {where} with {options.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
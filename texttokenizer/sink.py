@@ -0,0 +1,112 @@
+import csv
+import json
+from abc import ABC, abstractmethod
+from collections.abc import Iterable
+from pathlib import Path
+
+from loguru import logger as log
+
+from .columnar import write_columnar
+from .token import Token, TokenTable
+
+
+class TokenSink(ABC):
+    """Writes tokens incrementally to a file, one page of tokens at a time."""
+
+    mode = "w"
+
+    def __init__(self, filename: Path):
+        self.filename = filename
+        self.count = 0
+        self.file = open(filename, self.mode, newline=None if "b" in self.mode else "")
+        self.write_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write_header(self):
+        """Writes anything that precedes the first token."""
+
+    def write_footer(self):
+        """Writes anything that follows the last token."""
+
+    @abstractmethod
+    def write_token(self, token: Token):
+        """Writes a single token, `self.count` is the index of the token."""
+
+    def write(self, tokens: Iterable[Token]):
+        for token in tokens:
+            self.write_token(token)
+            self.count += 1
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.write_footer()
+        self.file.close()
+        log.info(f"writing tokens in {self.filename}")
+
+
+class TemplatizerTokenSink(TokenSink):
+    """Writes tokens as a templatizer json object keyed by token index."""
+
+    def write_header(self):
+        self.file.write("{")
+
+    def write_token(self, token: Token):
+        separator = ", " if self.count else ""
+        value = json.dumps([token.as_templatizer_dict()])
+        self.file.write(f'{separator}"token_{self.count}": {value}')
+
+    def write_footer(self):
+        self.file.write("}")
+
+
+class CsvTokenSink(TokenSink):
+    """Writes tokens as csv rows."""
+
+    def write_header(self):
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(Token.csv_headers())
+
+    def write_token(self, token: Token):
+        self.writer.writerow(token.as_csv_row())
+
+
+class ColumnarTokenSink(TokenSink):
+    """Writes tokens in the binary columnar format, see texttokenizer.columnar.
+
+    Tokens are accumulated in a compact TokenTable and written on close.
+    """
+
+    mode = "wb"
+
+    def write_header(self):
+        self.table = TokenTable()
+
+    def write_token(self, token: Token):
+        self.table.append(token)
+
+    def write_footer(self):
+        write_columnar(self.table, self.file)
+
+
+SINKS: dict[str, tuple[type[TokenSink], str]] = {
+    "templatizer": (TemplatizerTokenSink, ".json"),
+    "csv": (CsvTokenSink, ".csv"),
+    "columnar": (ColumnarTokenSink, ".ttok"),
+}
+
+
+def sink_ext(token_format: str) -> str:
+    """Returns the file extension used for the given token format."""
+    return SINKS[token_format][1]
+
+
+def open_sink(token_format: str, filename: Path) -> TokenSink:
+    """Returns a sink writing tokens in the given format to filename."""
+    sinkCls, _ = SINKS[token_format]
+    return sinkCls(filename)
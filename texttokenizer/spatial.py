@@ -0,0 +1,281 @@
+from collections.abc import Iterable, Sequence
+from pathlib import Path
+
+import numpy as np
+from loguru import logger as log
+
+from .token import Token
+
+# Target average number of tokens per grid cell.
+TOKENS_PER_CELL = 4
+# Tokens whose baselines differ by less than this fraction of the line height
+# are on the same line in reading order.
+LINE_TOLERANCE = 0.5
+
+BBox = tuple[float, float, float, float]
+
+
+class PageIndex:
+    """A uniform grid over the token bboxes of a page.
+
+    Each token is registered in every cell its bbox overlaps, stored as a
+    compressed sparse row (cell -> token) structure, so region queries only
+    test the tokens of the cells they cover. Indices returned are positions in
+    the token sequence the index was built from, the tokens of a page being
+    contiguous from `offset`.
+    """
+
+    def __init__(
+        self,
+        bboxes: np.ndarray,
+        origins: np.ndarray,
+        offset: int = 0,
+        cell_size: float | None = None,
+    ):
+        self.bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        self.origins = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+        self.offset = offset
+        n = len(self.bboxes)
+        if n:
+            x0, y0 = self.bboxes[:, :2].min(axis=0)
+            x1, y1 = self.bboxes[:, 2:].max(axis=0)
+        else:
+            x0 = y0 = x1 = y1 = 0.0
+        self.origin = (float(x0), float(y0))
+        if cell_size is None:
+            area = max((x1 - x0) * (y1 - y0), 1.0)
+            cell_size = float(np.sqrt(area * TOKENS_PER_CELL / max(n, 1)))
+        self.cell_size = max(cell_size, 1e-6)
+        self.cols = int((x1 - x0) // self.cell_size) + 1
+        self.rows = int((y1 - y0) // self.cell_size) + 1
+        self.cell_start, self.cell_items = self._build()
+        self.order = self._reading_order()
+        self.rank = np.argsort(self.order)
+
+    @classmethod
+    def from_tokens(cls, tokens: Sequence[Token], offset: int = 0) -> "PageIndex":
+        return cls(
+            np.array([t.bbox for t in tokens], dtype=np.float64),
+            np.array([t.origin for t in tokens], dtype=np.float64),
+            offset=offset,
+        )
+
+    def __len__(self) -> int:
+        return len(self.bboxes)
+
+    def _cells(self, bboxes: np.ndarray) -> tuple[np.ndarray, ...]:
+        """Returns the clamped col and row ranges covered by the bboxes."""
+        x0, y0 = self.origin
+        c0 = np.floor((bboxes[:, 0] - x0) / self.cell_size).astype(np.int64)
+        r0 = np.floor((bboxes[:, 1] - y0) / self.cell_size).astype(np.int64)
+        c1 = np.floor((bboxes[:, 2] - x0) / self.cell_size).astype(np.int64)
+        r1 = np.floor((bboxes[:, 3] - y0) / self.cell_size).astype(np.int64)
+        return (
+            np.clip(c0, 0, self.cols - 1),
+            np.clip(r0, 0, self.rows - 1),
+            np.clip(c1, 0, self.cols - 1),
+            np.clip(r1, 0, self.rows - 1),
+        )
+
+    def _build(self) -> tuple[np.ndarray, np.ndarray]:
+        c0, r0, c1, r1 = self._cells(self.bboxes)
+        widths = c1 - c0 + 1
+        counts = widths * (r1 - r0 + 1)
+        tokens = np.repeat(np.arange(len(self), dtype=np.int64), counts)
+        # Position of each (token, cell) pair within the cells of its token.
+        k = np.arange(len(tokens)) - np.repeat(np.cumsum(counts) - counts, counts)
+        widths = np.repeat(widths, counts)
+        cols = np.repeat(c0, counts) + k % widths
+        rows = np.repeat(r0, counts) + k // widths
+        cells = rows * self.cols + cols
+        order = np.argsort(cells, kind="stable")
+        cell_start = np.searchsorted(cells[order], np.arange(self.rows * self.cols + 1))
+        return cell_start.astype(np.int64), tokens[order].astype(np.int32)
+
+    def _reading_order(self) -> np.ndarray:
+        """Returns token positions sorted top to bottom by line, then left to right."""
+        if not len(self):
+            return np.zeros(0, dtype=np.int32)
+        heights = self.bboxes[:, 3] - self.bboxes[:, 1]
+        by_baseline = np.lexsort((self.origins[:, 0], self.origins[:, 1]))
+        baselines = self.origins[by_baseline, 1]
+        tolerance = np.median(heights) * LINE_TOLERANCE
+        lines = np.concatenate(([0], np.cumsum(np.diff(baselines) > tolerance)))
+        order = np.lexsort((self.origins[by_baseline, 0], lines))
+        return by_baseline[order].astype(np.int32)
+
+    def _items(self, c0: int, r0: int, c1: int, r1: int) -> np.ndarray:
+        """Returns the distinct tokens registered in the given range of cells."""
+        starts, items = self.cell_start, self.cell_items
+        chunks = [
+            items[starts[r * self.cols + c0] : starts[r * self.cols + c1 + 1]]
+            for r in range(r0, r1 + 1)
+        ]
+        return np.unique(np.concatenate(chunks))
+
+    def _candidates(self, bbox: BBox) -> np.ndarray:
+        if not len(self):
+            return np.zeros(0, dtype=np.int32)
+        return self._items(*(int(v[0]) for v in self._cells(np.array([bbox]))))
+
+    def intersecting(self, bbox: BBox) -> np.ndarray:
+        """Returns the indices of tokens whose bbox intersects bbox."""
+        candidates = self._candidates(bbox)
+        b = self.bboxes[candidates]
+        x0, y0, x1, y1 = bbox
+        hits = (b[:, 0] <= x1) & (b[:, 2] >= x0) & (b[:, 1] <= y1) & (b[:, 3] >= y0)
+        return candidates[hits] + self.offset
+
+    def contained(self, bbox: BBox) -> np.ndarray:
+        """Returns the indices of tokens whose bbox lies within bbox."""
+        candidates = self._candidates(bbox)
+        b = self.bboxes[candidates]
+        x0, y0, x1, y1 = bbox
+        hits = (b[:, 0] >= x0) & (b[:, 2] <= x1) & (b[:, 1] >= y0) & (b[:, 3] <= y1)
+        return candidates[hits] + self.offset
+
+    def distances(self, point: tuple[float, float], tokens: np.ndarray) -> np.ndarray:
+        """Returns the distance from point to each token bbox, 0 inside it."""
+        x, y = point
+        b = self.bboxes[tokens]
+        dx = np.maximum(np.maximum(b[:, 0] - x, x - b[:, 2]), 0)
+        dy = np.maximum(np.maximum(b[:, 1] - y, y - b[:, 3]), 0)
+        return np.hypot(dx, dy)
+
+    def nearest(self, point: tuple[float, float], k: int = 1) -> np.ndarray:
+        """Returns the indices of the k tokens nearest to point, nearest first.
+
+        Searches rings of cells around the point until the k-th nearest token
+        is closer than any token in the cells not searched yet.
+        """
+        k = min(k, len(self))
+        if not k:
+            return np.zeros(0, dtype=np.int64)
+        x0, y0 = self.origin
+        px, py = point
+        col = int(np.clip((px - x0) // self.cell_size, 0, self.cols - 1))
+        row = int(np.clip((py - y0) // self.cell_size, 0, self.rows - 1))
+        radius = 0
+        while True:
+            c0, c1 = max(col - radius, 0), min(col + radius, self.cols - 1)
+            r0, r1 = max(row - radius, 0), min(row + radius, self.rows - 1)
+            candidates = self._items(c0, r0, c1, r1)
+            if len(candidates) >= k:
+                distances = self.distances(point, candidates)
+                best = np.argsort(distances, kind="stable")[:k]
+                # Tokens not found yet are at least as far as the nearest cell
+                # outside the searched cells, edges of the grid excepted.
+                size, last_col, last_row = self.cell_size, self.cols - 1, self.rows - 1
+                edges = [
+                    px - (x0 + c0 * size) if c0 > 0 else np.inf,
+                    x0 + (c1 + 1) * size - px if c1 < last_col else np.inf,
+                    py - (y0 + r0 * size) if r0 > 0 else np.inf,
+                    y0 + (r1 + 1) * size - py if r1 < last_row else np.inf,
+                ]
+                if distances[best[-1]] <= max(min(edges), 0):
+                    return candidates[best] + self.offset
+            radius += 1
+
+    def neighbors(self, i: int) -> tuple[int | None, int | None]:
+        """Returns the tokens before and after token i in reading order."""
+        position = int(self.rank[i - self.offset])
+        before = self.order[position - 1] + self.offset if position > 0 else None
+        after = (
+            self.order[position + 1] + self.offset
+            if position + 1 < len(self.order)
+            else None
+        )
+        return (
+            None if before is None else int(before),
+            None if after is None else int(after),
+        )
+
+    def reading_order(self) -> np.ndarray:
+        """Returns the token indices of the page in reading order."""
+        return self.order + self.offset
+
+
+class SpatialIndex:
+    """Per page spatial indexes over a sequence of tokens in page order.
+
+    Query results are indices into that sequence, e.g. `document.tokens`. The
+    index can be saved next to the token output and loaded without the tokens.
+    """
+
+    def __init__(self, pages: dict[int, PageIndex] | None = None):
+        self.pages = pages or {}
+        self.count = sum(len(p) for p in self.pages.values())
+
+    @classmethod
+    def from_tokens(cls, tokens: Iterable[Token]) -> "SpatialIndex":
+        index = cls()
+        page, page_tokens = None, []
+        for token in tokens:
+            if token.page != page and page_tokens:
+                index.add_page(page, page_tokens)
+                page_tokens = []
+            page = token.page
+            page_tokens.append(token)
+        if page_tokens:
+            index.add_page(page, page_tokens)
+        return index
+
+    def add_page(self, page: int, tokens: Sequence[Token]):
+        """Indexes the tokens of a page, which follow the tokens already added."""
+        self.pages[page] = PageIndex.from_tokens(tokens, offset=self.count)
+        self.count += len(tokens)
+
+    def page(self, page: int) -> PageIndex:
+        return self.pages.get(page) or PageIndex(np.zeros((0, 4)), np.zeros((0, 2)))
+
+    def intersecting(self, page: int, bbox: BBox) -> np.ndarray:
+        return self.page(page).intersecting(bbox)
+
+    def contained(self, page: int, bbox: BBox) -> np.ndarray:
+        return self.page(page).contained(bbox)
+
+    def nearest(self, page: int, point: tuple[float, float], k: int = 1) -> np.ndarray:
+        return self.page(page).nearest(point, k)
+
+    def neighbors(self, page: int, i: int) -> tuple[int | None, int | None]:
+        return self.page(page).neighbors(i)
+
+    def reading_order(self, page: int) -> np.ndarray:
+        return self.page(page).reading_order()
+
+    def save(self, filename: Path):
+        """Saves the bboxes, origins and grid of each page as a numpy .npz file."""
+        arrays = {}
+        for page, index in self.pages.items():
+            arrays[f"{page}.bboxes"] = index.bboxes
+            arrays[f"{page}.origins"] = index.origins
+            arrays[f"{page}.grid"] = np.array(
+                [index.offset, index.cell_size, *index.origin, index.cols, index.rows]
+            )
+            arrays[f"{page}.cell_start"] = index.cell_start
+            arrays[f"{page}.cell_items"] = index.cell_items
+            arrays[f"{page}.order"] = index.order
+        with open(filename, "wb") as f:
+            np.savez(f, **arrays)
+        log.info(f"writing spatial index {filename}")
+
+    @classmethod
+    def load(cls, filename: Path) -> "SpatialIndex":
+        """Loads a saved index, without rebuilding the grids."""
+        pages = {}
+        with np.load(filename) as data:
+            for page in sorted({int(key.split(".")[0]) for key in data.files}):
+                offset, cell_size, x0, y0, cols, rows = data[f"{page}.grid"]
+                index = PageIndex.__new__(PageIndex)
+                index.bboxes = data[f"{page}.bboxes"]
+                index.origins = data[f"{page}.origins"]
+                index.offset = int(offset)
+                index.cell_size = float(cell_size)
+                index.origin = (float(x0), float(y0))
+                index.cols, index.rows = int(cols), int(rows)
+                index.cell_start = data[f"{page}.cell_start"]
+                index.cell_items = data[f"{page}.cell_items"]
+                index.order = data[f"{page}.order"]
+                index.rank = np.argsort(index.order)
+                pages[page] = index
+        return cls(pages)
@@ -0,0 +1,147 @@
+import random
+from dataclasses import dataclass
+from pathlib import Path
+
+import fitz
+
+from .token import Token
+
+# Base 14 fonts available to fitz without embedding, with their reported names.
+FONTS = {
+    "helv": "Helvetica",
+    "hebo": "Helvetica-Bold",
+    "tiro": "Times-Roman",
+    "tibo": "Times-Bold",
+    "cour": "Courier",
+}
+
+WORDS = (
+    "invoice total amount due date account number customer address payment "
+    "balance tax subtotal quantity description unit price order reference "
+    "shipping billing period statement summary page item code discount"
+).split()
+
+MARGIN = 36
+IMAGE_SIZE = (300, 400)
+
+
+@dataclass(kw_only=True)
+class CorpusSpec:
+    """Describes the synthetic documents to generate."""
+
+    pages: int = 10
+    spans_per_page: int = 50
+    fonts: tuple[str, ...] = ("helv", "tiro", "cour")
+    font_size: float = 10.0
+    rotated_ratio: float = 0.0
+    image_pages_ratio: float = 0.0
+    seed: int = 0
+
+
+def span_bbox(
+    font: fitz.Font, text: str, size: float, origin: tuple[float, float], rotated: bool
+) -> tuple[float, float, float, float]:
+    """Returns the bbox fitz reports for text inserted at origin."""
+    x, y = origin
+    length = font.text_length(text, fontsize=size)
+    top, bottom = font.ascender * size, font.descender * size
+    if rotated:
+        return (x - top, y - length, x - bottom, y)
+    return (x, y - top, x + length, y - bottom)
+
+
+def random_text(rng: random.Random, font: fitz.Font, size: float, width: float):
+    words = rng.sample(WORDS, rng.randint(1, 3))
+    while len(words) > 1 and font.text_length(" ".join(words), fontsize=size) > width:
+        words.pop()
+    return " ".join(words)
+
+
+def add_text_page(
+    doc: fitz.Document, idx: int, spec: CorpusSpec, rng: random.Random
+) -> list[Token]:
+    page = doc.new_page()
+    size = spec.font_size
+    line_height = size * 1.6
+    rows = int((page.rect.height - 2 * MARGIN) // line_height)
+    rotated = round(spec.spans_per_page * spec.rotated_ratio)
+    spans = spec.spans_per_page - rotated
+    cols = max(1, -(-spans // rows))
+    col_width = (page.rect.width - 2 * MARGIN) / cols
+
+    tokens = []
+    for i in range(spans):
+        fontname = rng.choice(spec.fonts)
+        font = fitz.Font(fontname)
+        text = random_text(rng, font, size, col_width - size)
+        row, col = divmod(i, cols)
+        origin = (MARGIN + col * col_width, MARGIN + (row + 1) * line_height)
+        page.insert_text(origin, text, fontname=fontname, fontsize=size)
+        bbox = span_bbox(font, text, size, origin, rotated=False)
+        tokens.append((fontname, text, origin, bbox))
+
+    # Rotated spans are stacked bottom up in the left margin.
+    y = page.rect.height - MARGIN
+    for _ in range(rotated):
+        fontname = rng.choice(spec.fonts)
+        font = fitz.Font(fontname)
+        text = random_text(rng, font, size, y - MARGIN)
+        length = font.text_length(text, fontsize=size)
+        if y - length < MARGIN:
+            break
+        origin = (MARGIN * 2 / 3, y)
+        page.insert_text(origin, text, fontname=fontname, fontsize=size, rotate=90)
+        tokens.append(
+            (fontname, text, origin, span_bbox(font, text, size, origin, True))
+        )
+        y -= length + size
+
+    return [
+        Token(
+            page=idx,
+            text=text,
+            font=(FONTS[fontname], size),
+            origin=origin,
+            bbox=bbox,
+        )
+        for fontname, text, origin, bbox in tokens
+    ]
+
+
+def add_image_page(doc: fitz.Document, rng: random.Random):
+    """Adds a page with a single full page noise image, like a scan."""
+    page = doc.new_page()
+    width, height = IMAGE_SIZE
+    samples = rng.randbytes(width * height)
+    pix = fitz.Pixmap(fitz.csGRAY, width, height, samples, False)
+    page.insert_image(page.rect, pixmap=pix)
+
+
+def generate_pdf(filename: Path, spec: CorpusSpec) -> list[Token]:
+    """Generates a synthetic pdf and returns the ground truth tokens of its spans.
+
+    Image only pages have no ground truth tokens since they need OCR.
+    """
+    rng = random.Random(spec.seed)
+    image_pages = set(
+        rng.sample(range(spec.pages), round(spec.pages * spec.image_pages_ratio))
+    )
+    tokens = []
+    with fitz.open() as doc:
+        for idx in range(spec.pages):
+            if idx in image_pages:
+                add_image_page(doc, rng)
+            else:
+                tokens.extend(add_text_page(doc, idx, spec, rng))
+        doc.save(filename)
+    return tokens
+
+
+def generate_corpus(directory: Path, specs: dict[str, CorpusSpec]) -> dict:
+    """Generates a pdf per named spec, returns filenames and ground truth by name."""
+    directory.mkdir(parents=True, exist_ok=True)
+    corpus = {}
+    for name, spec in specs.items():
+        filename = directory.joinpath(f"{name}.pdf")
+        corpus[name] = (filename, generate_pdf(filename, spec))
+    return corpus
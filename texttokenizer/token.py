@@ -1,3 +1,6 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterable, Iterator
 from dataclasses import dataclass
 from typing import TypeAlias
 
@@ -5,7 +8,7 @@ Font: TypeAlias = tuple[str, float]
 TokenKey: TypeAlias = tuple[int, tuple[float, float], str]
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class Token:
     page: int
     text: str
@@ -24,7 +27,7 @@ class Token:
         return (self.page, self.origin, self.text)
 
     def as_csv_row(self) -> tuple:
-        return ({self.page}, {self.text}, {self.font}, {self.origin}, {self.bbox})
+        return (self.page, self.text, self.font, self.origin, self.bbox)
 
     def as_templatizer_dict(self):
         return {
@@ -32,3 +35,114 @@ class Token:
             "origin": self.origin,
             "text": self.text,
         }
+
+
+class TokenTable:
+    """A columnar, compact store of tokens.
+
+    Page, bbox, origin and font size are stored in typed arrays while font names
+    and texts are interned, so each token costs a few dozen bytes instead of a
+    Token object with its nested tuples. Tokens are expected to be appended in
+    page order (as produced by the processor) so pages can be sliced without
+    copying the columns.
+    """
+
+    __slots__ = (
+        "pages",
+        "bboxes",
+        "origins",
+        "font_sizes",
+        "font_ids",
+        "text_ids",
+        "fonts",
+        "texts",
+        "_font_index",
+        "_text_index",
+    )
+
+    def __init__(self):
+        self.pages = array("i")
+        self.bboxes = array("d")
+        self.origins = array("d")
+        self.font_sizes = array("d")
+        self.font_ids = array("I")
+        self.text_ids = array("I")
+        self.fonts: list[str] = []
+        self.texts: list[str] = []
+        self._font_index: dict[str, int] = {}
+        self._text_index: dict[str, int] = {}
+
+    @classmethod
+    def from_tokens(cls, tokens: Iterable[Token]) -> "TokenTable":
+        table = cls()
+        table.extend(tokens)
+        return table
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def __getitem__(self, i: int) -> Token:
+        if i < 0:
+            i += len(self)
+        b, o = i * 4, i * 2
+        return Token(
+            page=self.pages[i],
+            text=self.texts[self.text_ids[i]],
+            font=(self.fonts[self.font_ids[i]], self.font_sizes[i]),
+            origin=tuple(self.origins[o : o + 2]),
+            bbox=tuple(self.bboxes[b : b + 4]),
+        )
+
+    def __iter__(self) -> Iterator[Token]:
+        return (self[i] for i in range(len(self)))
+
+    def _intern(self, value: str, values: list[str], index: dict[str, int]) -> int:
+        if value not in index:
+            index[value] = len(values)
+            values.append(value)
+        return index[value]
+
+    def append(self, token: Token):
+        if len(self) and token.page < self.pages[-1]:
+            raise ValueError(f"token on page {token.page} appended out of order")
+        name, size = token.font
+        self.pages.append(token.page)
+        self.bboxes.extend(token.bbox)
+        self.origins.extend(token.origin)
+        self.font_sizes.append(size)
+        self.font_ids.append(self._intern(name, self.fonts, self._font_index))
+        self.text_ids.append(self._intern(token.text, self.texts, self._text_index))
+
+    def extend(self, tokens: Iterable[Token]):
+        for token in tokens:
+            self.append(token)
+
+    def to_tokens(self) -> list[Token]:
+        return list(self)
+
+    def page_range(self, page: int) -> tuple[int, int]:
+        """Returns the [start, end) token index range of the given page."""
+        return (bisect_left(self.pages, page), bisect_right(self.pages, page))
+
+    def page(self, page: int) -> "TokenTable":
+        """Returns the tokens of the given page as a view sharing the columns."""
+        start, end = self.page_range(page)
+        return self.slice(start, end)
+
+    def slice(self, start: int, end: int) -> "TokenTable":
+        """Returns a read only view of tokens [start, end) without copying columns.
+
+        The table can not grow while views of it are alive.
+        """
+        view = TokenTable.__new__(TokenTable)
+        view.pages = memoryview(self.pages)[start:end]
+        view.bboxes = memoryview(self.bboxes)[start * 4 : end * 4]
+        view.origins = memoryview(self.origins)[start * 2 : end * 2]
+        view.font_sizes = memoryview(self.font_sizes)[start:end]
+        view.font_ids = memoryview(self.font_ids)[start:end]
+        view.text_ids = memoryview(self.text_ids)[start:end]
+        view.fonts = self.fonts
+        view.texts = self.texts
+        view._font_index = self._font_index
+        view._text_index = self._text_index
+        return view
@@ -1,9 +1,14 @@
 from pathlib import Path
+from typing import TypeAlias
 
 import fitz
 
 from .token import Token
 
+# A pdf held in memory, and a pdf given either as a file or in memory.
+PdfBuffer: TypeAlias = bytes | bytearray | memoryview
+PdfSource: TypeAlias = Path | PdfBuffer
+
 fontname_map = {
     "Arial-BoldMT": "Arial-BoldMT-16",
     "ITCFranklinGothicStd-Demi": "ITCFranklinGothicStd-Dem-4",
@@ -29,6 +34,26 @@ def guess_font(font, font_data: dict) -> tuple[str, fitz.Font]:
     return (name, extn, font_obj)
 
 
+def as_bytes(buffer: PdfBuffer) -> bytes:
+    """Returns the buffer as bytes, without a copy when it is or wraps bytes."""
+    if isinstance(buffer, bytes):
+        return buffer
+    if (
+        isinstance(buffer, memoryview)
+        and isinstance(buffer.obj, bytes)
+        and buffer.nbytes == len(buffer.obj)
+    ):
+        return buffer.obj
+    return bytes(buffer)
+
+
+def open_pdf(source: PdfSource) -> fitz.Document:
+    """Opens a pdf file, which fitz reads on demand, or an in memory pdf."""
+    if isinstance(source, Path):
+        return fitz.open(source)
+    return fitz.open(stream=as_bytes(source), filetype="pdf")
+
+
 def suffix_path(src: Path, suffix: str, ext=".pdf") -> Path:
     """Returns a new path with a suffix appended, from the original given path."""
     dest_name = src.with_suffix("").name + f"-{suffix}{ext}"
@@ -48,11 +73,25 @@ def expand_page_list(pages: str, maxIdx: int, minIdx=0) -> list[int]:
             expanded.update(group)
         else:
             expanded.add(int(item))
-    return list(expanded)
+    return sorted(expanded)
+
+
+def page_shards(page_indices: list[int], count: int) -> list[list[int]]:
+    """Splits page indices into at most count contiguous, evenly sized shards."""
+    count = max(1, min(count, len(page_indices)))
+    size, extra = divmod(len(page_indices), count)
+    shards, start = [], 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        shards.append(page_indices[start:end])
+        start = end
+    return [shard for shard in shards if shard]
 
 
 def merge_bboxes(tokens: list[Token]) -> list[Token]:
     """Merge tokens using heuristics on token bounding boxes."""
+    if not tokens:
+        return []
     sorted_tokens = sorted(
         tokens, key=lambda token: (token.page, token.bbox[1], token.bbox[0])
     )